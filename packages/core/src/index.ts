@@ -67,7 +67,9 @@ export {
 } from './language/annotations/annotations'
 // TODO: Move these to language-python
 export {
+  CallGraph,
   CapturePayload,
+  ElidedIterationsData,
   ElseIfStatementData,
   ElseStatementData,
   ForLoopData,
@@ -76,9 +78,11 @@ export {
   FunctionDeclarationData,
   IfStatementData,
   ImportStatementData,
+  MemoryProfile,
   PythonFileData,
   SingleStatementData,
   StatementCapture,
+  StatementProfile,
   WhileLoopData,
   WhileLoopIteration,
 } from './language/capture/runtime_capture'
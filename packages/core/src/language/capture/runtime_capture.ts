@@ -1,6 +1,8 @@
 export interface SideEffect {
   type: string
   value: string
+  // Characters of output over the statement or run budget that were not kept.
+  elided?: number
 }
 
 export interface WhileLoopData {
@@ -21,6 +23,10 @@ export interface ForLoopIteration {
   block?: StatementCapture[]
 }
 
+export interface ElidedIterationsData {
+  count: number
+}
+
 export interface IfStatementData {
   condition: StatementCapture[]
   trueblock?: StatementCapture[]
@@ -46,7 +52,10 @@ export interface PythonFileData {
 
 export interface FunctionDeclarationData {
   count: number
+  // Only some of the calls are kept, each has its frameno.
   calls: StatementCapture[]
+  // Number of calls by recursion depth.
+  depths?: number[]
   exception: {
     frameno: number
     lineno: number
@@ -55,13 +64,48 @@ export interface FunctionDeclarationData {
   }
 }
 
+// The time (in nanoseconds) taken by each statement of a profiled run, not
+// counting the statements of the functions it calls, the slowest first.
+export interface StatementProfile {
+  time: number
+  statements: { lineno: number; type: string; hits: number; time: number }[]
+}
+
+// The memory (in bytes) allocated and not freed (size), and the most allocated
+// at once (peak), by each top level statement and function of a memory
+// profiled run, and the lines that allocated the most of what's still in use.
+export interface MemoryProfile {
+  size: number
+  peak: number
+  statements: { lineno: number; type: string; size: number; peak: number }[]
+  functions: { [funcId: string]: { calls: number; size: number; peak: number } }
+  lines: { lineno: number; type: string; size: number; count: number }[]
+}
+
+// The calls, and the time (in nanoseconds) taken by the module and each
+// function of a call profiled run. Edges are [caller, callee, calls, time],
+// by the index of the functions in the list.
+export interface CallGraph {
+  functions: {
+    id: string
+    name: string
+    lineno: number
+    calls: number
+    selfTime: number
+    totalTime: number
+  }[]
+  edges: [number, number, number, number][]
+}
+
 export interface FunctionCallData {
   body: StatementCapture[]
+  frameno: number
 }
 
 export interface SingleStatementData {
   result: string
   resultType: string
+  resultLength?: number
 }
 
 export interface StatementCapture {
@@ -70,6 +114,7 @@ export interface StatementCapture {
     | PythonFileData
     | WhileLoopData
     | WhileLoopIteration
+    | ElidedIterationsData
     | IfStatementData
     | SingleStatementData
     | ElseStatementData
@@ -84,7 +129,8 @@ export interface StatementCapture {
 
 export interface CapturePayload {
   root: StatementCapture
-  detached: { [key: string]: { count: number; frames: StatementCapture[] } }
+  detached: { [key: string]: { count: number; frames: StatementCapture[]; depths?: number[] } }
+  truncated?: boolean
   lastException?: {
     func_id: string
     frameno: number
@@ -92,4 +138,12 @@ export interface CapturePayload {
     message: string
     type: string
   }
+  budgetExceeded?: {
+    limit: 'steps' | 'time'
+    steps: number
+    seconds: number
+  }
+  profile?: StatementProfile
+  memory?: MemoryProfile
+  callgraph?: CallGraph
 }
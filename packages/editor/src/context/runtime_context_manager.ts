@@ -202,6 +202,7 @@ export class RuntimeContextManager implements ParseTreeCommunicator {
               data: {
                 count: capture.detached[funcID].count,
                 calls: capture.detached[funcID].frames,
+                depths: capture.detached[funcID].depths,
               } as FunctionDeclarationData,
             }
             if (capture.lastException?.func_id === funcID) {
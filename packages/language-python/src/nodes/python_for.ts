@@ -2,6 +2,7 @@ import { ExpressionNode, ForNode, ParseNodeType, SuiteNode } from 'structured-py
 
 import {
   ChildSetType,
+  ElidedIterationsData,
   ForLoopData,
   ForLoopIteration,
   HighlightColorCategory,
@@ -214,6 +215,13 @@ export class PythonForLoop extends PythonNode {
           errorMessage: frame.exceptionMessage,
         },
       })
+    } else if (frame.type === 'ELIDED_ITERATIONS') {
+      const frameData = frame.data as ElidedIterationsData
+      annotation.push({
+        type: NodeAnnotationType.SideEffect,
+        value: { message: `${frameData.count} iterations not recorded` },
+      })
+      this.getBlock().recursivelyApplyRuntimeCapture([])
     } else {
       const frameData = frame.data as ForLoopIteration
       const iterable = frameData.iterable[0]
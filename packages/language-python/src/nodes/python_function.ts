@@ -270,9 +270,10 @@ export class PythonFunctionDeclaration extends PythonNode {
       return
     }
     this.runtimeCaptureFrame = index
+    const frames = this.runtimeCapture.calls
     index = Math.min(this.runtimeCapture.count - 1, index)
-    if (index == -1) {
-      index = this.runtimeCapture.calls.length - 1
+    if (index == -1 && frames.length !== 0) {
+      index = (frames[frames.length - 1].data as FunctionCallData).frameno
     }
     const annotation: NodeAnnotation[] = []
 
@@ -287,12 +288,11 @@ export class PythonFunctionDeclaration extends PythonNode {
     }
     this.fireMutation(mutation)
 
-    const frames = this.runtimeCapture.calls
-    if (index >= frames.length) {
+    // Calls that weren't kept have no frame.
+    const frame = frames.find((call) => (call.data as FunctionCallData).frameno === index)
+    if (!frame) {
       this.getBody().recursivelyClearRuntimeCapture()
     } else {
-      const frame = frames[index]
-
       if (frame.type === 'EXCEPTION') {
         annotation.push({
           type: NodeAnnotationType.RuntimeError,
@@ -16,7 +16,9 @@ import {
   registerNodeCateogry,
   registerType,
 } from '@splootcode/core'
+import { PYTHON_COMMENT } from './python_comment'
 import { PYTHON_EXPRESSION, PythonExpression } from './python_expression'
+import { PYTHON_FUNCTION_DECLARATION } from './python_function'
 import { ParseMapper } from '../analyzer/python_analyzer'
 import { ParseNodeType, StatementListNode, StatementNode } from 'structured-pyright'
 import { PythonElifBlock } from './python_elif'
@@ -115,6 +117,12 @@ export class PythonStatement extends PythonNode {
   recursivelyApplyRuntimeCapture(capture: StatementCapture): boolean {
     if (this.getStatement().getCount() !== 0) {
       const child = this.getStatement().getChild(0)
+      if (capture.type === 'UNTRACED') {
+        // Placeholder for a statement that ran outside the trace scope.
+        // Comments and function declarations never get an entry.
+        child.recursivelyClearRuntimeCapture()
+        return child.type !== PYTHON_COMMENT && child.type !== PYTHON_FUNCTION_DECLARATION
+      }
       return child.recursivelyApplyRuntimeCapture(capture)
     }
     return false
@@ -2,6 +2,7 @@ import { ParseNodeType, WhileNode } from 'structured-pyright'
 
 import {
   ChildSetType,
+  ElidedIterationsData,
   HighlightColorCategory,
   LayoutComponent,
   LayoutComponentType,
@@ -148,6 +149,13 @@ export class PythonWhileLoop extends PythonNode {
           errorMessage: frame.exceptionMessage,
         },
       })
+    } else if (frame.type === 'ELIDED_ITERATIONS') {
+      const frameData = frame.data as ElidedIterationsData
+      annotation.push({
+        type: NodeAnnotationType.SideEffect,
+        value: { message: `${frameData.count} iterations not recorded` },
+      })
+      this.getBlock().recursivelyApplyRuntimeCapture([])
     } else {
       const frameData = frame.data as WhileLoopIteration
       const condition = frameData.condition[0]
@@ -0,0 +1,123 @@
+// Decodes capture reports written by python/capture_encoding.py.
+const MAGIC = 'SPC1'
+
+const TAG_NONE = 0
+const TAG_FALSE = 1
+const TAG_TRUE = 2
+const TAG_INT = 3
+const TAG_FLOAT = 4
+const TAG_STRING = 5
+const TAG_NEW_STRING = 6
+const TAG_LONG_STRING = 7
+const TAG_LIST = 8
+const TAG_OBJECT = 9
+const TAG_NEW_SHAPE = 10
+
+const textDecoder = new TextDecoder()
+
+class CaptureDecoder {
+  private data: Uint8Array
+  private view: DataView
+  private pos: number
+  private strings: string[] = []
+  private shapes: string[][] = []
+
+  constructor(data: Uint8Array) {
+    this.data = data
+    this.view = new DataView(data.buffer, data.byteOffset, data.byteLength)
+    if (textDecoder.decode(data.subarray(0, MAGIC.length)) !== MAGIC) {
+      throw new Error('Not an encoded capture')
+    }
+    this.pos = MAGIC.length
+  }
+
+  readVarint(): number {
+    let n = 0
+    let scale = 1
+    while (true) {
+      const byte = this.data[this.pos++]
+      n += (byte & 0x7f) * scale
+      if (byte < 0x80) {
+        return n
+      }
+      scale *= 128
+    }
+  }
+
+  readString(): string {
+    const length = this.readVarint()
+    const s = textDecoder.decode(this.data.subarray(this.pos, this.pos + length))
+    this.pos += length
+    return s
+  }
+
+  readValue(): any {
+    const tag = this.data[this.pos++]
+    switch (tag) {
+      case TAG_STRING:
+        return this.strings[this.readVarint()]
+      case TAG_NEW_STRING: {
+        const s = this.readString()
+        this.strings.push(s)
+        return s
+      }
+      case TAG_LONG_STRING:
+        return this.readString()
+      case TAG_NEW_SHAPE:
+      case TAG_OBJECT: {
+        let keys: string[]
+        if (tag === TAG_NEW_SHAPE) {
+          const count = this.readVarint()
+          keys = []
+          for (let i = 0; i < count; i++) {
+            keys.push(this.readValue())
+          }
+          this.shapes.push(keys)
+        } else {
+          keys = this.shapes[this.readVarint()]
+        }
+        const obj = {}
+        for (const key of keys) {
+          obj[key] = this.readValue()
+        }
+        return obj
+      }
+      case TAG_LIST: {
+        const count = this.readVarint()
+        const list = new Array(count)
+        for (let i = 0; i < count; i++) {
+          list[i] = this.readValue()
+        }
+        return list
+      }
+      case TAG_NONE:
+        return null
+      case TAG_FALSE:
+        return false
+      case TAG_TRUE:
+        return true
+      case TAG_INT: {
+        const n = this.readVarint()
+        return n % 2 === 0 ? n / 2 : -(n + 1) / 2
+      }
+      case TAG_FLOAT: {
+        const value = this.view.getFloat64(this.pos, true)
+        this.pos += 8
+        return value
+      }
+    }
+    throw new Error(`Unknown tag ${tag} at ${this.pos - 1}`)
+  }
+}
+
+export const decodeCapture = (data: Uint8Array): any => {
+  return new CaptureDecoder(data).readValue()
+}
+
+// Reports are JSON, apart from those of big captures, see encodeReport in python/capture_encoding.py.
+export const decodeReport = (report: string | Uint8Array): any => {
+  if (typeof report === 'string') {
+    return JSON.parse(report)
+  }
+  return decodeCapture(report)
+}
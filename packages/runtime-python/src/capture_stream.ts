@@ -0,0 +1,174 @@
+import { CapturePayload, FunctionCallData, StatementCapture } from '@splootcode/core'
+
+// [frame id, childset, entries] or, for loops, [frame id, childset, entries, sample size, elided count]
+type CaptureAppend = [number, string, StatementCapture[], number?, number?]
+
+type CapturePath = (string | number | null)[]
+
+// Changes to the previous run's capture: ['set', path, value], ['del', path],
+// ['extend', path, values], ['trim', path, length] or ['id', path, frame id].
+type CaptureDiffOp = [string, CapturePath, any?]
+
+// The calls of a function kept since the previous report, and the frame
+// numbers of previously reported calls that are no longer kept.
+interface DetachedReport {
+  count: number
+  frames: StatementCapture[]
+  depths?: number[]
+  evicted?: number[]
+}
+
+interface CaptureReport extends Partial<Omit<CapturePayload, 'detached'>> {
+  detached?: { [key: string]: DetachedReport }
+  delta?: boolean
+  appends?: CaptureAppend[]
+  diff?: boolean
+  ops?: CaptureDiffOp[]
+}
+
+interface ReportedFrame extends StatementCapture {
+  id?: number
+}
+
+// The executor reports the whole capture (or a diff against the previous
+// run's capture) once per run, then only what was added since the previous
+// report. This rebuilds the full capture from those.
+export class CaptureStream {
+  private capture: CapturePayload = null
+  private frames: Map<number, ReportedFrame> = new Map()
+
+  apply(report: CaptureReport): CapturePayload {
+    if (report.diff) {
+      this.applyDiff(report.ops)
+      return this.capture
+    }
+    if (!report.delta) {
+      this.capture = { root: report.root, detached: report.detached }
+      if (report.lastException) {
+        this.capture.lastException = report.lastException
+      }
+      if (report.truncated) {
+        this.capture.truncated = true
+      }
+      if (report.budgetExceeded) {
+        this.capture.budgetExceeded = report.budgetExceeded
+      }
+      if (report.profile) {
+        this.capture.profile = report.profile
+      }
+      if (report.memory) {
+        this.capture.memory = report.memory
+      }
+      if (report.callgraph) {
+        this.capture.callgraph = report.callgraph
+      }
+      this.frames = new Map()
+      this.indexFrames(report)
+      return this.capture
+    }
+
+    this.indexFrames(report.appends)
+    for (const [frameId, childset, entries, sampleSize, elided] of report.appends) {
+      const data = this.frames.get(frameId).data as { [childset: string]: StatementCapture[] }
+      if (!data[childset]) {
+        data[childset] = []
+      }
+      const target = data[childset]
+      if (sampleSize === undefined) {
+        target.push(...entries)
+        continue
+      }
+      if (target.length > sampleSize && target[sampleSize].type === 'ELIDED_ITERATIONS') {
+        target.splice(sampleSize, 1)
+      }
+      target.push(...entries)
+      if (elided) {
+        target.splice(sampleSize, target.length - 2 * sampleSize, {
+          type: 'ELIDED_ITERATIONS',
+          data: { count: elided },
+        })
+      }
+    }
+
+    this.indexFrames(report.detached)
+    for (const [funcId, detached] of Object.entries(report.detached)) {
+      const current = this.capture.detached[funcId]
+      if (current) {
+        current.count = detached.count
+        current.depths = detached.depths
+        if (detached.evicted) {
+          const evicted = new Set(detached.evicted)
+          current.frames = current.frames.filter((frame) => !evicted.has((frame.data as FunctionCallData).frameno))
+        }
+        current.frames.push(...detached.frames)
+      } else {
+        this.capture.detached[funcId] = { count: detached.count, frames: detached.frames, depths: detached.depths }
+      }
+    }
+    if (report.lastException) {
+      this.capture.lastException = report.lastException
+    }
+    if (report.truncated) {
+      this.capture.truncated = true
+    }
+    if (report.budgetExceeded) {
+      this.capture.budgetExceeded = report.budgetExceeded
+    }
+    if (report.profile) {
+      this.capture.profile = report.profile
+    }
+    if (report.memory) {
+      this.capture.memory = report.memory
+    }
+    if (report.callgraph) {
+      this.capture.callgraph = report.callgraph
+    }
+    return this.capture
+  }
+
+  private applyDiff(ops: CaptureDiffOp[]) {
+    // Frame ids are only valid within one run, the ones left in unchanged parts are stale.
+    this.frames = new Map()
+    const resolve = (path: CapturePath) => {
+      let value = this.capture as any
+      for (const key of path) {
+        value = value[key === null ? 'null' : key]
+      }
+      return value
+    }
+    for (const [op, path, value] of ops) {
+      if (op === 'extend') {
+        resolve(path).push(...value)
+        this.indexFrames(value)
+      } else if (op === 'trim') {
+        resolve(path).length = value
+      } else if (op === 'id') {
+        this.frames.set(value, resolve(path))
+      } else {
+        const parent = resolve(path.slice(0, -1))
+        const key = path[path.length - 1] === null ? 'null' : path[path.length - 1]
+        if (op === 'set') {
+          parent[key] = value
+          this.indexFrames(value)
+        } else {
+          delete parent[key]
+        }
+      }
+    }
+  }
+
+  private indexFrames(value: any) {
+    if (Array.isArray(value)) {
+      for (const item of value) {
+        this.indexFrames(item)
+      }
+    } else if (value && typeof value === 'object') {
+      if (typeof value.id === 'number') {
+        this.frames.set(value.id, value)
+      }
+      for (const item of Object.values(value)) {
+        this.indexFrames(item)
+      }
+    }
+  }
+}
@@ -114,6 +114,17 @@ export type WorkerMessage =
   | WorkerWebResponseMessage
   | WorkerTextConvertResultMessage
 
+// Limits tracing to the top level statements containing these functions
+// (by function id) or statements (by line number). The rest runs untraced.
+export interface TraceScope {
+  functions?: string[]
+  lines?: number[]
+}
+
+// Measures the time or the memory taken by each statement, or the calls
+// between functions, instead of capturing results.
+export type ProfileType = 'TIME' | 'MEMORY' | 'CALLS'
+
 export interface WorkerRunMessage {
   type: 'run'
   runType: RunType
@@ -123,6 +134,8 @@ export interface WorkerRunMessage {
   stdinBuffer: Int32Array
   fetchBuffer: Uint8Array
   fetchBufferMeta: Int32Array
+  traceScope?: TraceScope
+  profile?: ProfileType
 }
 
 export interface WorkerRerunMessage {
@@ -134,6 +147,7 @@ export interface WorkerRerunMessage {
   readlines: string[]
   requestPlayback: Map<string, ResponseData[]>
   dependencies: Dependency[]
+  traceScope?: TraceScope
 }
 
 export interface LoadModuleMessage {
@@ -1,6 +1,14 @@
 import { Dependency, HTTPRequestAWSEvent, RunType } from '@splootcode/core'
 import { EditorMessage } from '../message_types'
-import { FetchHandler, FileSpec, ResponseData, WorkerManagerMessage, WorkerMessage } from './common'
+import {
+  FetchHandler,
+  FileSpec,
+  ProfileType,
+  ResponseData,
+  TraceScope,
+  WorkerManagerMessage,
+  WorkerMessage,
+} from './common'
 
 const INPUT_BUF_SIZE = 100
 
@@ -75,7 +83,9 @@ export class WorkerManager {
     runType: RunType,
     eventData: HTTPRequestAWSEvent,
     workspace: Map<string, FileSpec>,
-    envVars: Map<string, string>
+    envVars: Map<string, string>,
+    traceScope?: TraceScope,
+    profile?: ProfileType
   ) {
     this.inputPlayback = []
     this.requestPlayback = new Map()
@@ -95,6 +105,8 @@ export class WorkerManager {
       stdinBuffer: this.stdinbuffer,
       fetchBuffer: this.fetchBuffer,
       fetchBufferMeta: this.fetchBufferMeta,
+      traceScope: traceScope,
+      profile: profile,
     })
   }
 
@@ -103,7 +115,8 @@ export class WorkerManager {
     eventData: HTTPRequestAWSEvent,
     workspace: Map<string, FileSpec>,
     envVars: Map<string, string>,
-    dependencies: Dependency[]
+    dependencies: Dependency[],
+    traceScope?: TraceScope
   ) {
     this._workerState = WorkerState.RUNNING
     this.stateCallBack(this._workerState)
@@ -116,6 +129,7 @@ export class WorkerManager {
       readlines: this.inputPlayback,
       requestPlayback: this.requestPlayback,
       dependencies: dependencies,
+      traceScope: traceScope,
     })
   }
 
@@ -1,8 +1,14 @@
 export interface StaticURLs {
+  allocationProfilerURL: string
+  callProfilerURL: string
+  captureEncodingURL: string
   executorURL: string
+  expressionBuilderURL: string
   moduleLoaderURL: string
   requestsPackageURL: string
+  statementProfilerURL: string
   textGeneratorURL: string
+  valuePreviewURL: string
   streamlitPackageURL: string
   pyarrowPackageURL: string
 }
@@ -0,0 +1,28 @@
+import { decodeBase64, loadRecordedReports } from './recorded_reports'
+import { decodeCapture, decodeReport } from '../capture_encoding'
+import { describe, expect, test } from '@jest/globals'
+
+describe('capture decoding', () => {
+  test('decodes every kind of value encoded by the executor', () => {
+    const { value } = loadRecordedReports()
+    expect(decodeCapture(decodeBase64(value.encoded))).toEqual(value.decoded)
+  })
+
+  test('decodes from a view into a larger buffer', () => {
+    const { value } = loadRecordedReports()
+    const encoded = decodeBase64(value.encoded)
+    const buffer = new Uint8Array(encoded.length + 8)
+    buffer.set(encoded, 4)
+    expect(decodeCapture(buffer.subarray(4, 4 + encoded.length))).toEqual(value.decoded)
+  })
+
+  test('decodes JSON and binary reports', () => {
+    const { value } = loadRecordedReports()
+    expect(decodeReport(JSON.stringify(value.decoded))).toEqual(value.decoded)
+    expect(decodeReport(decodeBase64(value.encoded))).toEqual(value.decoded)
+  })
+
+  test('rejects data that is not an encoded capture', () => {
+    expect(() => decodeCapture(new TextEncoder().encode('{"root": null}'))).toThrow('Not an encoded capture')
+  })
+})
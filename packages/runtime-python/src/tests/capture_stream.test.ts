@@ -0,0 +1,38 @@
+import { CaptureStream } from '../capture_stream'
+import { loadRecordedReports, recordedReport } from './recorded_reports'
+import { decodeReport } from '../capture_encoding'
+import { describe, expect, test } from '@jest/globals'
+
+// Frames are given ids while they're running, which the executor's capture doesn't have.
+function stripIds(value: any): any {
+  if (Array.isArray(value)) {
+    return value.map(stripIds)
+  }
+  if (value && typeof value === 'object') {
+    const stripped = {}
+    for (const [key, item] of Object.entries(value)) {
+      if (key !== 'id') {
+        stripped[key] = stripIds(item)
+      }
+    }
+    return stripped
+  }
+  return value
+}
+
+describe('capture stream', () => {
+  const { scenarios } = loadRecordedReports()
+
+  for (const scenario of scenarios) {
+    test(`rebuilds the capture after each report: ${scenario.name}`, () => {
+      // Runs follow one another in the same stream, like reruns in the worker.
+      const stream = new CaptureStream()
+      for (const run of scenario.runs) {
+        run.reports.forEach((report, i) => {
+          const capture = stream.apply(decodeReport(recordedReport(report)))
+          expect(stripIds(capture)).toEqual(run.captures[i])
+        })
+      }
+    })
+  }
+})
@@ -0,0 +1,28 @@
+import path from 'path'
+import { readFileSync } from 'fs'
+
+// Capture reports recorded from the Python executor by python/tests/capture_reports.py,
+// with the whole capture after each report. JSON reports are kept as they were sent,
+// binary ones base64 encoded.
+export interface RecordedRun {
+  reports: (string | { binary: string })[]
+  captures: any[]
+}
+
+export interface RecordedReports {
+  value: { encoded: string; decoded: any }
+  scenarios: { name: string; runs: RecordedRun[] }[]
+}
+
+export function loadRecordedReports(): RecordedReports {
+  const filename = path.resolve(__dirname, 'test_data', 'capture_reports.json')
+  return JSON.parse(readFileSync(filename, 'utf8'))
+}
+
+export function decodeBase64(encoded: string): Uint8Array {
+  return new Uint8Array(Buffer.from(encoded, 'base64'))
+}
+
+export function recordedReport(report: string | { binary: string }): string | Uint8Array {
+  return typeof report === 'string' ? report : decodeBase64(report.binary)
+}
@@ -1,13 +1,17 @@
+import { CaptureStream } from './capture_stream'
 import { Dependency, HTTPRequestAWSEvent, RunType } from '@splootcode/core'
 import {
   FetchSyncErrorType,
   FileSpec,
+  ProfileType,
   ResponseData,
+  TraceScope,
   WorkerManagerMessage,
   WorkerMessage,
   sameDepencencies,
 } from './runtime/common'
 import { StaticURLs } from './static_urls'
+import { decodeReport } from './capture_encoding'
 import { loadDependencies, setupPyodide, tryModuleLoadPyodide, tryNonModuleLoadPyodide } from './pyodide'
 
 tryNonModuleLoadPyodide()
@@ -22,6 +26,9 @@ let requestPlayback: Map<string, ResponseData[]> = new Map()
 let envVars: Map<string, string> = new Map()
 let dependencies: Dependency[] = null
 let staticURLs: StaticURLs = null
+let traceScope: TraceScope = null
+let profile: ProfileType = null
+const captureStream = new CaptureStream()
 
 const sendMessage = (message: WorkerMessage) => {
   postMessage(message)
@@ -167,13 +174,25 @@ const syncFetch = (method: string, url: string, headers: any, body: any): Respon
   return result
 }
 
-let executorCode = null
+let executorRun: any = null
 let moduleLoaderCode = null
 let textGenerationCode = null
 let workspace: Map<string, FileSpec> = new Map()
 let runType: RunType | null = null
 let eventData: HTTPRequestAWSEvent | null = null
 
+// The executor and its modules are written to the Pyodide filesystem and imported
+// once per worker, so they are only parsed and compiled to bytecode on initialisation.
+const EXECUTOR_DIR = '/splootcode'
+
+const ImportExecutorCode = `
+import sys
+import importlib
+sys.path.insert(0, '${EXECUTOR_DIR}')
+importlib.invalidate_caches()
+import executor
+`
+
 const EnvVarCode = `
 import os;
 for varName in os.environ:
@@ -192,7 +211,24 @@ const run = async () => {
       globals: globals,
     })
 
-    await pyodide.runPython(executorCode)
+    const tree = pyodide.toPy(getWorkspace().get('main.py').content)
+    const event = eventData ? pyodide.toPy(eventData) : null
+    // Reruns happen as the code is edited, so one stuck in a loop is stopped
+    // after a while. Runs the user started aren't limited.
+    const limits = pyodide.toPy({
+      iterationLimit: rerun ? 10000 : 0,
+      stepLimit: 0,
+      timeLimit: rerun ? 10 : 0,
+    })
+    const scope = traceScope ? pyodide.toPy(traceScope) : null
+    try {
+      executorRun(tree, runType, event, limits, scope, profile)
+    } finally {
+      tree.destroy()
+      event?.destroy()
+      limits.destroy()
+      scope?.destroy()
+    }
   } catch (err) {
     sendMessage({
       type: 'stderr',
@@ -252,7 +288,15 @@ export const initialize = async (urls: StaticURLs, typeshedPath: string) => {
 
   await tryModuleLoadPyodide()
 
-  executorCode = await (await fetch(urls.executorURL)).text()
+  const runtimeModules = new Map<string, string>([
+    ['executor.py', await (await fetch(urls.executorURL)).text()],
+    ['expression_builder.py', await (await fetch(urls.expressionBuilderURL)).text()],
+    ['value_preview.py', await (await fetch(urls.valuePreviewURL)).text()],
+    ['capture_encoding.py', await (await fetch(urls.captureEncodingURL)).text()],
+    ['statement_profiler.py', await (await fetch(urls.statementProfilerURL)).text()],
+    ['allocation_profiler.py', await (await fetch(urls.allocationProfilerURL)).text()],
+    ['call_profiler.py', await (await fetch(urls.callProfilerURL)).text()],
+  ])
   moduleLoaderCode = await (await fetch(urls.moduleLoaderURL)).text()
   textGenerationCode = await (await fetch(urls.textGeneratorURL)).text()
 
@@ -268,23 +312,23 @@ export const initialize = async (urls: StaticURLs, typeshedPath: string) => {
       const nodeTree = getWorkspace().get('main.py').content
       return pyodide.toPy(nodeTree)
     },
-    getIterationLimit: () => {
-      if (rerun) {
-        return pyodide.toPy(10000)
-      }
-      return pyodide.toPy(0)
-    },
-    getRunType: () => {
-      return runType as string
-    },
-    getEventData: () => {
-      return pyodide.toPy(eventData)
-    },
   })
   pyodide.registerJsModule('runtime_capture', {
-    report: (json_dump) => {
+    report: (encoded) => {
+      let report
+      if (typeof encoded === 'string') {
+        report = decodeReport(encoded)
+      } else {
+        const buffer = encoded.getBuffer('u8')
+        try {
+          report = decodeReport(buffer.data)
+        } finally {
+          buffer.release()
+          encoded.destroy()
+        }
+      }
       const captureMap = new Map()
-      captureMap.set('main.py', JSON.parse(json_dump))
+      captureMap.set('main.py', captureStream.apply(report))
       sendMessage({
         type: 'runtime_capture',
         captures: captureMap,
@@ -303,6 +347,13 @@ export const initialize = async (urls: StaticURLs, typeshedPath: string) => {
     sync_fetch: syncFetch,
   })
 
+  pyodide.FS.mkdirTree(EXECUTOR_DIR)
+  for (const [filename, code] of runtimeModules) {
+    pyodide.FS.writeFile(`${EXECUTOR_DIR}/${filename}`, code)
+  }
+  pyodide.runPython(ImportExecutorCode)
+  executorRun = pyodide.pyimport('executor').run
+
   pyodide.globals.set('__name__', '__main__')
   pyodide.runPython(moduleLoaderCode)
 
@@ -323,6 +374,8 @@ onmessage = function (e: MessageEvent<WorkerManagerMessage>) {
       rerun = false
       requestPlayback = null
       envVars = e.data.envVars || new Map<string, string>()
+      traceScope = e.data.traceScope || null
+      profile = e.data.profile || null
       run()
       break
     case 'rerun':
@@ -337,6 +390,8 @@ onmessage = function (e: MessageEvent<WorkerManagerMessage>) {
       requestPlayback = e.data.requestPlayback
       rerun = true
       envVars = e.data.envVars || new Map<string, string>()
+      traceScope = e.data.traceScope || null
+      profile = null
 
       if (!dependencies) {
         // this is first load
@@ -0,0 +1,153 @@
+import ast
+import tracemalloc
+
+
+# Measures the memory used by a program for a memory profiled run, with
+# tracemalloc. The untraced code of the program is compiled with a call to the
+# profiler before every top level statement and around the body of every
+# function, so the capture's own memory isn't counted. For each top level
+# statement and each function (by its id), the memory it allocated and didn't
+# free (its size) and the most it had allocated at once (its peak) are
+# recorded.
+#
+# The lines that allocated the most of the memory still in use at the end of
+# the run are read from a tracemalloc snapshot.
+
+STATEMENT_HOOK = "__spt__memoryStatement__"
+CALL_HOOK = "__spt__memoryCall__"
+RETURN_HOOK = "__spt__memoryReturn__"
+
+PROGRAM_FILENAME = "main.py"
+
+# The number of lines kept in the table of the lines that allocated the most.
+MEMORY_TOP_LINES = 10
+
+
+def addMemoryMarks(statements, topLines, functionIds):
+    # Returns the module's statements with a mark before each top level
+    # statement from the editor's tree, and with every function's body
+    # bracketed by a call and a return mark.
+    topLines = set(topLines)
+    marked = []
+    previous = None
+    for node in statements:
+        lineno = getattr(node, "lineno", None)
+        if lineno in topLines and lineno != previous:
+            marked.append(hookCall(STATEMENT_HOOK, lineno))
+        previous = lineno
+        marked.append(node)
+    marked.append(hookCall(STATEMENT_HOOK, None))
+
+    for node in list(ast.walk(ast.Module(body=statements, type_ignores=[]))):
+        if type(node) is ast.FunctionDef and getattr(node, "lineno", None) in functionIds:
+            returned = hookCall(RETURN_HOOK, functionIds[node.lineno])
+            node.body = [hookCall(CALL_HOOK), ast.Try(node.body, [], [], [returned])]
+    return marked
+
+
+def hookCall(name, *args):
+    return ast.Expr(ast.Call(ast.Name(name, ast.Load()), args=[ast.Constant(arg) for arg in args], keywords=[]))
+
+
+def functionIds(node, ids):
+    # Line number -> function id of each function declaration in the editor's tree.
+    if node["type"] == "PYTHON_STATEMENT" and len(node["childSets"]["statement"]) != 0:
+        statement = node["childSets"]["statement"][0]
+        if statement["type"] == "PYTHON_FUNCTION_DECLARATION" and "lineno" in (node.get("meta") or {}):
+            ids[node["meta"]["lineno"]] = statement["properties"].get("id")
+    for children in node["childSets"].values():
+        for child in children:
+            functionIds(child, ids)
+    return ids
+
+
+class AllocationProfiler:
+    def __init__(self, program):
+        self.program = program
+        self.statements = []
+        self.functions = {}
+        # [memory in use at the start, peak so far] of the run, the running
+        # top level statement and the function calls inside it.
+        self.stack = []
+        self.statementLine = None
+        self.size = 0
+        self.peak = 0
+        self.lines = []
+
+    def run(self, globals):
+        globals[STATEMENT_HOOK] = self.statement
+        globals[CALL_HOOK] = self.push
+        globals[RETURN_HOOK] = self.returned
+        startedTracing = not tracemalloc.is_tracing()
+        if startedTracing:
+            tracemalloc.start()
+        self.push()
+        try:
+            exec(self.program.code, globals)
+        finally:
+            # The program's globals are still in use, for the snapshot.
+            self.finish()
+            if startedTracing:
+                tracemalloc.stop()
+
+    def push(self):
+        current, peak = tracemalloc.get_traced_memory()
+        if self.stack:
+            top = self.stack[-1]
+            top[1] = max(top[1], peak)
+        tracemalloc.reset_peak()
+        self.stack.append([current, current])
+
+    def pop(self):
+        # Returns the size and peak of what was running, relative to the
+        # memory in use when it started.
+        current, peak = tracemalloc.get_traced_memory()
+        start, peakSoFar = self.stack.pop()
+        peak = max(peakSoFar, peak)
+        if self.stack:
+            top = self.stack[-1]
+            top[1] = max(top[1], peak)
+        return current - start, peak - start
+
+    def statement(self, lineno):
+        # Called before each top level statement, and with None after the last one.
+        if self.statementLine is not None:
+            size, peak = self.pop()
+            self.statements.append({"lineno": self.statementLine, "type": self.program.types.get(self.statementLine), "size": size, "peak": peak})
+        self.statementLine = lineno
+        if lineno is not None:
+            self.push()
+
+    def returned(self, func_id):
+        size, peak = self.pop()
+        function = self.functions.get(func_id)
+        if function is None:
+            function = self.functions[func_id] = {"calls": 0, "size": 0, "peak": 0}
+        function["calls"] += 1
+        function["size"] += size
+        function["peak"] = max(function["peak"], peak)
+
+    def finish(self):
+        # When the program raised, the statement it raised in is still running.
+        if self.statementLine is not None:
+            while len(self.stack) > 2:
+                self.pop()
+            self.statement(None)
+        self.size, self.peak = self.pop()
+        types = self.program.types
+        snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(True, PROGRAM_FILENAME)])
+        for stat in snapshot.statistics("lineno"):
+            lineno = stat.traceback[0].lineno
+            if lineno in types:
+                self.lines.append({"lineno": lineno, "type": types[lineno], "size": stat.size, "count": stat.count})
+                if len(self.lines) == MEMORY_TOP_LINES:
+                    break
+
+    def report(self):
+        return {
+            "size": self.size,
+            "peak": self.peak,
+            "statements": self.statements,
+            "functions": self.functions,
+            "lines": self.lines,
+        }
@@ -0,0 +1,102 @@
+import ast
+import contextlib
+import copy
+import io
+import json
+import time
+
+from executor import (
+    CAPTURE_HOOKS,
+    SPLOOT_KEY,
+    SplootCapture,
+    bindCaptureHooks,
+    getStatementsFromBlock,
+    hookName,
+)
+from convert_ast import splootFromPython
+from tests.test_annotation_limits_executor import TIC_TAC_TOE_CODE
+
+
+class AttributeHooks(ast.NodeTransformer):
+    # Rewrites generated code back to calling __spt__.<method>(...) for every event,
+    # which is how capture hooks were called before they were bound to names.
+    hookNames = {hookName(method): method for method in CAPTURE_HOOKS}
+
+    def visit_Assign(self, node):
+        if len(node.targets) == 1 and isinstance(node.targets[0], ast.Name) and node.targets[0].id in self.hookNames:
+            return None
+        return self.generic_visit(node)
+
+    def visit_Name(self, node):
+        if node.id in self.hookNames:
+            key = ast.Name(id=SPLOOT_KEY, ctx=ast.Load())
+            return ast.Attribute(value=key, attr=self.hookNames[node.id], ctx=ast.Load())
+        return node
+
+
+class CountingCapture(SplootCapture):
+    def __init__(self):
+        super().__init__()
+        methods = [method for method in CAPTURE_HOOKS if callable(getattr(self, method))]
+        self.events = {method: 0 for method in methods}
+        for method in methods:
+            setattr(self, method, self.counted(method, getattr(self, method)))
+
+    def counted(self, method, hook):
+        def f(*args):
+            self.events[method] += 1
+            return hook(*args)
+        return f
+
+
+def compileStatements(statements):
+    mods = ast.Module(body=statements, type_ignores=[])
+    return compile(ast.fix_missing_locations(mods), "main.py", mode="exec")
+
+
+def execute(code, capture):
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        exec(code, {SPLOOT_KEY: capture, '__name__': '__main__'})
+        return time.perf_counter() - start
+
+
+def best(code, repeat):
+    return min(execute(code, SplootCapture()) for _ in range(repeat))
+
+
+def main(repeat):
+    tree = splootFromPython(TIC_TAC_TOE_CODE)
+    body = tree["childSets"]["body"]
+
+    traced = bindCaptureHooks(CAPTURE_HOOKS) + getStatementsFromBlock(body, True)
+    bound = compileStatements(copy.deepcopy(traced))
+    attribute = compileStatements(AttributeHooks().visit(ast.Module(body=copy.deepcopy(traced), type_ignores=[])).body)
+    untraced = compileStatements(bindCaptureHooks(["step"]) + getStatementsFromBlock(body, False))
+
+    counter = CountingCapture()
+    execute(bound, counter)
+
+    events = sum(counter.events.values())
+
+    untracedTime = best(untraced, repeat)
+    attributeTime = best(attribute, repeat)
+    boundTime = best(bound, repeat)
+    print(json.dumps({
+        'benchmark': 'tic_tac_toe',
+        'events': events,
+        'eventsByHook': counter.events,
+        'untracedSeconds': untracedTime,
+        'attributeHooksSeconds': attributeTime,
+        'boundHooksSeconds': boundTime,
+        'attributeHooksNsPerEvent': (attributeTime - untracedTime) * 1e9 / events,
+        'boundHooksNsPerEvent': (boundTime - untracedTime) * 1e9 / events,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Benchmark the per-event overhead of calling capture hooks.')
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='number of timed runs of each variant')
+    args = parser.parse_args()
+    main(args.repeat)
@@ -0,0 +1,106 @@
+import contextlib
+import io
+import json
+import time
+import tracemalloc
+from unittest import mock
+
+import executor
+from executor import SplootCapture, CaptureContext, LoopCaptureContext, previewValue
+from convert_ast import splootFromPython
+
+LOOP = """
+total = 0
+for i in range({size}):
+    if i % 3 == 0:
+        total = total + i
+    else:
+        total = total - 1
+"""
+
+SIZES = [10000, 100000]
+
+
+class DictCaptureContext(CaptureContext):
+    # Used with DictRecordsCapture, which stores a dict per entry and the
+    # child frame's blocks, the way results were recorded before they were
+    # kept as tuples. Loops are still sampled the same way as with tuples.
+    __slots__ = ()
+
+    def toDict(self):
+        return {"type": self.type, "data": self.blocks}
+
+
+class DictRecordsCapture(SplootCapture):
+    def __init__(self):
+        super().__init__()
+        self.root = DictCaptureContext("PYTHON_FILE", "body")
+        self.stack = [self.root]
+
+    def startFrame(self, type, childset):
+        if type in executor.LOOP_TYPES:
+            frame = LoopCaptureContext(type, childset, self.loopSampleSize)
+        else:
+            frame = DictCaptureContext(type, childset)
+        self.stack[-1].appendResult({"type": frame.type, "data": frame.blocks})
+        self.stack.append(frame)
+
+    def logExpressionResult(self, nodetype, data, result):
+        preview, length = previewValue(result)
+        data["result"] = preview
+        if length is not None:
+            data["resultLength"] = length
+        data["resultType"] = type(result).__name__
+        res = {"data": data}
+        if nodetype:
+            res["type"] = nodetype
+        if self.sideEffects:
+            res["sideEffects"] = self.sideEffects
+        self.stack[-1].appendResult(res)
+        self.sideEffects = []
+        return result
+
+
+def measure(code, captureClass):
+    capture = captureClass()
+    tracemalloc.start()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        exec(code, {executor.SPLOOT_KEY: capture, '__name__': '__main__'})
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    serialized = len(json.dumps(capture.toDict()))
+    return seconds, peak, serialized
+
+
+def main(repeat):
+    for size in SIZES:
+        tree = splootFromPython(LOOP.format(size=size))
+        # Keep every iteration so the whole loop is stored.
+        with mock.patch.object(executor, 'iterationLimit', size * 2), \
+                mock.patch.object(executor, 'CAPTURE_SIZE_LIMIT', float('inf')):
+            code = executor.getCompiledCode(tree, 'COMMAND_LINE', True)
+            # Per iteration: one iteration frame, the iterable, the if frame,
+            # its condition and the assignment.
+            events = size * 5
+            for name, captureClass in [('dict', DictRecordsCapture), ('tuple', SplootCapture)]:
+                runs = [measure(code, captureClass) for _ in range(repeat)]
+                seconds = min(run[0] for run in runs)
+                print(json.dumps({
+                    'benchmark': 'loop',
+                    'records': name,
+                    'iterations': size,
+                    'seconds': seconds,
+                    'usPerEvent': seconds * 1e6 / events,
+                    'peakBytes': min(run[1] for run in runs),
+                    'serializedBytes': runs[0][2],
+                }))
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Benchmark time and peak memory of traced loops for each capture record layout.')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='number of timed runs per layout')
+    args = parser.parse_args()
+    main(args.repeat)
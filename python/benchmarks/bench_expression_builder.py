@@ -0,0 +1,49 @@
+import json
+import random
+import timeit
+
+from expression_builder import buildExpression, OPERATORS
+from executor import generateAstExpressionToken
+
+SIZES = [10, 100, 1000, 10000]
+
+
+def generateTokens(size, operators, seed=0):
+    rng = random.Random(seed)
+    tokens = []
+    for i in range((size + 1) // 2):
+        if i:
+            tokens.append({"type": "PYTHON_BINARY_OPERATOR", "childSets": {}, "properties": {"operator": rng.choice(operators)}})
+        tokens.append({"type": "PY_IDENTIFIER", "childSets": {}, "properties": {"identifier": f"v{i}"}})
+    return tokens
+
+
+def benchmark(name, tokens, repeat):
+    timer = timeit.Timer(lambda: buildExpression(tokens, generateAstExpressionToken))
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat=repeat, number=number)) / number
+    return {
+        'benchmark': name,
+        'tokens': len(tokens),
+        'seconds': best,
+        'usPerToken': best * 1e6 / len(tokens),
+    }
+
+
+def main(repeat):
+    streams = {
+        'add_chain': ['+'],
+        'and_chain': ['and'],
+        'mixed': list(OPERATORS.keys()),
+    }
+    for name, operators in streams.items():
+        for size in SIZES:
+            print(json.dumps(benchmark(name, generateTokens(size, operators), repeat)))
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Benchmark building ast expressions from Sploot expression tokens.')
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='number of timing repeats per stream')
+    args = parser.parse_args()
+    main(args.repeat)
@@ -0,0 +1,211 @@
+import ast
+import contextlib
+import io
+import json
+import math
+import time
+import tracemalloc
+
+import executor
+from executor import (
+    CAPTURE_HOOKS,
+    SPLOOT_KEY,
+    SplootCapture,
+    bindCaptureHooks,
+    fixLocations,
+    getStatementsFromBlock,
+)
+from convert_ast import splootFromPython
+from tests.test_annotation_limits_executor import TIC_TAC_TOE_CODE
+
+
+NUMERIC_CODE = """
+def primes(limit):
+    found = []
+    for n in range(2, limit):
+        prime = True
+        for p in found:
+            if p * p > n:
+                break
+            if n % p == 0:
+                prime = False
+                break
+        if prime:
+            found.append(n)
+    return found
+
+def multiply(a, b, size):
+    result = []
+    for i in range(size):
+        row = []
+        for j in range(size):
+            total = 0
+            for k in range(size):
+                total = total + a[i][k] * b[k][j]
+            row.append(total)
+        result.append(row)
+    return result
+
+size = 40
+matrix = []
+for i in range(size):
+    row = []
+    for j in range(size):
+        row.append((i * size + j) % 7)
+    matrix.append(row)
+product = multiply(matrix, matrix, size)
+found = primes(30000)
+print(len(found), product[3][5])
+"""
+
+# Each block is 8 statements, counting the ones in blocks.
+GENERATED_BLOCK = """
+v{i} = {i} * 2
+if v{i} % 3 == 0:
+    w{i} = v{i} + 1
+else:
+    w{i} = v{i} - 1
+def f{i}(x):
+    return x + {i}
+r{i} = f{i}(w{i})
+names{i} = [str(v{i}), str(w{i}), str(r{i})]
+"""
+
+
+def generatedCode(statements):
+    return "".join(GENERATED_BLOCK.format(i=i) for i in range(statements // 8))
+
+
+PROGRAMS = {
+    'tic_tac_toe': TIC_TAC_TOE_CODE,
+    'numeric_loops': NUMERIC_CODE,
+    'generated_10k': generatedCode(10000),
+}
+
+
+def compileStatements(statements):
+    return compile(fixLocations(ast.Module(body=statements, type_ignores=[])), "main.py", mode="exec")
+
+
+def execute(code):
+    capture = SplootCapture()
+    with contextlib.redirect_stdout(io.StringIO()):
+        exec(code, {SPLOOT_KEY: capture, '__name__': '__main__'})
+    return capture
+
+
+class Pipeline:
+    # The stages of running a program from its source, in the order the
+    # executor runs them. Each stage takes what the one before it returned.
+    def __init__(self, source):
+        self.source = source
+
+    def convert(self, _):
+        return splootFromPython(self.source)
+
+    def transpile(self, tree):
+        return getStatementsFromBlock(tree["childSets"]["body"], True)
+
+    def compile(self, statements):
+        return compileStatements(bindCaptureHooks(CAPTURE_HOOKS) + statements)
+
+    def traced(self, code):
+        return execute(code)
+
+    def toDict(self, capture):
+        return capture.toDict()
+
+    def json(self, capture):
+        return json.dumps(capture)
+
+
+STAGES = ['convert', 'transpile', 'compile', 'traced', 'toDict', 'json']
+
+
+def timed(stage, value):
+    start = time.perf_counter()
+    result = stage(value)
+    return time.perf_counter() - start, result
+
+
+def peakMemory(stage, value):
+    tracemalloc.start()
+    try:
+        stage(value)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def transpileFresh(pipeline, tree):
+    # Without the statements cached by an earlier transpile.
+    executor.transpiledStatementCache.clear()
+    return pipeline.transpile(tree)
+
+
+def measure(source, repeat):
+    pipeline = Pipeline(source)
+    results = {}
+    value = None
+    tree = None
+    for name in STAGES:
+        stage = getattr(pipeline, name)
+        # Each run transpiles without the cache. Compiling fixes the locations
+        # of the statements in place, so each run compiles freshly transpiled ones.
+        seconds = []
+        for _ in range(repeat):
+            if name == 'transpile':
+                executor.transpiledStatementCache.clear()
+            argument = transpileFresh(pipeline, tree) if name == 'compile' else value
+            elapsed, result = timed(stage, argument)
+            seconds.append(elapsed)
+        if name == 'convert':
+            tree = result
+        if name == 'compile':
+            peak = peakMemory(stage, transpileFresh(pipeline, tree))
+        else:
+            if name == 'transpile':
+                executor.transpiledStatementCache.clear()
+            peak = peakMemory(stage, value)
+        results[name] = {'seconds': min(seconds), 'peakBytes': peak}
+        if name == 'transpile':
+            # A rerun of the unchanged program gets its statements from the cache.
+            results['transpileCached'] = {
+                'seconds': min(timed(stage, value)[0] for _ in range(repeat)),
+                'peakBytes': peakMemory(stage, value),
+            }
+        value = result
+
+    untracedCode = compileStatements(bindCaptureHooks(["step"]) + getStatementsFromBlock(tree["childSets"]["body"], False))
+    results['untraced'] = {
+        'seconds': min(timed(execute, untracedCode)[0] for _ in range(repeat)),
+        'peakBytes': peakMemory(execute, untracedCode),
+    }
+    return results, len(value)
+
+
+def main(repeat):
+    overheads = []
+    for name, source in PROGRAMS.items():
+        stages, captureBytes = measure(source, repeat)
+        overhead = stages['traced']['seconds'] / stages['untraced']['seconds']
+        overheads.append(overhead)
+        print(json.dumps({
+            'benchmark': name,
+            'tracedOverhead': overhead,
+            'captureBytes': captureBytes,
+            'stages': stages,
+        }))
+    # The headline number: how many times slower a traced run is, across the programs.
+    print(json.dumps({
+        'benchmark': 'summary',
+        'tracedOverhead': math.exp(sum(math.log(overhead) for overhead in overheads) / len(overheads)),
+    }))
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Benchmark each stage of running a program: converting, transpiling, compiling, running it traced and untraced, and serialising the capture.')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='number of timed runs of each stage')
+    args = parser.parse_args()
+    main(args.repeat)
@@ -0,0 +1,66 @@
+import contextlib
+import io
+import json
+import time
+
+from executor import executePythonFile
+from convert_ast import splootFromPython
+from tests.test_annotation_limits_executor import TIC_TAC_TOE_CODE
+
+
+LOOPS_CODE = """
+def score(word):
+    total = 0
+    for letter in word:
+        if letter in 'aeiou':
+            total = total + 1
+        else:
+            total = total + 2
+    return total
+
+words = ['apple', 'banana', 'cherry', 'dragonfruit']
+best = 0
+for i in range(200):
+    for word in words:
+        best = max(best, score(word) + i)
+print(best)
+"""
+
+PROGRAMS = {
+    'tic_tac_toe': TIC_TAC_TOE_CODE,
+    'loops': LOOPS_CODE,
+}
+
+
+def execute(tree, backend):
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        executePythonFile(tree, tracingBackend=backend)
+        return time.perf_counter() - start
+
+
+def best(tree, backend, repeat):
+    # The first run compiles the program, which is cached for the timed runs.
+    execute(tree, backend)
+    return min(execute(tree, backend) for _ in range(repeat))
+
+
+def main(repeat):
+    for name, source in PROGRAMS.items():
+        tree = splootFromPython(source)
+        astTime = best(tree, "AST", repeat)
+        hooksTime = best(tree, "HOOKS", repeat)
+        print(json.dumps({
+            'benchmark': name,
+            'astSeconds': astTime,
+            'hooksSeconds': hooksTime,
+            'speedup': astTime / hooksTime,
+        }))
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Compare the AST and interpreter hook tracing backends.')
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='number of timed runs of each backend')
+    args = parser.parse_args()
+    main(args.repeat)
@@ -0,0 +1,55 @@
+import io
+import json
+import contextlib
+import time
+from unittest import mock
+
+import executor
+from executor import executePythonFile, wrapStdout
+from convert_ast import splootFromPython
+
+GROWING_LIST = """
+items = []
+for i in range({size}):
+    items.append(i)
+    items
+"""
+
+SIZES = [1000, 5000, 20000]
+
+
+def strPreview(value):
+    return str(value), None
+
+
+def timeRun(tree):
+    f = io.StringIO()
+    f.write = wrapStdout(f.write)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(f):
+        cap, _ = executePythonFile(tree)
+    seconds = time.perf_counter() - start
+    return seconds, len(json.dumps(cap))
+
+
+def main(repeat):
+    for size in SIZES:
+        tree = splootFromPython(GROWING_LIST.format(size=size))
+        for name, preview in [('str', strPreview), ('preview', executor.previewValue)]:
+            with mock.patch.object(executor, 'previewValue', preview):
+                runs = [timeRun(tree) for _ in range(repeat)]
+            print(json.dumps({
+                'benchmark': 'growing_list',
+                'formatter': name,
+                'iterations': size,
+                'seconds': min(run[0] for run in runs),
+                'captureBytes': runs[0][1],
+            }))
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Benchmark traced runs that log a growing list every iteration.')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='number of timed runs per formatter')
+    args = parser.parse_args()
+    main(args.repeat)
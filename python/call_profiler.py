@@ -0,0 +1,135 @@
+import ast
+import time
+
+
+# Builds the call graph of a program's functions for a call profiled run. The
+# untraced code of the program is compiled with every function's body
+# bracketed by a call to enter() and, in a finally, to leave(), with the
+# index of the function. Index 0 is for the module.
+#
+# Each function's calls, self time (not counting the functions it calls) and
+# total time (counted once for recursive calls), and the calls and time of
+# each caller -> callee edge (also counted once for calls nested in a call
+# of the same edge), are kept in flat lists allocated before the run.
+
+ENTER_HOOK = "__spt__callEnter__"
+LEAVE_HOOK = "__spt__callLeave__"
+
+
+def functionDeclarations(node, functions):
+    # The id, name and line number of each function declaration in the editor's tree.
+    if node["type"] == "PYTHON_STATEMENT" and len(node["childSets"]["statement"]) != 0:
+        statement = node["childSets"]["statement"][0]
+        if statement["type"] == "PYTHON_FUNCTION_DECLARATION" and "lineno" in (node.get("meta") or {}):
+            functions.append({
+                "id": statement["properties"].get("id"),
+                "name": statement["childSets"]["identifier"][0]["properties"]["identifier"],
+                "lineno": node["meta"]["lineno"],
+            })
+    for children in node["childSets"].values():
+        for child in children:
+            functionDeclarations(child, functions)
+    return functions
+
+
+def addCallMarks(statements, functions):
+    # Brackets the body of each function declared in the editor's tree, in place.
+    indexes = {function["lineno"]: i + 1 for i, function in enumerate(functions)}
+    for node in list(ast.walk(ast.Module(body=statements, type_ignores=[]))):
+        if type(node) is ast.FunctionDef and getattr(node, "lineno", None) in indexes:
+            index = indexes[node.lineno]
+            node.body = [hookCall(ENTER_HOOK, index), ast.Try(node.body, [], [], [hookCall(LEAVE_HOOK, index)])]
+    return statements
+
+
+def hookCall(name, index):
+    return ast.Expr(ast.Call(ast.Name(name, ast.Load()), args=[ast.Constant(index)], keywords=[]))
+
+
+class CallProfiler:
+    def __init__(self, program):
+        self.program = program
+        size = len(program.functions) + 1
+        self.size = size
+        self.calls = [0] * size
+        self.selfTimes = [0] * size
+        self.totalTimes = [0] * size
+        # The number of calls of each function that are running.
+        self.running = [0] * size
+        # caller * size + callee -> calls, and time.
+        self.edgeCalls = [0] * (size * size)
+        self.edgeTimes = [0] * (size * size)
+        # The number of calls of each edge that are running.
+        self.edgeRunning = [0] * (size * size)
+        # The running function of each call, and when the call started.
+        self.stack = [0]
+        self.started = [0]
+        self.last = [0]
+        self.enter, self.leave = self.createHooks()
+
+    def createHooks(self):
+        size = self.size
+        calls = self.calls
+        selfTimes = self.selfTimes
+        totalTimes = self.totalTimes
+        running = self.running
+        edgeCalls = self.edgeCalls
+        edgeTimes = self.edgeTimes
+        edgeRunning = self.edgeRunning
+        stack = self.stack
+        started = self.started
+        last = self.last
+        clock = time.perf_counter_ns
+
+        def enter(index):
+            now = clock()
+            caller = stack[-1]
+            selfTimes[caller] += now - last[0]
+            calls[index] += 1
+            running[index] += 1
+            edgeCalls[caller * size + index] += 1
+            edgeRunning[caller * size + index] += 1
+            stack.append(index)
+            started.append(now)
+            last[0] = clock()
+
+        def leave(index):
+            now = clock()
+            selfTimes[index] += now - last[0]
+            stack.pop()
+            elapsed = now - started.pop()
+            running[index] -= 1
+            edge = stack[-1] * size + index
+            edgeRunning[edge] -= 1
+            # A recursive call's time is already part of the outermost call's,
+            # of the function and of the edge.
+            if running[index] == 0:
+                totalTimes[index] += elapsed
+            if edgeRunning[edge] == 0:
+                edgeTimes[edge] += elapsed
+            last[0] = clock()
+        return enter, leave
+
+    def run(self, globals):
+        globals[ENTER_HOOK] = self.enter
+        globals[LEAVE_HOOK] = self.leave
+        start = self.started[0] = self.last[0] = time.perf_counter_ns()
+        try:
+            exec(self.program.code, globals)
+        finally:
+            end = time.perf_counter_ns()
+            self.selfTimes[0] += end - self.last[0]
+            self.totalTimes[0] = end - start
+            self.calls[0] = 1
+
+    def report(self):
+        # Functions are referred to by their index in the list, the module first.
+        functions = [{"id": None, "name": "<module>", "lineno": None}] + self.program.functions
+        report = {"functions": [], "edges": []}
+        for index, function in enumerate(functions):
+            report["functions"].append(dict(function, calls=self.calls[index], selfTime=self.selfTimes[index], totalTime=self.totalTimes[index]))
+        for edge, calls in enumerate(self.edgeCalls):
+            if calls != 0:
+                caller, callee = divmod(edge, self.size)
+                report["edges"].append([caller, callee, calls, self.edgeTimes[edge]])
+        return report
@@ -0,0 +1,193 @@
+import json
+import struct
+
+
+# Binary encoding for capture reports (any tree of dicts, lists, strings,
+# numbers, booleans and None), so they don't go through a JSON string.
+#
+# Reports are only sent this way when the capture is estimated to be bigger
+# than BINARY_REPORT_SIZE, see encodeReport.
+#
+# A payload is MAGIC followed by one value. Each value starts with a tag byte.
+# Short strings and dict key lists ("shapes") are added to a table the first
+# time they are written, and referred to by their index in that table after.
+# Lengths, indexes and ints are varints.
+MAGIC = b"SPC1"
+
+TAG_NONE = 0
+TAG_FALSE = 1
+TAG_TRUE = 2
+TAG_INT = 3
+TAG_FLOAT = 4
+TAG_STRING = 5
+TAG_NEW_STRING = 6
+TAG_LONG_STRING = 7
+TAG_LIST = 8
+TAG_OBJECT = 9
+TAG_NEW_SHAPE = 10
+
+# Longer strings, which are mostly unique result previews, are written inline.
+INTERNED_STRING_LENGTH = 64
+
+# json.dumps runs in C and takes about half the time of encodeCapture, which
+# more than makes up for decoding the JSON in the worker taking about 2.5x as
+# long. The binary encoding is about 5x smaller though, and read in place
+# rather than copied into a JS string, so it is kept for the captures big
+# enough for memory to matter.
+BINARY_REPORT_SIZE = 8 * 1024 * 1024
+
+packDouble = struct.Struct("<d").pack
+unpackDouble = struct.Struct("<d").unpack_from
+
+
+class CaptureEncoder:
+    def __init__(self):
+        self.out = bytearray(MAGIC)
+        self.strings = {}
+        self.shapes = {}
+
+    def writeVarint(self, n):
+        out = self.out
+        while n > 0x7f:
+            out.append((n & 0x7f) | 0x80)
+            n >>= 7
+        out.append(n)
+
+    def writeString(self, s):
+        index = self.strings.get(s)
+        if index is not None:
+            self.out.append(TAG_STRING)
+            self.writeVarint(index)
+            return
+        data = s.encode("utf-8")
+        if len(s) <= INTERNED_STRING_LENGTH:
+            self.strings[s] = len(self.strings)
+            self.out.append(TAG_NEW_STRING)
+        else:
+            self.out.append(TAG_LONG_STRING)
+        self.writeVarint(len(data))
+        self.out += data
+
+    def writeValue(self, value):
+        valueType = type(value)
+        if valueType is str:
+            self.writeString(value)
+        elif valueType is dict:
+            keys = tuple(value)
+            index = self.shapes.get(keys)
+            if index is None:
+                self.shapes[keys] = len(self.shapes)
+                self.out.append(TAG_NEW_SHAPE)
+                self.writeVarint(len(keys))
+                for key in keys:
+                    self.writeString(str(key) if key is not None else "null")
+            else:
+                self.out.append(TAG_OBJECT)
+                self.writeVarint(index)
+            for item in value.values():
+                self.writeValue(item)
+        elif valueType is list or valueType is tuple:
+            self.out.append(TAG_LIST)
+            self.writeVarint(len(value))
+            for item in value:
+                self.writeValue(item)
+        elif value is None:
+            self.out.append(TAG_NONE)
+        elif valueType is bool:
+            self.out.append(TAG_TRUE if value else TAG_FALSE)
+        elif valueType is int:
+            self.out.append(TAG_INT)
+            # zigzag, so small negative numbers stay short
+            self.writeVarint(value * 2 if value >= 0 else -value * 2 - 1)
+        elif valueType is float:
+            self.out.append(TAG_FLOAT)
+            self.out += packDouble(value)
+        else:
+            raise TypeError(f"Can't encode {valueType.__name__} in a capture")
+
+
+def encodeCapture(value):
+    encoder = CaptureEncoder()
+    encoder.writeValue(value)
+    return memoryview(encoder.out)
+
+
+class CaptureDecoder:
+    def __init__(self, data):
+        self.data = bytes(data)
+        self.pos = len(MAGIC)
+        self.strings = []
+        self.shapes = []
+        if self.data[:len(MAGIC)] != MAGIC:
+            raise ValueError("Not an encoded capture")
+
+    def readVarint(self):
+        data = self.data
+        n = 0
+        shift = 0
+        while True:
+            byte = data[self.pos]
+            self.pos += 1
+            n |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return n
+            shift += 7
+
+    def readBytes(self):
+        length = self.readVarint()
+        s = self.data[self.pos:self.pos + length].decode("utf-8")
+        self.pos += length
+        return s
+
+    def readValue(self):
+        tag = self.data[self.pos]
+        self.pos += 1
+        if tag == TAG_STRING:
+            return self.strings[self.readVarint()]
+        if tag == TAG_NEW_STRING:
+            s = self.readBytes()
+            self.strings.append(s)
+            return s
+        if tag == TAG_LONG_STRING:
+            return self.readBytes()
+        if tag == TAG_OBJECT or tag == TAG_NEW_SHAPE:
+            if tag == TAG_NEW_SHAPE:
+                keys = [self.readValue() for _ in range(self.readVarint())]
+                self.shapes.append(keys)
+            else:
+                keys = self.shapes[self.readVarint()]
+            return {key: self.readValue() for key in keys}
+        if tag == TAG_LIST:
+            return [self.readValue() for _ in range(self.readVarint())]
+        if tag == TAG_NONE:
+            return None
+        if tag == TAG_FALSE:
+            return False
+        if tag == TAG_TRUE:
+            return True
+        if tag == TAG_INT:
+            n = self.readVarint()
+            return n >> 1 if n & 1 == 0 else -((n + 1) >> 1)
+        if tag == TAG_FLOAT:
+            value = unpackDouble(self.data, self.pos)[0]
+            self.pos += 8
+            return value
+        raise ValueError(f"Unknown tag {tag} at {self.pos - 1}")
+
+
+def decodeCapture(data):
+    return CaptureDecoder(data).readValue()
+
+
+def encodeReport(value, size):
+    # A report as JSON, or in the binary encoding when size, the capture's
+    # estimated size, is over BINARY_REPORT_SIZE.
+    if size > BINARY_REPORT_SIZE:
+        return encodeCapture(value)
+    return json.dumps(value)
+
+
+def decodeReport(report):
+    if isinstance(report, str):
+        return json.loads(report)
+    return decodeCapture(report)
@@ -1,5 +1,5 @@
 from re import S, sub
-from executor import OPERATORS, UNARY_OPERATORS
+from expression_builder import OPERATORS, UNARY_OPERATORS
 import ast
 import ast_comments
 
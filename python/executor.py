@@ -1,16 +1,145 @@
 import ast
+import copy
 import sys
 import json
+import time
+import hashlib
 import traceback
+import weakref
+from bisect import bisect_left, bisect_right
+from itertools import chain, repeat
+from collections import OrderedDict, deque
 from typing import Tuple
 
+from expression_builder import buildExpression
+from value_preview import previewValue
+from capture_encoding import encodeReport
+from statement_profiler import ProfiledProgram, StatementProfiler, addStatementMarks, statementTypes
+from allocation_profiler import AllocationProfiler, addMemoryMarks, functionIds
+from call_profiler import CallProfiler, addCallMarks, functionDeclarations
+
 
 SPLOOT_KEY = "__spt__"
 SPLOOT_HANDLER_ARG="__spt__handler_arg__"
 SPLOOT_SET_RESPONSE_FUNC="__spt__set_response__"
 
+# Capture methods called from generated code. Each is bound once to a global
+# name at the top of the module (and to a local in traced functions that call
+# it inside a loop), so a capture event is a single name lookup instead of a
+# global plus an attribute lookup.
+CAPTURE_HOOKS = [
+    "func",
+    "untracedFunction",
+    "detachedFramesCount",
+    "addExceptionFrame",
+    "logExpressionResult",
+    "logExpressionResultAndStartFrame",
+    "startFrame",
+    "startChildSet",
+    "endFrame",
+    "endLoop",
+    "logUntracedStatement",
+    "step",
+]
+
 iterationLimit = None
 
+# Without an iterationLimit, loops keep up to this many iteration frames:
+# half from the start of the loop and half from the end.
+DEFAULT_ITERATION_LIMIT = 10000
+LOOP_TYPES = ("PYTHON_FOR_LOOP", "PYTHON_WHILE_LOOP")
+
+# Characters of stdout kept for one statement, and for the whole run. What
+# doesn't fit is counted in the side effect's "elided".
+STATEMENT_STDOUT_LIMIT = 10000
+RUN_STDOUT_LIMIT = 1000000
+
+# Estimated size in bytes a capture may grow to. Past each fraction of it in
+# CAPTURE_DEGRADE_STEPS, recording degrades one more step: shorter result
+# previews, then fewer iterations kept per loop, then nothing is recorded
+# and functions switch to their untraced code.
+CAPTURE_SIZE_LIMIT = 32 * 1024 * 1024
+CAPTURE_DEGRADE_STEPS = [0.5, 0.75, 1.0]
+CAPTURE_ENTRY_SIZE = 64
+SHORT_PREVIEW_LIMIT = 100
+DEGRADED_LOOP_SAMPLE_SIZE = 10
+
+# Number of calls per function that get a captured frame. Recursive calls,
+# made while a captured call of the function is running, get one up to
+# RECURSIVE_FRAME_LIMIT. Of those, the first and the last calls are kept,
+# and some of the ones that raised, see DetachedFrames.
+FUNCTION_FRAME_LIMIT = 100
+RECURSIVE_FRAME_LIMIT = 1000
+FUNCTION_FIRST_FRAMES = 50
+FUNCTION_LAST_FRAMES = 50
+FUNCTION_RAISED_FRAMES = 50
+
+# Once a function has used up its captured frames, replace its code with the
+# untraced version so later calls skip the FunctionFrame entirely.
+swapUntracedFunctions = True
+
+# Keep a digest of each run's capture when it finishes, for the first report
+# of the next run to be a diff against it. Off where runs aren't reruns.
+diffReruns = True
+
+# How a run collects its capture, the tracingBackend of a run. "AST" runs the
+# traced code, which calls the capture from every statement. "HOOKS" runs the
+# untraced code and collects the capture from the interpreter's tracing hooks,
+# see hook_tracing.py. Under sys.settrace (before Python 3.12, as in Pyodide)
+# that is about 4x slower than the traced code, so it isn't shipped to the
+# runtime worker and is only imported when used, by run_headless and run_batch.
+TRACING_BACKENDS = ["AST", "HOOKS"]
+
+# A run's budget, counted in steps (loop iterations and function calls) and
+# in seconds, not counting the time spent waiting for input. None (or 0) for
+# no limit. The clock is only read every BUDGET_CHECK_INTERVAL steps.
+stepLimit = None
+timeLimit = None
+BUDGET_CHECK_INTERVAL = 1000
+
+# Holds the place of a top level statement that a scoped run doesn't trace.
+UNTRACED_STATEMENT = {"type": "UNTRACED", "data": {}}
+
+
+def hookName(method):
+    return f"{SPLOOT_KEY}{method}__"
+
+
+def captureHook(method):
+    return ast.Name(id=hookName(method), ctx=ast.Load())
+
+
+def bindCaptureHooks(methods):
+    statements = []
+    for method in methods:
+        key = ast.Name(id=SPLOOT_KEY, ctx=ast.Load())
+        bound = ast.Attribute(value=key, attr=method, ctx=ast.Load())
+        statements.append(ast.Assign([ast.Name(hookName(method), ast.Store())], bound, lineno=1))
+    return statements
+
+
+def loopCaptureHooks(statements):
+    # Hooks called inside a loop are worth binding as locals of the function,
+    # the rest are looked up in the module globals where they are bound once.
+    # Nested function definitions bind their own hooks, so don't look inside them.
+    names = set()
+    pending = [(node, False) for node in statements if not isinstance(node, ast.FunctionDef)]
+    while pending:
+        node, inLoop = pending.pop()
+        if inLoop and isinstance(node, ast.Name):
+            names.add(node.id)
+        inLoop = inLoop or isinstance(node, (ast.For, ast.While))
+        for child in ast.iter_child_nodes(node):
+            if not isinstance(child, ast.FunctionDef):
+                pending.append((child, inLoop))
+    return [method for method in CAPTURE_HOOKS if hookName(method) in names]
+
+
+def budgetCheck():
+    # Goes at the start of every loop body and function, traced or not.
+    return ast.Expr(ast.Call(captureHook("step"), args=[], keywords=[]))
+
+
 def generateArgs(callNode):
     args = []
     keywords = []
@@ -136,148 +265,11 @@ def generateAstAssignableExpression(nodeList):
     return targets[0]
 
 
-def parseLeaf(tokens, currentIndex):
-    if currentIndex >= len(tokens):
-        print("Index out of bounds, attempting to parse leaf")
-        return currentIndex
-
-    lookahead = tokens[currentIndex]
-    if lookahead["type"] == "PYTHON_BINARY_OPERATOR":
-        op = lookahead["properties"]["operator"]
-        if op in UNARY_OPERATORS:
-            # treat RHS as it's own expression, depending on precedence.
-            lhs, index = parseLeaf(tokens, currentIndex + 1)
-            top_expr, index = parseExpression(
-                lhs, tokens, index, getUnaryPrecedence(op)
-            )
-            # Create Unary expression
-            return [ast.UnaryOp(getAstUnaryOperator(op), top_expr), index]
-    return [generateAstExpressionToken(tokens[currentIndex]), currentIndex + 1]
-
-
-UNARY_OPERATORS = {
-    "not": {"precedence": 70, "ast": ast.Not()},
-    "+": {"precedence": 150, "ast": ast.UAdd()},
-    "-": {"precedence": 150, "ast": ast.USub()},
-    "~": {"precedence": 150, "ast": ast.Invert()},  # Bitwise not
-}
-
-OPERATORS = {
-    "or": {"precedence": 50, "ast": ast.Or()},
-    "and": {"precedence": 60, "ast": ast.And()},
-    "==": {"precedence": 80, "ast": ast.Eq()},
-    "!=": {"precedence": 80, "ast": ast.NotEq()},
-    ">=": {"precedence": 80, "ast": ast.GtE()},
-    ">": {"precedence": 80, "ast": ast.Gt()},
-    "<=": {"precedence": 80, "ast": ast.LtE()},
-    "<": {"precedence": 80, "ast": ast.Lt()},
-    "is not": {"precedence": 80, "ast": ast.IsNot()},
-    "is": {"precedence": 80, "ast": ast.Is()},
-    "not in": {"precedence": 80, "ast": ast.NotIn()},
-    "in": {"precedence": 80, "ast": ast.In()},
-    "|": {"precedence": 90, "ast": ast.BitOr()},
-    "^": {"precedence": 100, "ast": ast.BitXor()},
-    "&": {"precedence": 110, "ast": ast.BitAnd()},
-    "<<": {"precedence": 120, "ast": ast.LShift()},
-    ">>": {"precedence": 120, "ast": ast.RShift()},
-    "+": {"precedence": 130, "ast": ast.Add()},
-    "-": {"precedence": 130, "ast": ast.Sub()},
-    "*": {"precedence": 140, "ast": ast.Mult()},
-    "/": {"precedence": 140, "ast": ast.Div()},
-    "//": {"precedence": 140, "ast": ast.FloorDiv()},
-    "%": {"precedence": 140, "ast": ast.Mod()},
-    "@": {"precedence": 140, "ast": ast.MatMult()},
-    "**": {"precedence": 160, "ast": ast.Pow()},
-}
-
-
-def getAstOperator(stringOp):
-    return OPERATORS[stringOp]["ast"]
-
-
-def isBoolOp(stringOp):
-    return stringOp in ["and", "or"]
-
-
-def isCompareOp(stringOp):
-    # Eq | NotEq | Lt | LtE | Gt | GtE | Is | IsNot | In | NotIn
-    return stringOp in {
-        "==",
-        "!=",
-        "<",
-        "<=",
-        ">",
-        ">=",
-        "is",
-        "is not",
-        "in",
-        "not in",
-    }
-
-
-def getAstUnaryOperator(stringOp):
-    return UNARY_OPERATORS[stringOp]["ast"]
-
-
-def getBinaryPrecedence(op):
-    return OPERATORS[op]["precedence"]
-
-
-def getUnaryPrecedence(op):
-    return UNARY_OPERATORS[op]["precedence"]
-
-
-def parseExpression(lhs, tokens, currentIndex, minPrecedence):
-    if currentIndex >= len(tokens):
-        return [lhs, currentIndex]
-
-    lookahead = tokens[currentIndex]
-    while (
-        lookahead is not None
-        and lookahead["type"] == "PYTHON_BINARY_OPERATOR"
-        and getBinaryPrecedence(lookahead["properties"]["operator"]) >= minPrecedence
-    ):
-        operator = lookahead["properties"]["operator"]
-        operatorPrecedence = getBinaryPrecedence(operator)
-        currentIndex += 1
-        rhs, currentIndex = parseLeaf(tokens, currentIndex)
-        if currentIndex < len(tokens):
-            lookahead = tokens[currentIndex]
-            while (
-                lookahead is not None
-                and lookahead["type"] == "PYTHON_BINARY_OPERATOR"
-                and getBinaryPrecedence(lookahead["properties"]["operator"]) > operatorPrecedence
-            ):
-                lookaheadOp = lookahead["properties"]["operator"]
-                [rhs, currentIndex] = parseExpression(
-                    rhs, tokens, currentIndex, getBinaryPrecedence(lookaheadOp)
-                )
-                if currentIndex < len(tokens):
-                    lookahead = tokens[currentIndex]
-                else:
-                    lookahead = None
-        else:
-            lookahead = None
-        if isBoolOp(operator):
-            lhs = ast.BoolOp(getAstOperator(operator), [lhs, rhs])
-        elif isCompareOp(operator):
-            if isinstance(lhs, ast.Compare):
-                lhs.ops.append(getAstOperator(operator))
-                lhs.comparators.append(rhs)
-            else:
-                lhs = ast.Compare(lhs, [getAstOperator(operator)], [rhs])
-        else:
-            lhs = ast.BinOp(lhs, getAstOperator(operator), rhs)
-    return [lhs, currentIndex]
-
-
 def generateAstExpression(exp_node):
     tokens = exp_node["childSets"]["tokens"]
     if len(tokens) == 0:
         return None
-    lhs, index = parseLeaf(tokens, 0)
-    top_expr, _ = parseExpression(lhs, tokens, index, 0)
-    return top_expr
+    return buildExpression(tokens, generateAstExpressionToken)
 
 
 def generateAstExpressionStatement(exp_node, traced, lineno):
@@ -289,8 +281,7 @@ def generateAstExpressionStatement(exp_node, traced, lineno):
         expr = ast.Expr(value=top_expr, lineno=lineno, col_offset=0)
         return expr
 
-    key = ast.Name(id=SPLOOT_KEY, ctx=ast.Load())
-    func = ast.Attribute(value=key, attr="logExpressionResult", ctx=ast.Load())
+    func = captureHook("logExpressionResult")
     args = [ast.Constant("PYTHON_EXPRESSION"), ast.Dict([], []), top_expr]
     wrapped = ast.Call(func, args=args, keywords=[])
     expr = ast.Expr(value=wrapped, lineno=lineno, col_offset=0)
@@ -303,8 +294,7 @@ def generateAssignmentStatement(assign_node, traced, lineno):
     if not traced:
         return ast.Assign([target], value, lineno=lineno)
 
-    key = ast.Name(id=SPLOOT_KEY, ctx=ast.Load())
-    func = ast.Attribute(value=key, attr="logExpressionResult", ctx=ast.Load())
+    func = captureHook("logExpressionResult")
     args = [ast.Constant("PYTHON_ASSIGNMENT"), ast.Dict([], []), value]
     wrapped = ast.Call(func, args=args, keywords=[])
     return ast.Assign([target], wrapped, lineno=lineno)
@@ -328,10 +318,7 @@ def generateIfStatementFromElif(elif_node, else_nodes, traced):
         lineno = elif_node['meta']['lineno']
 
     if traced:
-        key = ast.Name(id=SPLOOT_KEY, ctx=ast.Load())
-        func = ast.Attribute(
-            value=key, attr="logExpressionResultAndStartFrame", ctx=ast.Load()
-        )
+        func = captureHook("logExpressionResultAndStartFrame")
         args = [
             ast.Constant("PYTHON_ELIF_STATEMENT"),
             ast.Constant("condition"),
@@ -346,20 +333,17 @@ def generateIfStatementFromElif(elif_node, else_nodes, traced):
         else_statements = generateElifNestedChain(else_nodes, traced)
 
     if traced:
-        key = ast.Name(id=SPLOOT_KEY, ctx=ast.Load())
-        func = ast.Attribute(value=key, attr="endFrame", ctx=ast.Load())
+        func = captureHook("endFrame")
         call_end_frame = ast.Call(func, args=[], keywords=[])
 
         # End the elif frame before starting the next else/elif block
         else_statements.insert(0, ast.Expr(call_end_frame, lineno=1, col_offset=0))
 
-        key = ast.Name(id=SPLOOT_KEY, ctx=ast.Load())
-        func = ast.Attribute(value=key, attr="startChildSet", ctx=ast.Load())
+        func = captureHook("startChildSet")
         args = [ast.Constant("block")]
         call_start_childset = ast.Call(func, args=args, keywords=[])
 
-        key = ast.Name(id=SPLOOT_KEY, ctx=ast.Load())
-        func = ast.Attribute(value=key, attr="endFrame", ctx=ast.Load())
+        func = captureHook("endFrame")
         call_end_frame = ast.Call(func, args=[], keywords=[])
 
         statements.insert(0, ast.Expr(call_start_childset, lineno=1, col_offset=0))
@@ -388,8 +372,7 @@ def generateElseStatement(else_node, traced):
     if not traced:
         return statements
 
-    key = ast.Name(id=SPLOOT_KEY, ctx=ast.Load())
-    func = ast.Attribute(value=key, attr="startFrame", ctx=ast.Load())
+    func = captureHook("startFrame")
     else_start_frame = ast.Call(
         func,
         args=[
@@ -400,8 +383,7 @@ def generateElseStatement(else_node, traced):
     )
     statements.insert(0, ast.Expr(else_start_frame, lineno=1, col_offset=0))
 
-    key = ast.Name(id=SPLOOT_KEY, ctx=ast.Load())
-    func = ast.Attribute(value=key, attr="endFrame", ctx=ast.Load())
+    func = captureHook("endFrame")
     call_end_frame = ast.Call(func, args=[], keywords=[])
     statements.append(ast.Expr(call_end_frame, lineno=1, col_offset=0))
 
@@ -413,12 +395,11 @@ def generateFromImportStatement(import_node, traced, lineno):
     for attrNode in import_node['childSets']['attrs']:
         attrNames.append(ast.alias(attrNode['properties']['identifier']))
 
-    statements = [ast.ImportFrom(moduleName, attrNames, 0)]
+    statements = [ast.ImportFrom(moduleName, attrNames, 0, lineno=lineno)]
     if not traced:
         return statements
 
-    key = ast.Name(id=SPLOOT_KEY, ctx=ast.Load())
-    func = ast.Attribute(value=key, attr="startFrame", ctx=ast.Load())
+    func = captureHook("startFrame")
     import_start_frame = ast.Call(
         func,
         args=[
@@ -429,8 +410,7 @@ def generateFromImportStatement(import_node, traced, lineno):
     )
     statements.insert(0, ast.Expr(import_start_frame, lineno=lineno, col_offset=0))
 
-    key = ast.Name(id=SPLOOT_KEY, ctx=ast.Load())
-    func = ast.Attribute(value=key, attr="endFrame", ctx=ast.Load())
+    func = captureHook("endFrame")
     call_end_frame = ast.Call(func, args=[], keywords=[])
     statements.append(ast.Expr(call_end_frame, lineno=1, col_offset=0))
     return statements
@@ -441,12 +421,11 @@ def generateImportStatement(import_node, traced, lineno):
     for moduleName in moduleNames:
         aliases.append(ast.alias(moduleName['properties']['identifier']))
 
-    statements = [ast.Import(aliases)]
+    statements = [ast.Import(aliases, lineno=lineno)]
     if not traced:
         return statements
 
-    key = ast.Name(id=SPLOOT_KEY, ctx=ast.Load())
-    func = ast.Attribute(value=key, attr="startFrame", ctx=ast.Load())
+    func = captureHook("startFrame")
     import_start_frame = ast.Call(
         func,
         args=[
@@ -457,8 +436,7 @@ def generateImportStatement(import_node, traced, lineno):
     )
     statements.insert(0, ast.Expr(import_start_frame, lineno=lineno, col_offset=0))
 
-    key = ast.Name(id=SPLOOT_KEY, ctx=ast.Load())
-    func = ast.Attribute(value=key, attr="endFrame", ctx=ast.Load())
+    func = captureHook("endFrame")
     call_end_frame = ast.Call(func, args=[], keywords=[])
     statements.append(ast.Expr(call_end_frame, lineno=1, col_offset=0))
     return statements
@@ -467,10 +445,7 @@ def generateIfStatement(if_node, traced, lineno):
     condition = generateAstExpression(if_node["childSets"]["condition"][0])
 
     if traced:
-        key = ast.Name(id=SPLOOT_KEY, ctx=ast.Load())
-        func = ast.Attribute(
-            value=key, attr="logExpressionResultAndStartFrame", ctx=ast.Load()
-        )
+        func = captureHook("logExpressionResultAndStartFrame")
         args = [
             ast.Constant("PYTHON_IF_STATEMENT"),
             ast.Constant("condition"),
@@ -487,7 +462,7 @@ def generateIfStatement(if_node, traced, lineno):
             else_statements.insert(0, startChildSetStatement('elseblocks'))
 
     if not traced:
-        return [ast.If(condition, statements, else_statements)]
+        return [ast.If(condition, statements, else_statements, lineno=lineno)]
 
     statements.insert(0, startChildSetStatement('trueblock'))
     return [
@@ -497,8 +472,7 @@ def generateIfStatement(if_node, traced, lineno):
 
 
 def startFrameStatement(nodeType, childSetName):
-    key = ast.Name(id=SPLOOT_KEY, ctx=ast.Load())
-    func = ast.Attribute(value=key, attr="startFrame", ctx=ast.Load())
+    func = captureHook("startFrame")
     start_frame = ast.Call(
         func,
         args=[
@@ -511,10 +485,7 @@ def startFrameStatement(nodeType, childSetName):
 
 
 def logExpressionResultAndStartFrame(nodeType, childSet, expr):
-    key = ast.Name(id=SPLOOT_KEY, ctx=ast.Load())
-    func = ast.Attribute(
-        value=key, attr="logExpressionResultAndStartFrame", ctx=ast.Load()
-    )
+    func = captureHook("logExpressionResultAndStartFrame")
     args = [
         ast.Constant(nodeType),
         ast.Constant(childSet),
@@ -530,21 +501,18 @@ def iterableLogExpressionResultAndStartFrame(nodeType, childset, iterable):
     return ast.Call(ast.Name('map', ast.Load()), args=[mapFunc, iterable], keywords=[])
 
 def endFrame():
-    key = ast.Name(id=SPLOOT_KEY, ctx=ast.Load())
-    func = ast.Attribute(value=key, attr="endFrame", ctx=ast.Load())
+    func = captureHook("endFrame")
     call_end_frame = ast.Call(func, args=[], keywords=[])
     return ast.Expr(call_end_frame, lineno=1, col_offset=0)
 
 def endLoop():
-    key = ast.Name(id=SPLOOT_KEY, ctx=ast.Load())
-    func = ast.Attribute(value=key, attr="endLoop", ctx=ast.Load())
+    func = captureHook("endLoop")
     call_end_frame = ast.Call(func, args=[], keywords=[])
     return ast.Expr(call_end_frame, lineno=1, col_offset=0)
 
 
 def startChildSetStatement(childSetName):
-    key = ast.Name(id=SPLOOT_KEY, ctx=ast.Load())
-    func = ast.Attribute(value=key, attr="startChildSet", ctx=ast.Load())
+    func = captureHook("startChildSet")
     args = [ast.Constant(childSetName)]
     call_start_childset = ast.Call(func, args=args, keywords=[])
     return ast.Expr(call_start_childset, lineno=1, col_offset=0)
@@ -556,9 +524,7 @@ def generateForStatement(for_node, traced, lineno):
     if traced:
         iterable = iterableLogExpressionResultAndStartFrame('PYTHON_FOR_LOOP_ITERATION', 'iterable', iterable)
 
-    blockStatements = getStatementsFromBlock(for_node["childSets"]["block"], traced)
-    if len(blockStatements) == 0:
-        blockStatements = [ast.Pass()]
+    blockStatements = [budgetCheck()] + getStatementsFromBlock(for_node["childSets"]["block"], traced)
 
     if not traced:
         return [ast.For(target, iterable, blockStatements, [], lineno=lineno)]
@@ -577,10 +543,7 @@ def generateWhileStatement(while_node, traced, lineno):
     condition = generateAstExpression(while_node["childSets"]["condition"][0])
 
     if traced:
-        key = ast.Name(id=SPLOOT_KEY, ctx=ast.Load())
-        func = ast.Attribute(
-            value=key, attr="logExpressionResultAndStartFrame", ctx=ast.Load()
-        )
+        func = captureHook("logExpressionResultAndStartFrame")
         args = [
             ast.Constant("PYTHON_WHILE_LOOP_ITERATION"),
             ast.Constant("condition"),
@@ -588,9 +551,9 @@ def generateWhileStatement(while_node, traced, lineno):
         ]
         condition = ast.Call(func, args=args, keywords=[])
 
-    statements = getStatementsFromBlock(while_node["childSets"]["block"], traced)
+    statements = [budgetCheck()] + getStatementsFromBlock(while_node["childSets"]["block"], traced)
     if not traced:
-        return statements
+        return [ast.While(condition, statements, [], lineno=lineno)]
 
     statements.insert(0, startChildSetStatement('block'))
     statements.append(endFrame())
@@ -615,10 +578,7 @@ def generateFunctionArguments(arg_list):
         defaults=[])
 
 def generateTracedFunctionBlock(func_id, block_nodes):
-    key = ast.Name(id=SPLOOT_KEY, ctx=ast.Load())
-    func = ast.Attribute(
-        value=key, attr="func", ctx=ast.Load()
-    )
+    func = captureHook("func")
     args = [
         ast.Constant(func_id)
     ]
@@ -632,21 +592,74 @@ def generateTracedFunctionBlock(func_id, block_nodes):
 
     with_node = ast.With([ast.withitem(ast.Name('t', ast.Load()))], [if_node])
 
-    return [assign_node, with_node]
+    # The budget check is also in the loops of the untraced statements, so
+    # the hooks are bound before either runs.
+    hooks = bindCaptureHooks(loopCaptureHooks(traced_statements + statements))
+    return hooks + [budgetCheck(), assign_node, with_node]
+
+
+def generateUntracedFunctionBlock(func_id, block_nodes):
+    # Body for the code that replaces a traced function once it has used up its
+    # captured frames. It only keeps the call count and the frame number of
+    # exceptions up to date, like FunctionFrame does for uncaptured calls.
+    frameno = ast.Name(f'{SPLOOT_KEY}frameno__', ast.Load())
+    exception = f'{SPLOOT_KEY}exception__'
+    count = ast.Subscript(captureHook("detachedFramesCount"), ast.Constant(func_id), ast.Load())
+    countStore = ast.Subscript(captureHook("detachedFramesCount"), ast.Constant(func_id), ast.Store())
+
+    record_exception = ast.Call(captureHook("addExceptionFrame"), args=[
+        ast.Constant(func_id),
+        frameno,
+        ast.Attribute(
+            ast.Attribute(ast.Name(exception, ast.Load()), '__traceback__', ast.Load()),
+            'tb_lineno',
+            ast.Load(),
+        ),
+        ast.Name(exception, ast.Load()),
+    ], keywords=[])
+    handler = ast.ExceptHandler(ast.Name('BaseException', ast.Load()), exception, [
+        ast.Expr(record_exception),
+        ast.Raise(),
+    ])
+
+    return [
+        budgetCheck(),
+        ast.Assign([ast.Name(frameno.id, ast.Store())], count),
+        ast.Assign([countStore], ast.BinOp(frameno, ast.Add(), ast.Constant(1))),
+        ast.Try(getStatementsFromBlock(block_nodes, False), [handler], [], []),
+    ]
 
 def generateFunctionStatement(func_node, traced, lineno):
+    key = (hashSubtree(func_node), lineno, traced)
+    return getCachedStatements(key, lambda: generateFunctionDef(func_node, traced, lineno))
+
+
+def generateFunctionDef(func_node, traced, lineno):
     nameIdentifier = func_node['childSets']['identifier'][0]['properties']['identifier']
     func_id = func_node['properties']['id']
     decorators = [generateAstExpression(dec['childSets']['expression'][0]) for dec in func_node['childSets']['decorators']]
 
-    if traced:
-        statements = generateTracedFunctionBlock(func_id, func_node["childSets"]["body"])
-    else:
-        statements = getStatementsFromBlock(func_node["childSets"]["body"], traced)
-
+    if not traced:
+        statements = [budgetCheck()] + getStatementsFromBlock(func_node["childSets"]["body"], traced)
+        funcArgs = generateFunctionArguments(func_node['childSets']['params'])
+        return [ast.FunctionDef(nameIdentifier, funcArgs, statements, decorators, lineno=lineno)]
+
+    # The untraced version is defined first under the same name, so that it
+    # has the same name and closure, and handed to the traced version.
+    untraced_statements = generateUntracedFunctionBlock(func_id, func_node["childSets"]["body"])
+    untraced = ast.FunctionDef(nameIdentifier, generateFunctionArguments(func_node['childSets']['params']),
+                               untraced_statements, [], lineno=lineno)
+
+    register = ast.Call(captureHook("untracedFunction"), args=[
+        ast.Constant(func_id),
+        ast.Name(nameIdentifier, ast.Load()),
+    ], keywords=[])
+    statements = generateTracedFunctionBlock(func_id, func_node["childSets"]["body"])
     funcArgs = generateFunctionArguments(func_node['childSets']['params'])
-
-    return [ast.FunctionDef(nameIdentifier, funcArgs, statements, decorators, lineno=lineno)]
+    return [
+        untraced,
+        ast.FunctionDef(nameIdentifier, funcArgs, statements, decorators + [register], lineno=lineno),
+    ]
 
 
 def generateReturnStatement(return_node, traced, lineno):
@@ -657,8 +670,7 @@ def generateReturnStatement(return_node, traced, lineno):
     if not traced:
         return [ast.Return(ret_expr, lineno=lineno)]
 
-    key = ast.Name(id=SPLOOT_KEY, ctx=ast.Load())
-    func = ast.Attribute(value=key, attr="logExpressionResult", ctx=ast.Load())
+    func = captureHook("logExpressionResult")
     args = [ast.Constant("PYTHON_RETURN"), ast.Dict([], []), ret_expr]
     wrapped = ast.Call(func, args=args, keywords=[])
     return [
@@ -727,7 +739,91 @@ def generateAstStatementContents(sploot_node, traced, lineno):
         return None
 
 
+# Results are recorded as tuples of (node type, preview, result type, length,
+# side effects, extra data) and frames as the CaptureContext itself. Both are
+# only turned into the JSON shape the editor reads when the capture is serialised.
+def serializeEntry(entry):
+    if type(entry) is tuple:
+        nodetype, preview, resultType, length, sideEffects, extra = entry
+        data = {"result": preview, "resultType": resultType}
+        if length is not None:
+            data["resultLength"] = length
+        if extra:
+            data.update(extra)
+        res = {"data": data}
+        if nodetype:
+            res["type"] = nodetype
+        if sideEffects:
+            res["sideEffects"] = [serializeSideEffect(sideEffect) for sideEffect in sideEffects]
+        return res
+    if type(entry) is dict:
+        return entry
+    return entry.toDict()
+
+
+def serializeSideEffect(sideEffect):
+    if type(sideEffect) is StdoutRange:
+        return sideEffect.toDict()
+    return sideEffect
+
+
+class StdoutBuffer:
+    # All the stdout kept for a run. Side effects refer to ranges of it
+    # instead of holding their own copies of the text. The writes are kept
+    # as they are, with where each starts, so a range is read from only the
+    # writes it covers.
+    def __init__(self):
+        self.parts = []
+        self.starts = []
+        self.size = 0
+
+    def write(self, text):
+        self.parts.append(text)
+        self.starts.append(self.size)
+        self.size += len(text)
+
+    def slice(self, start, end):
+        if start == end:
+            return ""
+        first = bisect_right(self.starts, start) - 1
+        last = bisect_left(self.starts, end, first)
+        offset = start - self.starts[first]
+        return "".join(self.parts[first:last])[offset:offset + end - start]
+
+    def text(self):
+        return "".join(self.parts)
+
+
+class StdoutRange:
+    # The stdout written by one statement, adjacent writes are coalesced into it.
+    __slots__ = ("buffer", "start", "end", "elided")
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.start = buffer.size
+        self.end = buffer.size
+        self.elided = 0
+
+    def write(self, text):
+        room = min(STATEMENT_STDOUT_LIMIT - (self.end - self.start), RUN_STDOUT_LIMIT - self.buffer.size)
+        if len(text) > room:
+            self.elided += len(text) - max(room, 0)
+            text = text[:max(room, 0)]
+        if text:
+            self.buffer.write(text)
+            self.end += len(text)
+        return len(text)
+
+    def toDict(self):
+        res = {"type": "stdout", "value": self.buffer.slice(self.start, self.end)}
+        if self.elided:
+            res["elided"] = self.elided
+        return res
+
+
 class CaptureContext:
+    __slots__ = ("type", "blocks", "childset")
+
     def __init__(self, type, childset):
         self.type = type
         self.blocks = {childset: []}
@@ -738,12 +834,7 @@ class CaptureContext:
         if childset not in self.blocks:
             self.blocks[childset] = []
 
-    def addStatementResult(self, type, data, sideEffects):
-        res = {"data": data}
-        if type:
-            res["type"] = type
-        if sideEffects:
-            res["sideEffects"] = sideEffects
+    def appendResult(self, res):
         self.blocks[self.childset].append(res)
 
     def addExceptionResult(self, exceptionType, message, inFunction=None):
@@ -754,32 +845,392 @@ class CaptureContext:
             }
         if inFunction:
             exception_details["exceptionInFunction"] = inFunction
-        self.blocks[self.childset].append(exception_details)
+        self.appendResult(exception_details)
 
-    def checkFrameLimit(self):
-        if iterationLimit and len(self.blocks[self.childset]) > iterationLimit:
-            raise Exception('Too many iterations.')
+    def serializeBlocks(self, serialize=serializeEntry):
+        return {childset: [serialize(entry) for entry in entries] for childset, entries in self.blocks.items()}
+
+    def reportedCounts(self):
+        return {childset: len(entries) for childset, entries in self.blocks.items()}
+
+    def entriesSince(self, counts):
+        # Yields (childset, new entries, loop sampling) for everything added
+        # after reportedCounts() returned counts.
+        for childset, entries in self.blocks.items():
+            start = counts.get(childset, 0)
+            if len(entries) > start:
+                yield childset, entries[start:], None
 
     def toDict(self):
         return {
             "type": self.type,
-            "data": self.blocks,
+            "data": self.serializeBlocks(),
         }
 
 
+def iterationSampleSize():
+    return max(1, (iterationLimit or DEFAULT_ITERATION_LIMIT) // 2)
+
+
+class LoopCaptureContext(CaptureContext):
+    # Keeps the first and the last iterations of a loop. The ones in between
+    # are only counted, so a long running loop uses a bounded amount of memory.
+    __slots__ = ("sampleSize", "count", "tail", "elided")
+
+    def __init__(self, type, childset, sampleSize=None):
+        super().__init__(type, childset)
+        self.sampleSize = sampleSize or iterationSampleSize()
+        self.count = 0
+        self.tail = deque(maxlen=self.sampleSize)
+        self.elided = 0
+
+    def appendResult(self, res):
+        self.count += 1
+        if self.count <= self.sampleSize:
+            self.blocks[self.childset].append(res)
+            return
+        if len(self.tail) == self.sampleSize:
+            self.elided += 1
+        self.tail.append(res)
+
+    def serializeBlocks(self, serialize=serializeEntry):
+        blocks = super().serializeBlocks(serialize)
+        frames = blocks[self.childset]
+        if self.elided:
+            frames.append({"type": "ELIDED_ITERATIONS", "data": {"count": self.elided}})
+        frames.extend(serialize(entry) for entry in self.tail)
+        return blocks
+
+    def reportedCounts(self):
+        return {self.childset: self.count}
+
+    def entriesSince(self, counts):
+        # The receiver keeps the first sampleSize entries, and the last
+        # sampleSize of the rest once anything has been elided.
+        reported = counts[self.childset]
+        if self.count == reported:
+            return
+        entries = self.blocks[self.childset][reported:]
+        newInTail = min(self.count - max(reported, self.sampleSize), len(self.tail))
+        if newInTail > 0:
+            entries.extend(list(self.tail)[-newInTail:])
+        yield self.childset, entries, [self.sampleSize, self.elided]
+
+
+class FunctionCallContext(CaptureContext):
+    __slots__ = ("frameno", "size", "nestedSize", "finished", "raised")
+
+    def __init__(self, childset, frameno, start):
+        super().__init__("PYTHON_FUNCTION_CALL", childset)
+        self.frameno = frameno
+        # The capture's size when the call started, and once it has ended
+        # the size of what it recorded itself, without the calls it made.
+        self.size = start
+        self.nestedSize = 0
+        self.finished = False
+        self.raised = False
+
+    def serializeBlocks(self, serialize=serializeEntry):
+        blocks = super().serializeBlocks(serialize)
+        blocks["frameno"] = self.frameno
+        return blocks
+
+
+class DetachedFrames:
+    # The captured calls of one function that are kept: the first
+    # FUNCTION_FIRST_FRAMES, the last FUNCTION_LAST_FRAMES and up to
+    # FUNCTION_RAISED_FRAMES of the others that raised. A call is let go of
+    # once it has ended and FUNCTION_LAST_FRAMES calls have started after it,
+    # so with deep recursion the innermost calls are the ones kept.
+    # depths counts the calls by how many captured calls of the function were
+    # already running when they started.
+    __slots__ = ("frames", "latest", "running", "raised", "depths")
+
+    def __init__(self):
+        self.frames = {}
+        self.latest = -1
+        self.running = 0
+        self.raised = 0
+        self.depths = []
+
+    def start(self, context):
+        # Returns the size of the frames that were let go of.
+        depth = self.running
+        if depth == len(self.depths):
+            self.depths.append(1)
+        else:
+            self.depths[depth] += 1
+        self.running = depth + 1
+        self.frames[context.frameno] = context
+        self.latest = context.frameno
+        return self.evict(context.frameno - FUNCTION_LAST_FRAMES)
+
+    def end(self, context, raised):
+        self.running -= 1
+        context.finished = True
+        context.raised = raised
+        if context.frameno <= self.latest - FUNCTION_LAST_FRAMES:
+            return self.evict(context.frameno)
+        return 0
+
+    def evict(self, frameno):
+        context = self.frames.get(frameno)
+        if context is None or not context.finished or frameno < FUNCTION_FIRST_FRAMES:
+            return 0
+        if context.raised and self.raised < FUNCTION_RAISED_FRAMES:
+            self.raised += 1
+            return 0
+        del self.frames[frameno]
+        return context.size
+
+
+# A diff against the previous run is given up on once it has this many
+# operations, or comes to more than this fraction of the whole capture.
+MAX_DIFF_OPS = 1000
+MAX_DIFF_SIZE = 0.5
+# Dicts and lists of a capture's digest with fewer values than this in them,
+# all the way down, only keep their hash.
+DIGEST_MIN_SIZE = 64
+
+
+def digestValue(value):
+    # Returns the digest of a dict or list, and the number of values in it.
+    # The digest is its hash, with the digests of its items as
+    # (hash, {key: digest}) or (hash, [digest]) when it holds at least
+    # DIGEST_MIN_SIZE values. Leaves are hashed with their type, other than
+    # strings, by repr() so that -1 and -2 or 1 and True don't collide.
+    size = 1
+    hashes = []
+    if type(value) is dict:
+        children = {}
+        for key, item in value.items():
+            itemType = type(item)
+            if itemType is dict or itemType is list:
+                child, itemSize = digestValue(item)
+                size += itemSize
+                itemHash = child if type(child) is int else child[0]
+            else:
+                child = itemHash = hash(item) if itemType is str else hash((itemType, repr(item)))
+            children[key] = child
+            hashes.append((key, itemHash))
+        valueHash = hash(tuple(hashes))
+    else:
+        children = []
+        for item in value:
+            itemType = type(item)
+            if itemType is dict or itemType is list:
+                child, itemSize = digestValue(item)
+                size += itemSize
+                itemHash = child if type(child) is int else child[0]
+            else:
+                child = itemHash = hash(item) if itemType is str else hash((itemType, repr(item)))
+            children.append(child)
+            hashes.append(itemHash)
+        valueHash = hash((list, tuple(hashes)))
+    return ((valueHash, children) if size >= DIGEST_MIN_SIZE else valueHash), size
+
+
+def digestCapture(cap):
+    # What is kept of a finished run's capture to diff the next run's against:
+    # about a tenth of the size of the capture.
+    return digestValue(cap)[0]
+
+
+def addDiffOp(op, ops, budget):
+    budget[0] -= len(json.dumps(op))
+    ops.append(op)
+    return budget[0] >= 0 and len(ops) <= MAX_DIFF_OPS
+
+
+def diffCapture(old, new, newDigest, path, ops, budget):
+    # Appends the operations that turn the value old is the digest of into
+    # new to ops. Only the parts of the tree whose hashes differ are visited,
+    # and replaced whole where old doesn't have the digests of their items.
+    # budget is a list holding the characters of JSON the operations can
+    # still take, returns False as soon as they go over it or over
+    # MAX_DIFF_OPS, with ops left unfinished.
+    if type(old) is not tuple or type(newDigest) is not tuple or type(old[1]) is not type(newDigest[1]):
+        return addDiffOp(["set", path, new], ops, budget)
+    oldItems = old[1]
+    newItems = newDigest[1]
+    if type(oldItems) is dict:
+        if "id" in new and "id" not in oldItems:
+            if not addDiffOp(["id", path, new["id"]], ops, budget):
+                return False
+        for key, value in new.items():
+            if key == "id":
+                continue
+            if key not in oldItems:
+                if not addDiffOp(["set", path + [key], value], ops, budget):
+                    return False
+            elif digestHash(oldItems[key]) != digestHash(newItems[key]):
+                if not diffCapture(oldItems[key], value, newItems[key], path + [key], ops, budget):
+                    return False
+        for key in oldItems:
+            if key not in new:
+                if not addDiffOp(["del", path + [key]], ops, budget):
+                    return False
+        return True
+    for i in range(min(len(oldItems), len(new))):
+        if digestHash(oldItems[i]) != digestHash(newItems[i]):
+            if not diffCapture(oldItems[i], new[i], newItems[i], path + [i], ops, budget):
+                return False
+    if len(new) > len(oldItems):
+        return addDiffOp(["extend", path, new[len(oldItems):]], ops, budget)
+    if len(new) < len(oldItems):
+        return addDiffOp(["trim", path, len(new)], ops, budget)
+    return True
+
+
+def digestHash(digest):
+    return digest if type(digest) is int else digest[0]
+
+
+class CaptureReporter:
+    # Reports a capture while the program is still running. The first report
+    # is the whole capture, later ones only hold what was added since, as
+    # appends to the frames that were running at the previous report. Frames
+    # that are running when reported get an "id" for those appends to refer to.
+    #
+    # When the digest of the previous run's capture is given, the first
+    # report is a diff against it if that is at most MAX_DIFF_SIZE of the
+    # whole capture.
+    def __init__(self, capture, previous=None):
+        self.capture = capture
+        self.previous = previous
+        self.reported = False
+        self.nextId = 0
+        self.running = set()
+        # id(context) -> (frame id, context, reported counts)
+        self.openFrames = {}
+        # func_id -> (call count, frame numbers) as last reported
+        self.reportedFrames = {}
+
+    def serializeEntry(self, entry):
+        if isinstance(entry, CaptureContext):
+            return self.serializeFrame(entry)
+        return serializeEntry(entry)
+
+    def serializeFrame(self, context):
+        frame = {"type": context.type, "data": context.serializeBlocks(self.serializeEntry)}
+        if id(context) in self.running:
+            frame["id"] = self.nextId
+            self.openFrames[id(context)] = (self.nextId, context, context.reportedCounts())
+            self.nextId += 1
+        return frame
+
+    def serializeDetached(self):
+        # The calls kept since the previous report, and the frame numbers of
+        # reported calls that have been let go of since in "evicted".
+        detached = {}
+        capture = self.capture
+        for func_id, retained in capture.detachedFrames.items():
+            count = capture.detachedFramesCount[func_id]
+            frames = retained.frames
+            evicted = None
+            if func_id in self.reportedFrames:
+                reportedCount, reported = self.reportedFrames[func_id]
+                new = [context for frameno, context in frames.items() if frameno not in reported]
+                evicted = [frameno for frameno in reported if frameno not in frames]
+                if count == reportedCount and not new and not evicted:
+                    continue
+            else:
+                new = frames.values()
+            detached[func_id] = {
+                "count": count,
+                "frames": [self.serializeFrame(context) for context in new],
+                "depths": list(retained.depths),
+            }
+            if evicted:
+                detached[func_id]["evicted"] = evicted
+            self.reportedFrames[func_id] = (count, set(frames))
+        return detached
+
+    def report(self):
+        capture = self.capture
+        self.running = set(id(context) for context in capture.stack)
+        if not self.reported:
+            cap = {"root": self.serializeFrame(capture.root)}
+        else:
+            openFrames = self.openFrames
+            self.openFrames = {}
+            appends = []
+            for frameId, context, counts in openFrames.values():
+                for childset, entries, sampling in context.entriesSince(counts):
+                    append = [frameId, childset, [self.serializeEntry(entry) for entry in entries]]
+                    if sampling:
+                        append.extend(sampling)
+                    appends.append(append)
+                if id(context) in self.running:
+                    self.openFrames[id(context)] = (frameId, context, context.reportedCounts())
+            cap = {"delta": True, "appends": appends}
+        cap["detached"] = self.serializeDetached()
+        if capture.degradeLevel:
+            cap["truncated"] = True
+        if capture.lastException:
+            cap["lastException"] = capture.lastException
+        if capture.budgetExceeded:
+            cap["budgetExceeded"] = capture.budgetExceeded
+        if capture.profile:
+            cap["profile"] = capture.profile
+        if capture.memory:
+            cap["memory"] = capture.memory
+        if capture.callgraph:
+            cap["callgraph"] = capture.callgraph
+        if not self.reported and self.previous is not None:
+            cap = self.diffPrevious(cap)
+        self.reported = True
+        return cap
+
+    def diffPrevious(self, cap):
+        previous = self.previous
+        self.previous = None
+        digest = digestCapture(cap)
+        if type(previous) is not tuple or type(digest) is not tuple:
+            # A small capture is sent whole.
+            return cap
+        ops = []
+        # The capture's estimated size stands in for the size of its JSON, the
+        # diff's size is counted as its operations are added.
+        budget = [int(self.capture.captureSize * MAX_DIFF_SIZE)]
+        if diffCapture(previous, cap, digest, [], ops, budget):
+            return {"diff": True, "ops": ops}
+        return cap
+
+
+def swapFunctionCode(function, code):
+    # A traced function nested in a function that binds capture hooks as locals
+    # closes over them, the untraced code doesn't, so those keep the traced code.
+    if function.__code__.co_freevars == code.co_freevars:
+        function.__code__ = code
+
+
+class BudgetExceeded(BaseException):
+    # A BaseException, so that the program's own `except Exception` doesn't stop it.
+    def __init__(self, limit, steps, seconds):
+        self.limit = limit
+        self.steps = steps
+        self.seconds = seconds
+        if limit == "steps":
+            message = f"Stopped after {steps} steps"
+        else:
+            message = f"Stopped after running for {seconds:.1f} seconds"
+        super().__init__(message)
+
+    def toDict(self):
+        return {"limit": self.limit, "steps": self.steps, "seconds": self.seconds}
+
+
 class FunctionFrame:
-    def __init__(self, capture, frame_no, func_id):
+    def __init__(self, capture, frame_no, func_id, cap):
         self.capture = capture
         self.func_id = func_id
         self.frame_no = frame_no
-        if frame_no > 100:
-            self.cap = False
-        else:
-            self.cap = True
+        self.cap = cap
 
     def __enter__(self):
         if self.cap:
-            self.capture.startDetachedFrame("PYTHON_FUNCTION_CALL", "body", self.func_id)
+            self.capture.startCall(self.func_id, self.frame_no)
 
     def __exit__(self, exc_type, exc_value, exc_tb):
         if exc_type:
@@ -788,26 +1239,108 @@ class FunctionFrame:
             self.capture.addExceptionFrame(self.func_id, self.frame_no, exc_tb.tb_lineno, exc_value)
 
         if self.cap:
-            self.capture.endFrameType("PYTHON_FUNCTION_CALL")
+            self.capture.endCall(self.func_id, exc_type is not None)
 
 
 class SplootCapture:
     def __init__(self):
         self.root = CaptureContext("PYTHON_FILE", "body")
         self.stack = [self.root]
+        self.calls = []
         self.detachedFrames = {}
         self.detachedFramesCount = {}
         self.detachedFramesException = {}
         self.sideEffects = []
+        self.stdout = StdoutBuffer()
         self.lastException = None
+        self.untracedFunctions = {}
+        self.captureSize = 0
+        # Size of the calls that were let go of, see DetachedFrames.
+        self.evictedSize = 0
+        self.degradeLevel = 0
+        self.nextDegradeSize = CAPTURE_SIZE_LIMIT * CAPTURE_DEGRADE_STEPS[0]
+        self.recording = True
+        self.previewLimit = None
+        self.loopSampleSize = None
+        self.budgetExceeded = None
+        # The statement timings of a profiled run, see statement_profiler.py,
+        # the memory used by its statements, see allocation_profiler.py, or
+        # its functions' call graph, see call_profiler.py.
+        self.profile = None
+        self.memory = None
+        self.callgraph = None
+        self.startTime = time.monotonic()
+        self.pausedTime = 0
+        # Called at every loop iteration and function call, so it's the C level
+        # next() of an iterator, which only runs checkBudget once per interval.
+        self.step = chain.from_iterable(self.checkBudget()).__next__
 
     def func(self, func_id):
-        self.detachedFrames.setdefault(func_id, [])
-        self.detachedFramesCount.setdefault(func_id, 0)
-        frames = self.detachedFrames[func_id]
-        frameno =  self.detachedFramesCount[func_id]
+        if func_id not in self.detachedFrames:
+            self.detachedFrames[func_id] = DetachedFrames()
+            self.detachedFramesCount.setdefault(func_id, 0)
+        frameno = self.detachedFramesCount[func_id]
         self.detachedFramesCount[func_id] = frameno + 1
-        return FunctionFrame(self, frameno, func_id)
+        cap = self.recording
+        if frameno > FUNCTION_FRAME_LIMIT and (frameno > RECURSIVE_FRAME_LIMIT or not self.detachedFrames[func_id].running):
+            cap = False
+            if func_id in self.untracedFunctions:
+                self.swapToUntraced(func_id)
+        return FunctionFrame(self, frameno, func_id, cap)
+
+    def checkBudget(self):
+        taken = 0
+        while True:
+            interval = BUDGET_CHECK_INTERVAL
+            if stepLimit:
+                if taken >= stepLimit:
+                    raise BudgetExceeded("steps", stepLimit, self.runningTime())
+                interval = min(interval, stepLimit - taken)
+            if timeLimit and self.runningTime() > timeLimit:
+                raise BudgetExceeded("time", taken, self.runningTime())
+            yield repeat(None, interval)
+            taken += interval
+
+    def runningTime(self):
+        return time.monotonic() - self.startTime - self.pausedTime
+
+    def pauseBudget(self, seconds):
+        # Time spent waiting for input doesn't count towards the time limit.
+        self.pausedTime += seconds
+
+    def untracedFunction(self, func_id, untraced):
+        # Used as a decorator on every traced function.
+        def register(function):
+            if not swapUntracedFunctions:
+                return function
+            if self.detachedFramesCount.get(func_id, 0) > FUNCTION_FRAME_LIMIT or not self.recording:
+                swapFunctionCode(function, untraced.__code__)
+            else:
+                self.untracedFunctions.setdefault(func_id, weakref.WeakKeyDictionary())[function] = untraced.__code__
+            return function
+        return register
+
+    def swapToUntraced(self, func_id):
+        for function, code in self.untracedFunctions.pop(func_id).items():
+            swapFunctionCode(function, code)
+
+    def degrade(self):
+        while self.degradeLevel < len(CAPTURE_DEGRADE_STEPS) and self.captureSize > CAPTURE_SIZE_LIMIT * CAPTURE_DEGRADE_STEPS[self.degradeLevel]:
+            self.degradeLevel += 1
+        if self.degradeLevel < len(CAPTURE_DEGRADE_STEPS):
+            self.nextDegradeSize = CAPTURE_SIZE_LIMIT * CAPTURE_DEGRADE_STEPS[self.degradeLevel]
+        else:
+            self.nextDegradeSize = float("inf")
+
+        if self.degradeLevel >= 1:
+            self.previewLimit = SHORT_PREVIEW_LIMIT
+        if self.degradeLevel >= 2:
+            self.loopSampleSize = min(DEGRADED_LOOP_SAMPLE_SIZE, iterationSampleSize())
+        if self.degradeLevel >= 3:
+            self.recording = False
+            self.sideEffects = []
+            for func_id in list(self.untracedFunctions):
+                self.swapToUntraced(func_id)
 
     def logExpressionResultAndStartFrame(self, nodetype, childset, result):
         self.startFrame(nodetype, childset)
@@ -821,10 +1354,27 @@ class SplootCapture:
         self.endFrame()
         return result
 
-    def startDetachedFrame(self, type, childset, id):
-        frame = CaptureContext(type, childset)
-        self.detachedFrames[id].append(frame)
+    def startCall(self, func_id, frameno):
+        frame = FunctionCallContext("body", frameno, self.captureSize + self.evictedSize)
+        self.calls.append(frame)
         self.stack.append(frame)
+        self.captureSize += CAPTURE_ENTRY_SIZE
+        self.evicted(self.detachedFrames[func_id].start(frame))
+
+    def endCall(self, func_id, raised):
+        self.endFrameType("PYTHON_FUNCTION_CALL")
+        frame = self.calls.pop()
+        # captureSize + evictedSize only grows, so it measures what the call
+        # recorded even when other calls are let go of meanwhile.
+        size = self.captureSize + self.evictedSize - frame.size
+        frame.size = size - frame.nestedSize
+        if self.calls:
+            self.calls[-1].nestedSize += size
+        self.evicted(self.detachedFrames[func_id].end(frame, raised))
+
+    def evicted(self, size):
+        self.captureSize -= size
+        self.evictedSize += size
 
     def endFrameType(self, type):
         while type != self.stack[-1].type:
@@ -832,34 +1382,70 @@ class SplootCapture:
         self.endFrame()
 
     def startFrame(self, type, childset):
-        frame = CaptureContext(type, childset)
-        self.stack[-1].checkFrameLimit()
-        self.stack[-1].addStatementResult(frame.type, frame.blocks, [])
+        if type in LOOP_TYPES:
+            frame = LoopCaptureContext(type, childset, self.loopSampleSize)
+        else:
+            frame = CaptureContext(type, childset)
+        # Once recording has stopped, frames are still tracked on the stack
+        # but are no longer attached to the capture.
+        if self.recording:
+            self.stack[-1].appendResult(frame)
+            self.captureSize += CAPTURE_ENTRY_SIZE
         self.stack.append(frame)
 
     def startChildSet(self, childset):
         self.stack[-1].startChildSet(childset)
 
     def endFrame(self):
-        frame = self.stack.pop()
+        self.stack.pop()
 
     def endLoop(self):
         while len(self.stack) != 0:
             frame = self.stack[-1]
-            if frame.type == 'PYTHON_FOR_LOOP' or frame.type == 'PYTHON_WHILE_LOOP':
+            if frame.type in LOOP_TYPES:
                 break
             self.stack.pop()
 
     def logSideEffect(self, data):
-        self.sideEffects.append(data)
+        if self.recording:
+            self.sideEffects.append(data)
+            self.captureSize += CAPTURE_ENTRY_SIZE
+
+    def logStdout(self, text):
+        if not self.recording:
+            return
+        sideEffects = self.sideEffects
+        if not sideEffects or type(sideEffects[-1]) is not StdoutRange:
+            sideEffects.append(StdoutRange(self.stdout))
+            self.captureSize += CAPTURE_ENTRY_SIZE
+        self.captureSize += sideEffects[-1].write(text)
+        if self.captureSize > self.nextDegradeSize:
+            self.degrade()
 
     def logExpressionResult(self, nodetype, data, result):
-        data["result"] = str(result)
-        data["resultType"] = type(result).__name__
-        self.stack[-1].addStatementResult(nodetype, data, self.sideEffects)
-        self.sideEffects = []
+        if not self.recording:
+            return result
+        preview, length = previewValue(result)
+        if self.previewLimit and len(preview) > self.previewLimit:
+            preview = preview[:self.previewLimit] + "..."
+        sideEffects = self.sideEffects
+        if sideEffects:
+            self.sideEffects = []
+        else:
+            sideEffects = None
+        self.stack[-1].appendResult((nodetype, preview, type(result).__name__, length, sideEffects, data or None))
+        self.captureSize += len(preview) + CAPTURE_ENTRY_SIZE
+        if self.captureSize > self.nextDegradeSize:
+            self.degrade()
         return result
 
+    def logUntracedStatement(self):
+        # Anything the statement printed isn't shown on the statements that follow.
+        if not self.recording:
+            return
+        self.sideEffects = []
+        self.stack[-1].appendResult(UNTRACED_STATEMENT)
+
     def addExceptionFrame(self, func_id, frameno, lineno, exception):
         key = exception
         if key not in self.detachedFramesException:
@@ -877,9 +1463,12 @@ class SplootCapture:
     def logException(self, exception):
         exceptionType = str(type(exception).__name__)
         message = str(exception)
-        traceback = exception.__traceback__.tb_next
+        # Skip to the module's frame, it's run from here by exec (or the hook tracer).
+        traceback = exception.__traceback__
+        while traceback and traceback.tb_frame.f_code.co_filename != 'main.py':
+            traceback = traceback.tb_next
         functionName = None
-        if traceback.tb_next and traceback.tb_next.tb_frame.f_code.co_filename == 'main.py':
+        if traceback and traceback.tb_next and traceback.tb_next.tb_frame.f_code.co_filename == 'main.py':
             functionName = traceback.tb_next.tb_frame.f_code.co_name
         self.stack[-1].addExceptionResult(exceptionType, message, functionName)
 
@@ -892,35 +1481,143 @@ class SplootCapture:
 
     def toDict(self):
         cap = {"root": self.root.toDict(), "detached": {}}
+        if self.degradeLevel:
+            cap["truncated"] = True
         if self.lastException:
             cap["lastException"] = self.lastException
-        for id in self.detachedFrames:
+        if self.budgetExceeded:
+            cap["budgetExceeded"] = self.budgetExceeded
+        if self.profile:
+            cap["profile"] = self.profile
+        if self.memory:
+            cap["memory"] = self.memory
+        if self.callgraph:
+            cap["callgraph"] = self.callgraph
+        for id, retained in self.detachedFrames.items():
             cap['detached'][id] = {
                 'count': self.detachedFramesCount[id],
-                'frames': [context.toDict() for context in self.detachedFrames[id]]
+                'frames': [context.toDict() for context in retained.frames.values()],
+                'depths': list(retained.depths),
             }
         return cap
 
 
-capture = None
-response = None
+COMPILED_CODE_CACHE_SIZE = 32
+TRANSPILED_STATEMENT_CACHE_SIZE = 4096
 
 
-def executePythonFile(tree, runType="COMMAND_LINE", eventData=None) -> Tuple[dict, dict]:
-    global capture
-    global response
+class LRUCache:
+    def __init__(self, maxSize):
+        self.maxSize = maxSize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        code = self.entries.get(key)
+        if code is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return code
+
+    def put(self, key, code):
+        self.entries[key] = code
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxSize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+compiledCodeCache = LRUCache(COMPILED_CODE_CACHE_SIZE)
+transpiledStatementCache = LRUCache(TRANSPILED_STATEMENT_CACHE_SIZE)
+
+
+def hashTree(tree):
+    serialized = json.dumps(tree, sort_keys=True, separators=(',', ':'))
+    return hashlib.blake2b(serialized.encode('utf-8'), digest_size=16).hexdigest()
+
+
+# The hashes of the nodes of the statement being transpiled, by id, see hashSubtree.
+subtreeHashes = {}
+
+
+def hashSubtree(tree):
+    # The cache key of a function declaration. A node's hash is of its own
+    # fields and its children's hashes, kept in subtreeHashes, so a function
+    # nested in others is serialized once, not again for each of their keys.
+    hashed = subtreeHashes.get(id(tree))
+    if hashed is not None and hashed[0] is tree:
+        return hashed[1]
+    fields = {key: value for key, value in tree.items() if key != "childSets"}
+    children = {name: [hashSubtree(child) for child in nodes] for name, nodes in tree.get("childSets", {}).items()}
+    serialized = json.dumps([fields, children], sort_keys=True, separators=(',', ':'))
+    digest = hashlib.blake2b(serialized.encode('utf-8'), digest_size=16).hexdigest()
+    subtreeHashes[id(tree)] = (tree, digest)
+    return digest
 
-    if tree["type"] == "PYTHON_FILE":
-        statements = getStatementsFromBlock(tree["childSets"]["body"], True)
 
-        if runType == "COMMAND_LINE" or runType == "SCHEDULE":
-            pass
-        elif runType == "HTTP_REQUEST":
-            # we need to parse our http scenario event into serverless_wsgi so
-            if not eventData:
-                raise Exception("Need an event to run a HTTP request")
+def getCachedStatements(key, generate):
+    # Returns a new list each time so that callers can insert into it.
+    statements = transpiledStatementCache.get(key)
+    if statements is None:
+        statements = generate() or []
+        transpiledStatementCache.put(key, statements)
+    return list(statements)
 
-            extra = ast.parse(f"""
+
+def getTopLevelStatements(body, statementHashes, traced, tracedIndexes=None):
+    statements = []
+    for i, (node, nodeHash) in enumerate(zip(body, statementHashes)):
+        if not traced or tracedIndexes is None or i in tracedIndexes:
+            statements.extend(getCachedStatements((nodeHash, traced), lambda: generateAstStatement(node, traced)))
+            continue
+        # Statements outside the trace scope run as plain Python, followed by
+        # a placeholder so the editor still lines up the results with the statements.
+        untraced = getCachedStatements((nodeHash, False), lambda: generateAstStatement(node, False))
+        if untraced and not isFunctionStatement(node):
+            untraced.append(ast.Expr(ast.Call(captureHook("logUntracedStatement"), [], [])))
+        statements.extend(untraced)
+    if len(statements) == 0:
+        return [ast.Pass()]
+    return statements
+
+
+def isFunctionStatement(node):
+    # Function declarations have no entry of their own, their calls are captured by function id.
+    statement = node["childSets"]["statement"]
+    return len(statement) != 0 and statement[0]["type"] == "PYTHON_FUNCTION_DECLARATION"
+
+
+def inTraceScope(node, functions, lines):
+    if (node.get("meta") or {}).get("lineno") in lines:
+        return True
+    if node["type"] == "PYTHON_FUNCTION_DECLARATION" and node["properties"].get("id") in functions:
+        return True
+    return any(inTraceScope(child, functions, lines) for children in node["childSets"].values() for child in children)
+
+
+def getTracedIndexes(body, traceScope):
+    # A trace scope names functions by id and statements by their line number.
+    # The top level statements that contain any of them are traced, whole.
+    if traceScope is None:
+        return None
+    functions = set(traceScope.get("functions") or [])
+    lines = set(traceScope.get("lines") or [])
+    return tuple(i for i, node in enumerate(body) if inTraceScope(node, functions, lines))
+
+
+def generateRunTypeStatements(runType):
+    if runType == "COMMAND_LINE" or runType == "SCHEDULE":
+        return []
+    elif runType == "HTTP_REQUEST":
+        # we need to parse our http scenario event into serverless_wsgi so
+        extra = ast.parse(f"""
 import serverless_wsgi
 
 flask_app = None
@@ -932,74 +1629,384 @@ except NameError:
 
 if flask_app:
     {SPLOOT_SET_RESPONSE_FUNC}(serverless_wsgi.handle_request(app, {SPLOOT_HANDLER_ARG}, {{}}))
-            """)
+        """)
+        return extra.body
+    else:
+        raise NotImplementedError("This run type is not implemented: " + runType)
+
+
+def fixLocations(node):
+    ast.fix_missing_locations(node)
+    # Generated nodes only have a start line, fix_missing_locations gives them
+    # the module's end line, and since 3.12 compile rejects ending before starting.
+    for child in ast.walk(node):
+        if "lineno" in child._attributes and child.end_lineno < child.lineno:
+            child.end_lineno = child.lineno
+    return node
+
+
+def generateModuleCode(tree, runType, traced, statementHashes=None, tracedIndexes=None):
+    body = tree["childSets"]["body"]
+    if statementHashes is None:
+        statementHashes = [hashTree(node) for node in body]
+    statements = getTopLevelStatements(body, statementHashes, traced, tracedIndexes)
+    if traced:
+        statements = bindCaptureHooks(CAPTURE_HOOKS) + statements
+    else:
+        # Untraced code still checks the run's budget.
+        statements = bindCaptureHooks(["step"]) + statements
+    statements.extend(generateRunTypeStatements(runType))
+
+    mods = ast.Module(body=statements, type_ignores=[])
+    # Uncomment to print generated Python code
+    # print(ast.unparse(ast.fix_missing_locations(mods)))
+    # print(ast.dump(mods))
+    return compile(fixLocations(mods), "main.py", mode="exec")
+
+
+def getCompiledCode(tree, runType, traced, traceScope=None):
+    statementHashes = [hashTree(node) for node in tree["childSets"]["body"]]
+    tracedIndexes = getTracedIndexes(tree["childSets"]["body"], traceScope)
+    key = (tuple(statementHashes), runType, traced, tracedIndexes)
+    code = compiledCodeCache.get(key)
+    if code is None:
+        code = generateModuleCode(tree, runType, traced, statementHashes, tracedIndexes)
+        compiledCodeCache.put(key, code)
+    subtreeHashes.clear()
+    return code
+
+
+def readBackCode(expr):
+    # The variable name, or code to evaluate, that reads the value of expr
+    # again after it ran.
+    if type(expr) is ast.Name:
+        return expr.id
+    for node in ast.walk(expr):
+        if hasattr(node, "ctx"):
+            node.ctx = ast.Load()
+    return compile(fixLocations(ast.Expression(expr)), "<target>", "eval")
+
+
+def readTargetCode(nodeList):
+    return readBackCode(generateAstAssignableExpression(nodeList))
+
+
+def readConditionCode(node):
+    # Which block runs already says whether the condition was true. That is
+    # its value when it's a comparison. Other conditions are read again if
+    # that can't have side effects, otherwise only true or false is known.
+    condition = generateAstExpression(node["childSets"]["condition"][0])
+    if condition is None or type(condition) is ast.Compare:
+        return None
+    if type(condition) is ast.UnaryOp and type(condition.op) is ast.Not:
+        return None
+    if any(type(child) is ast.Call for child in ast.walk(condition)):
+        return None
+    return readBackCode(condition)
+
+
+def setStatementLine(node, lines, kind, nodeType=None, target=None, **properties):
+    meta = node.get("meta") or {}
+    line = lines.add(meta.get("lineno", 1), kind, nodeType, target, **properties)
+    node["meta"] = dict(meta, lineno=line.lineno)
+    return line.lineno
+
+
+def maxLineno(node):
+    lineno = (node.get("meta") or {}).get("lineno", 0)
+    for children in node["childSets"].values():
+        for child in children:
+            lineno = max(lineno, maxLineno(child))
+    return lineno
+
 
-            statements.extend(extra.body)
+def numberStatementLines(tree):
+    # Copies the tree with every statement (and elif) given a line number of
+    # its own, so that the hook tracer can tell them apart. Returns the copy,
+    # a StatementLine for each line number and the untraced function bodies
+    # (which keep the editor's line numbers) by the line of their function.
+    from hook_tracing import ProgramLines
+    tree = json.loads(json.dumps(tree))
+    lines = ProgramLines(maxLineno(tree) + 1)
+    untracedBodies = {}
+    numberBlock(tree["childSets"]["body"], lines, untracedBodies)
+    return tree, lines, untracedBodies
+
+
+def numberBlock(block, lines, untracedBodies):
+    from hook_tracing import ASSIGNMENT, ELIF, EXPRESSION, FOR, FUNCTION, IF, IMPORT, OTHER, RESULT_NAME, RETURN, WHILE
+    for statement in block:
+        if statement["type"] != "PYTHON_STATEMENT" or len(statement["childSets"]["statement"]) == 0:
+            continue
+        node = statement["childSets"]["statement"][0]
+        nodeType = node["type"]
+        if nodeType == "PYTHON_EXPRESSION":
+            setStatementLine(statement, lines, EXPRESSION, nodeType, RESULT_NAME)
+        elif nodeType == "PYTHON_ASSIGNMENT":
+            setStatementLine(statement, lines, ASSIGNMENT, nodeType, readTargetCode(node["childSets"]["left"]))
+        elif nodeType == "PYTHON_RETURN":
+            setStatementLine(statement, lines, RETURN, nodeType)
+        elif nodeType == "PYTHON_IMPORT" or nodeType == "PYTHON_FROM_IMPORT":
+            setStatementLine(statement, lines, IMPORT, nodeType)
+        elif nodeType == "PYTHON_IF_STATEMENT":
+            elseBlocks = node["childSets"].get("elseblocks", [])
+            setStatementLine(statement, lines, IF, nodeType, readConditionCode(node), hasElse=len(elseBlocks) != 0)
+            numberBlock(node["childSets"]["trueblock"], lines, untracedBodies)
+            for elseNode in elseBlocks:
+                if elseNode["type"] == "PYTHON_ELIF_STATEMENT":
+                    setStatementLine(elseNode, lines, ELIF, elseNode["type"], readConditionCode(elseNode))
+                numberBlock(elseNode["childSets"]["block"], lines, untracedBodies)
+        elif nodeType == "PYTHON_WHILE_LOOP":
+            setStatementLine(statement, lines, WHILE, nodeType, readConditionCode(node))
+            numberBlock(node["childSets"]["block"], lines, untracedBodies)
+        elif nodeType == "PYTHON_FOR_LOOP":
+            setStatementLine(statement, lines, FOR, nodeType, readTargetCode(node["childSets"]["target"]))
+            numberBlock(node["childSets"]["block"], lines, untracedBodies)
+        elif nodeType == "PYTHON_FUNCTION_DECLARATION":
+            name = node['childSets']['identifier'][0]['properties']['identifier']
+            lineno = setStatementLine(statement, lines, FUNCTION, nodeType, funcId=node['properties']['id'], name=name)
+            untracedBodies[lineno] = generateUntracedFunctionBlock(node['properties']['id'], node["childSets"]["body"])
+            numberBlock(node["childSets"]["body"], lines, untracedBodies)
         else:
-            raise NotImplementedError("This run type is not implemented: " + runType)
+            setStatementLine(statement, lines, OTHER, nodeType)
+
+
+def addUntracedFunctions(statements, lines, untracedBodies):
+    # Like in the traced code, each function is defined after an untraced
+    # version of it, that it's swapped for once it has used up its captured
+    # frames, so that the calls after that aren't traced at all.
+    from hook_tracing import FUNCTION, OTHER
+    result = []
+    for node in statements:
+        for block in ("body", "orelse"):
+            if hasattr(node, block):
+                setattr(node, block, addUntracedFunctions(getattr(node, block), lines, untracedBodies))
+        line = lines.get(getattr(node, "lineno", None))
+        if type(node) is ast.FunctionDef and line is not None and line.kind == FUNCTION:
+            untracedLine = lines.add(None, OTHER)
+            untracedLine.ancestry = line.ancestry
+            untraced = ast.FunctionDef(node.name, copy.deepcopy(node.args), untracedBodies[line.lineno], [])
+            for child in ast.walk(untraced.args):
+                if "lineno" in child._attributes:
+                    child.lineno = child.end_lineno = untracedLine.lineno
+            untraced.lineno = untracedLine.lineno
+            result.append(untraced)
+            register = ast.Call(captureHook("untracedFunction"), args=[
+                ast.Constant(line.funcId),
+                ast.Name(node.name, ast.Load()),
+            ], keywords=[])
+            for child in ast.walk(register):
+                if "lineno" in child._attributes:
+                    child.lineno = child.end_lineno = node.lineno
+            node.decorator_list.append(register)
+        result.append(node)
+    return result
+
+
+def generateHookedProgram(tree, runType):
+    from hook_tracing import OTHER, HookedProgram, prepareModule
+    tree, lines, untracedBodies = numberStatementLines(tree)
+    statements = getStatementsFromBlock(tree["childSets"]["body"], False)
+    module = prepareModule(ast.Module(body=statements, type_ignores=[]), lines)
+    hooks = bindCaptureHooks(["untracedFunction", "detachedFramesCount", "addExceptionFrame", "step"])
+    hooksLine = lines.add(None, OTHER)
+    for node in hooks:
+        node.lineno = hooksLine.lineno
+    module.body = hooks + addUntracedFunctions(module.body, lines, untracedBodies)
+    # Keep the lines of the run type's code clear of the statements' lines.
+    lastLine = lines.nextLine()
+    for node in generateRunTypeStatements(runType):
+        ast.increment_lineno(node, lastLine)
+        module.body.append(node)
+    code = compile(fixLocations(module), "main.py", mode="exec")
+    return HookedProgram(code, lines)
+
+
+def getHookedProgram(tree, runType):
+    statementHashes = [hashTree(node) for node in tree["childSets"]["body"]]
+    key = (tuple(statementHashes), runType, "HOOKS")
+    program = compiledCodeCache.get(key)
+    if program is None:
+        program = generateHookedProgram(tree, runType)
+        compiledCodeCache.put(key, program)
+    subtreeHashes.clear()
+    return program
+
+
+def generateProfiledProgram(tree, runType, profile):
+    types = statementTypes(tree, {})
+    functions = None
+    # The marks are added in place, the statements of functions are shared
+    # with the transpiled statement cache.
+    statements = copy.deepcopy(getStatementsFromBlock(tree["childSets"]["body"], False))
+    if profile == "MEMORY":
+        topLines = [node["meta"]["lineno"] for node in tree["childSets"]["body"] if "lineno" in (node.get("meta") or {})]
+        statements = addMemoryMarks(statements, topLines, functionIds(tree, {}))
+    elif profile == "CALLS":
+        functions = functionDeclarations(tree, [])
+        statements = addCallMarks(statements, functions)
+    else:
+        statements = addStatementMarks(statements, types)
+    statements = bindCaptureHooks(["step"]) + statements
+    statements.extend(generateRunTypeStatements(runType))
+    code = compile(fixLocations(ast.Module(body=statements, type_ignores=[])), "main.py", mode="exec")
+    return ProfiledProgram(code, types, functions)
 
-        mods = ast.Module(body=statements, type_ignores=[])
-        code = compile(ast.fix_missing_locations(mods), "main.py", mode="exec")
-        # Uncomment to print generated Python code
-        # print(ast.unparse(ast.fix_missing_locations(mods)))
-        # print(ast.dump(mods))
 
-        capture = SplootCapture()
-        response = {}
+def getProfiledProgram(tree, runType, profile):
+    statementHashes = [hashTree(node) for node in tree["childSets"]["body"]]
+    key = (tuple(statementHashes), runType, profile)
+    program = compiledCodeCache.get(key)
+    if program is None:
+        program = generateProfiledProgram(tree, runType, profile)
+        compiledCodeCache.put(key, program)
+    subtreeHashes.clear()
+    return program
 
-        def set_response(r):
-            global response
-            response = r
 
-        try:
-            exec(code, {SPLOOT_KEY: capture, '__name__': '__main__', SPLOOT_HANDLER_ARG: eventData, SPLOOT_SET_RESPONSE_FUNC: set_response})
-        except EOFError as e:
-            # This is because we don't have inputs in a rerun.
-            capture.logException(e)
-        except BaseException as e:
-            capture.logException(e)
-            traceback.print_exc()
+capture = None
+reporter = None
+response = None
+# The digest of the previous run's capture, see digestCapture.
+previousDigest = None
+
+
+def executeTracedFile(tree, runType, eventData, traceScope=None, profile=None, tracingBackend="AST"):
+    global capture
+    global reporter
+    global response
+    global previousDigest
+
+    if runType == "HTTP_REQUEST" and not eventData:
+        raise Exception("Need an event to run a HTTP request")
+    if tracingBackend not in TRACING_BACKENDS:
+        raise Exception("Unknown tracing backend: " + str(tracingBackend))
+
+    # The hook tracer traces the whole program, a scoped run uses the traced code.
+    # A profiled run measures the time ("TIME") or memory ("MEMORY") taken by
+    # the statements of the untraced code, or the calls between its functions
+    # ("CALLS"), instead of tracing it.
+    useHooks = tracingBackend == "HOOKS" and traceScope is None
+    profiler = None
+    if profile == "TIME":
+        profiler = StatementProfiler(getProfiledProgram(tree, runType, profile))
+    elif profile == "MEMORY":
+        profiler = AllocationProfiler(getProfiledProgram(tree, runType, profile))
+    elif profile == "CALLS":
+        profiler = CallProfiler(getProfiledProgram(tree, runType, profile))
+    elif useHooks:
+        program = getHookedProgram(tree, runType)
+    else:
+        code = getCompiledCode(tree, runType, True, traceScope)
+
+    # The runtime worker still has the previous run's capture, so the
+    # first report of this run can be a diff against it.
+    capture = SplootCapture()
+    reporter = CaptureReporter(capture, previousDigest)
+    previousDigest = None
+    response = {}
 
+    def set_response(r):
+        global response
+        response = r
+
+    globals = {SPLOOT_KEY: capture, '__name__': '__main__', SPLOOT_HANDLER_ARG: eventData, SPLOOT_SET_RESPONSE_FUNC: set_response}
+    try:
+        if profiler:
+            profiler.run(globals)
+        elif useHooks:
+            from hook_tracing import HookTracer
+            HookTracer(capture, program).run(globals)
+        else:
+            exec(code, globals)
+    except EOFError as e:
+        # This is because we don't have inputs in a rerun.
+        capture.logException(e)
+    except BudgetExceeded as e:
+        # The program stops where it was, with the capture so far.
+        capture.budgetExceeded = e.toDict()
+        capture.logException(e)
+        print(str(e), file=sys.stderr)
+    except BaseException as e:
+        capture.logException(e)
+        traceback.print_exc()
+    if profile == "TIME":
+        capture.profile = profiler.report()
+    elif profile == "MEMORY":
+        capture.memory = profiler.report()
+    elif profile == "CALLS":
+        capture.callgraph = profiler.report()
+    if diffReruns:
+        previousDigest = digestCapture(capture.toDict())
+
+
+def executePythonFile(tree, runType="COMMAND_LINE", eventData=None, traceScope=None, profile=None, tracingBackend="AST") -> Tuple[dict, dict]:
+    if tree["type"] == "PYTHON_FILE":
+        executeTracedFile(tree, runType, eventData, traceScope, profile, tracingBackend)
         return (capture.toDict(), response)
 
 
 def wrapStdout(write):
     def f(s):
         if capture:
-            capture.logSideEffect({"type": "stdout", "value": str(s)})
+            capture.logStdout(str(s))
         write(s)
     return f
 
-if __name__ == "__main__":
+
+def wrapStdin(readline, report):
+    def f():
+        report(encodeReport(reporter.report(), capture.captureSize))
+        start = time.monotonic()
+        line = readline()
+        if capture:
+            capture.pauseBudget(time.monotonic() - start)
+        return line
+    return f
+
+
+runtimeIOInstalled = False
+
+
+def installRuntimeIO():
+    global runtimeIOInstalled
+    if runtimeIOInstalled:
+        return
+
     import fakeprint  # pylint: disable=import-error
-    import nodetree  # pylint: disable=import-error
-    import runtime_capture # pylint: disable=import-error
-    import web_response # pylint: disable=import-error
+    import runtime_capture  # pylint: disable=import-error
+
+    fakeprint.stdout.write = wrapStdout(fakeprint.stdout.write)
+    fakeprint.stdin.readline = wrapStdin(fakeprint.stdin.readline, runtime_capture.report)
+    runtimeIOInstalled = True
 
-    # Only wrap stdin/stdout once.
-    # Horrifying hack.
-    try:
-        wrapStdin
-    except NameError:
-        def wrapStdin(readline):
-            def f():
-                runtime_capture.report(json.dumps(capture.toDict()))
-                return readline()
-            return f
 
-        fakeprint.stdout.write = wrapStdout(fakeprint.stdout.write)
-        fakeprint.stdin.readline = wrapStdin(fakeprint.stdin.readline)
+def run(tree, runType="COMMAND_LINE", eventData=None, limits=None, traceScope=None, profile=None, tracingBackend="AST"):
+    # Entry point for the runtime worker, which imports this module once
+    # and calls run() for every run/rerun. traceScope, if given, limits the
+    # tracing to {"functions": [function ids], "lines": [statement line numbers]}.
+    # A profiled run ("TIME", "MEMORY" or "CALLS") captures the time or memory
+    # taken by each statement, or the calls between functions, instead.
+    # The worker always traces with "AST", see TRACING_BACKENDS.
+    global iterationLimit
+    global stepLimit
+    global timeLimit
 
+    import fakeprint  # pylint: disable=import-error
+    import runtime_capture  # pylint: disable=import-error
+    import web_response  # pylint: disable=import-error
+
+    installRuntimeIO()
     sys.stdout = fakeprint.stdout
     sys.stderr = fakeprint.stdout
     sys.stdin = fakeprint.stdin
 
-    tree = nodetree.getNodeTree()  # pylint: disable=undefined-variable
-    iterationLimit = nodetree.getIterationLimit()
-    runType = nodetree.getRunType()
-    eventData = nodetree.getEventData()
-    cap, response = executePythonFile(tree, runType, eventData)
-    if cap:
-        runtime_capture.report(json.dumps(cap))
-    if response:
-        web_response.report(json.dumps(response))
+    limits = limits or {}
+    iterationLimit = limits.get("iterationLimit")
+    stepLimit = limits.get("stepLimit")
+    timeLimit = limits.get("timeLimit")
+    if tree["type"] == "PYTHON_FILE":
+        executeTracedFile(tree, runType, eventData, traceScope, profile, tracingBackend)
+        runtime_capture.report(encodeReport(reporter.report(), capture.captureSize))
+        if response:
+            web_response.report(json.dumps(response))
@@ -0,0 +1,132 @@
+import ast
+
+
+UNARY_OPERATORS = {
+    "not": {"precedence": 70, "ast": ast.Not()},
+    "+": {"precedence": 150, "ast": ast.UAdd()},
+    "-": {"precedence": 150, "ast": ast.USub()},
+    "~": {"precedence": 150, "ast": ast.Invert()},  # Bitwise not
+}
+
+OPERATORS = {
+    "or": {"precedence": 50, "ast": ast.Or()},
+    "and": {"precedence": 60, "ast": ast.And()},
+    "==": {"precedence": 80, "ast": ast.Eq()},
+    "!=": {"precedence": 80, "ast": ast.NotEq()},
+    ">=": {"precedence": 80, "ast": ast.GtE()},
+    ">": {"precedence": 80, "ast": ast.Gt()},
+    "<=": {"precedence": 80, "ast": ast.LtE()},
+    "<": {"precedence": 80, "ast": ast.Lt()},
+    "is not": {"precedence": 80, "ast": ast.IsNot()},
+    "is": {"precedence": 80, "ast": ast.Is()},
+    "not in": {"precedence": 80, "ast": ast.NotIn()},
+    "in": {"precedence": 80, "ast": ast.In()},
+    "|": {"precedence": 90, "ast": ast.BitOr()},
+    "^": {"precedence": 100, "ast": ast.BitXor()},
+    "&": {"precedence": 110, "ast": ast.BitAnd()},
+    "<<": {"precedence": 120, "ast": ast.LShift()},
+    ">>": {"precedence": 120, "ast": ast.RShift()},
+    "+": {"precedence": 130, "ast": ast.Add()},
+    "-": {"precedence": 130, "ast": ast.Sub()},
+    "*": {"precedence": 140, "ast": ast.Mult()},
+    "/": {"precedence": 140, "ast": ast.Div()},
+    "//": {"precedence": 140, "ast": ast.FloorDiv()},
+    "%": {"precedence": 140, "ast": ast.Mod()},
+    "@": {"precedence": 140, "ast": ast.MatMult()},
+    "**": {"precedence": 160, "ast": ast.Pow()},
+}
+
+BINARY = 0
+BOOLEAN = 1
+COMPARE = 2
+UNARY = 3
+
+
+def operatorKind(op):
+    if op in ("and", "or"):
+        return BOOLEAN
+    if isinstance(OPERATORS[op]["ast"], ast.cmpop):
+        return COMPARE
+    return BINARY
+
+
+# Precomputed (precedence, kind, ast operator) for every operator string,
+# so that building an expression only needs a single dict lookup per operator.
+BINARY_OPERATOR_TABLE = {
+    op: (details["precedence"], operatorKind(op), details["ast"]) for op, details in OPERATORS.items()
+}
+UNARY_OPERATOR_TABLE = {
+    op: (details["precedence"], UNARY, details["ast"]) for op, details in UNARY_OPERATORS.items()
+}
+
+
+def reduceOperator(entry, operands, merged):
+    _, kind, astOp = entry
+    if kind == UNARY:
+        operands.append(ast.UnaryOp(astOp, operands.pop()))
+        return
+
+    rhs = operands.pop()
+    lhs = operands.pop()
+    if kind == BINARY:
+        node = ast.BinOp(lhs, astOp, rhs)
+    elif kind == COMPARE:
+        # a < b < c is a single Compare node, like Python's own parser produces.
+        if isinstance(lhs, ast.Compare) and id(lhs) in merged:
+            lhs.ops.append(astOp)
+            lhs.comparators.append(rhs)
+            node = lhs
+        else:
+            node = ast.Compare(lhs, [astOp], [rhs])
+    else:
+        # Chains of the same boolean operator are flattened into one BoolOp.
+        if isinstance(lhs, ast.BoolOp) and id(lhs) in merged and type(lhs.op) is type(astOp):
+            lhs.values.append(rhs)
+            node = lhs
+        else:
+            node = ast.BoolOp(astOp, [lhs, rhs])
+    merged.add(id(node))
+    operands.append(node)
+
+
+def buildExpression(tokens, generateToken):
+    # Iterative precedence climbing (shunting-yard) over a PYTHON_EXPRESSION token list.
+    # Binary operators are left associative, apart from ** which is right
+    # associative, as in Python's grammar. generateToken converts a
+    # single non-operator token into an ast expression.
+    operands = []
+    operators = []
+    # ids of nodes built here that later operators may extend
+    merged = set()
+    expectOperand = True
+
+    for token in tokens:
+        if token["type"] == "PYTHON_BINARY_OPERATOR":
+            op = token["properties"]["operator"]
+            if expectOperand:
+                if op not in UNARY_OPERATOR_TABLE:
+                    raise Exception(f'Unexpected operator in expression: {op}')
+                operators.append(UNARY_OPERATOR_TABLE[op])
+                continue
+
+            entry = BINARY_OPERATOR_TABLE[op]
+            precedence = entry[0]
+            if op == "**":
+                # a ** b ** c is a ** (b ** c), only reduce tighter operators.
+                precedence += 1
+            while operators and operators[-1][0] >= precedence:
+                reduceOperator(operators.pop(), operands, merged)
+            operators.append(entry)
+            expectOperand = True
+        else:
+            if not expectOperand:
+                raise Exception(f'Missing operator before expression token: {token["type"]}')
+            operands.append(generateToken(token))
+            expectOperand = False
+
+    if expectOperand:
+        raise Exception('Expression is missing an operand')
+
+    while operators:
+        reduceOperator(operators.pop(), operands, merged)
+    return operands[0]
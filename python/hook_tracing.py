@@ -0,0 +1,466 @@
+import ast
+import copy
+import sys
+
+
+# Collects a capture from CPython's tracing hooks while the untraced code of a
+# program runs, instead of from capture calls compiled into the program.
+#
+# Every statement is compiled on a line of its own, so a line event says which
+# statement is about to run. From the order of those, the tracer works out
+# which frames the traced code would have started and ended, and makes the
+# same calls on the SplootCapture: an if frame is started once the next line
+# shows which block ran, and a statement's result is logged when the next line
+# of its frame starts (or the frame returns).
+#
+# Like the traced code, a function is swapped for an untraced copy of it once
+# it has used up its captured frames (see addUntracedFunctions in executor.py),
+# and the calls after that don't reach the tracer.
+#
+# sys.monitoring is used where it's available (Python 3.12+), sys.settrace
+# otherwise.
+
+EXPRESSION = "EXPRESSION"
+ASSIGNMENT = "ASSIGNMENT"
+RETURN = "RETURN"
+IMPORT = "IMPORT"
+IF = "IF"
+ELIF = "ELIF"
+WHILE = "WHILE"
+FOR = "FOR"
+FUNCTION = "FUNCTION"
+OTHER = "OTHER"
+
+# Where a statement is within its function (or the module) is the tuple of
+# frames and blocks it runs inside of, each a (kind, line of the statement
+# that started it) pair.
+IF_FRAME = 0
+TRUE_BLOCK = 1
+ELIF_FRAME = 2
+ELIF_BLOCK = 3
+ELSE_FRAME = 4
+LOOP_FRAME = 5
+ITERATION_FRAME = 6
+
+# Expression statements are compiled as an assignment to this name, so that
+# their result can be read after they run.
+RESULT_NAME = "__spt__result__"
+
+# Assignments and for loops that unpack, or assign to an item or attribute,
+# also assign the value (or item) to this name, so that the value logged is
+# the one that was assigned, not one rebuilt from the targets after.
+VALUE_NAME = "__spt__value__"
+
+# The budget check the untraced code calls at the start of every loop body and
+# function (see budgetCheck in executor.py).
+STEP_HOOK = "__spt__step__"
+
+FILENAME = "main.py"
+MONITORING_TOOL_NAME = "splootcode"
+
+
+class StatementLine:
+    __slots__ = ("lineno", "sourceLine", "kind", "nodeType", "target", "funcId", "name", "hasElse", "ancestry", "body")
+
+    def __init__(self, lineno, sourceLine, kind, nodeType=None, target=None, funcId=None, name=None, hasElse=False):
+        self.lineno = lineno
+        # The line number the statement has in the editor's tree.
+        self.sourceLine = sourceLine
+        self.kind = kind
+        self.nodeType = nodeType
+        # The variable name (or code to evaluate) that gives the value the
+        # traced code would have logged, for statements that log one.
+        self.target = target
+        self.funcId = funcId
+        self.name = name
+        self.hasElse = hasElse
+        self.ancestry = ()
+        # For ifs, elifs and loops, what is entered when the block runs.
+        self.body = ()
+
+
+class ProgramLines(dict):
+    # Line number -> StatementLine. The statements are numbered from
+    # firstLine on, clear of the editor's line numbers which the untraced
+    # copies of functions keep. Otherwise a function nested in one of those
+    # copies can compile to the same code object as the one it's a copy of.
+    def __init__(self, firstLine):
+        super().__init__()
+        self.firstLine = firstLine
+
+    def nextLine(self):
+        return self.firstLine + len(self)
+
+    def add(self, sourceLine, kind, nodeType=None, target=None, **properties):
+        lineno = self.nextLine()
+        line = self[lineno] = StatementLine(lineno, sourceLine, kind, nodeType, target, **properties)
+        return line
+
+
+def prepareModule(module, lines):
+    # Returns a copy of the untraced module with expression statements
+    # assigning to RESULT_NAME and each generated `pass` on a line of its own,
+    # and fills in where each line is in lines.
+    module = copy.deepcopy(module)
+    prepareBlock(module.body, (), lines)
+    return module
+
+
+def isBudgetCheck(node):
+    return type(node) is ast.Expr and type(node.value) is ast.Call and getattr(node.value.func, "id", None) == STEP_HOOK
+
+
+def prepareBlock(statements, ancestry, lines):
+    for i, node in enumerate(statements):
+        if type(node) is ast.Pass or isBudgetCheck(node):
+            # Empty blocks compile to a pass, which needs its own line for the
+            # block to show up as having run. Budget checks get one too, so
+            # they aren't taken for the statement they would share a line with.
+            line = lines.add(None, OTHER)
+            line.ancestry = ancestry
+            node.lineno = line.lineno
+            continue
+        line = lines.get(getattr(node, "lineno", None))
+        if line is None:
+            continue
+        line.ancestry = ancestry
+        setExpressionLines(node, line.lineno)
+        if line.kind == EXPRESSION and type(node) is ast.Expr:
+            statements[i] = ast.Assign([ast.Name(RESULT_NAME, ast.Store())], node.value, lineno=node.lineno)
+        elif line.kind == ASSIGNMENT and type(node) is ast.Assign and type(node.targets[0]) is not ast.Name:
+            node.value = ast.NamedExpr(ast.Name(VALUE_NAME, ast.Store()), node.value)
+            setExpressionLines(node, line.lineno)
+            line.target = VALUE_NAME
+        elif line.kind == IF and type(node) is ast.If:
+            line.body = ((IF_FRAME, line.lineno), (TRUE_BLOCK, line.lineno))
+            prepareBlock(node.body, ancestry + line.body, lines)
+            prepareElseBlocks(node.orelse, line.lineno, ancestry + line.body[:1], lines)
+        elif line.kind in (WHILE, FOR) and type(node) in (ast.While, ast.For):
+            # The condition or next item is evaluated inside the loop's frame.
+            line.ancestry = ancestry + ((LOOP_FRAME, line.lineno),)
+            line.body = ((ITERATION_FRAME, line.lineno),)
+            prepareBlock(node.body, line.ancestry + line.body, lines)
+            if type(node) is ast.For and type(node.target) is not ast.Name:
+                unpack = ast.Assign([node.target], ast.Name(VALUE_NAME, ast.Load()), lineno=line.lineno)
+                setExpressionLines(unpack, line.lineno)
+                node.body.insert(0, unpack)
+                node.target = ast.Name(VALUE_NAME, ast.Store(), lineno=line.lineno, end_lineno=line.lineno)
+                line.target = VALUE_NAME
+        elif line.kind == FUNCTION and type(node) is ast.FunctionDef:
+            prepareBlock(node.body, (), lines)
+
+
+def setExpressionLines(node, lineno):
+    # Generated expressions can carry other line numbers, which would show up
+    # as line events for statements that aren't running.
+    for child in ast.iter_child_nodes(node):
+        if isinstance(child, ast.stmt):
+            continue
+        if "lineno" in child._attributes:
+            child.lineno = child.end_lineno = lineno
+        setExpressionLines(child, lineno)
+
+
+def prepareElseBlocks(orelse, ifLineno, ancestry, lines):
+    if len(orelse) == 1 and type(orelse[0]) is ast.If:
+        line = lines.get(orelse[0].lineno)
+        if line is not None and line.kind == ELIF:
+            line.ancestry = ancestry
+            line.body = ((ELIF_FRAME, line.lineno), (ELIF_BLOCK, line.lineno))
+            prepareBlock(orelse[0].body, ancestry + line.body, lines)
+            prepareElseBlocks(orelse[0].orelse, ifLineno, ancestry, lines)
+            return
+    prepareBlock(orelse, ancestry + ((ELSE_FRAME, ifLineno),), lines)
+
+
+class HookedProgram:
+    # A program compiled for the hook tracer, with the line of every statement.
+    def __init__(self, code, lines):
+        self.code = code
+        self.lines = lines
+        # id(code) -> line of the function. Code objects compare equal by
+        # their contents, which the untraced copy of a nested function can share.
+        self.functions = {}
+        self.codes = [code]
+        pending = [code]
+        while pending:
+            for const in pending.pop().co_consts:
+                if type(const) is not type(code) or const.co_filename != FILENAME:
+                    continue
+                # Functions are only defined in the module and other functions,
+                # the untraced copies of them keep the editor's line numbers.
+                line = lines.get(const.co_firstlineno)
+                if line is not None and line.kind == FUNCTION and line.name == const.co_name:
+                    self.functions[id(const)] = line
+                    self.codes.append(const)
+                    pending.append(const)
+
+
+class FrameState:
+    __slots__ = ("tracer", "capture", "lines", "frame", "function", "tracingLines", "open", "pending", "exception", "localTrace")
+
+    def __init__(self, tracer, frame, function):
+        self.tracer = tracer
+        self.capture = tracer.capture
+        self.lines = tracer.program.lines
+        self.frame = frame
+        # The FunctionFrame of a function call, None for the module.
+        self.function = function
+        self.tracingLines = function is None or function.cap
+        self.open = ()
+        self.pending = None
+        self.exception = None
+        self.localTrace = self.traceLocal
+
+    def line(self, lineno):
+        line = self.lines.get(lineno)
+        if line is None:
+            return
+        if self.pending is not None:
+            self.resolve(line)
+        if self.open is not line.ancestry:
+            self.moveTo(line.ancestry)
+        kind = line.kind
+        if kind == IMPORT:
+            self.capture.startFrame(line.nodeType, "import")
+        if kind != OTHER and kind != FUNCTION:
+            self.pending = line
+
+    def resolve(self, next):
+        # Finishes the previous statement, now that next (None when the frame
+        # returns) is the line that runs after it.
+        line = self.pending
+        self.pending = None
+        kind = line.kind
+        capture = self.capture
+        if kind == ASSIGNMENT or kind == EXPRESSION:
+            capture.logExpressionResult(line.nodeType, {}, self.readTarget(line.target))
+        elif kind == IF:
+            ran = next is not None and line.body[-1] in next.ancestry
+            capture.logExpressionResultAndStartFrame("PYTHON_IF_STATEMENT", "condition", self.readCondition(line, ran))
+            if ran:
+                capture.startChildSet("trueblock")
+                self.open = self.open + line.body
+            else:
+                if line.hasElse:
+                    capture.startChildSet("elseblocks")
+                self.open = self.open + line.body[:1]
+        elif kind == ELIF:
+            ran = next is not None and line.body[-1] in next.ancestry
+            capture.logExpressionResultAndStartFrame("PYTHON_ELIF_STATEMENT", "condition", self.readCondition(line, ran))
+            if ran:
+                capture.startChildSet("block")
+                self.open = self.open + line.body
+            else:
+                capture.endFrame()
+        elif kind == WHILE:
+            ran = next is not None and line.body[0] in next.ancestry
+            capture.logExpressionResultAndStartFrame("PYTHON_WHILE_LOOP_ITERATION", "condition", self.readCondition(line, ran))
+            if ran:
+                capture.startChildSet("block")
+                self.open = self.open + line.body
+            else:
+                capture.endFrame()
+        elif kind == FOR:
+            if next is not None and line.body[0] in next.ancestry:
+                capture.logExpressionResultAndStartFrame("PYTHON_FOR_LOOP_ITERATION", "iterable", self.readTarget(line.target))
+                capture.startChildSet("block")
+                self.open = self.open + line.body
+        elif kind == IMPORT:
+            capture.endFrame()
+
+    def readTarget(self, target):
+        frame = self.frame
+        if type(target) is str:
+            locals = frame.f_locals
+            if target in locals:
+                return locals[target]
+            return frame.f_globals.get(target)
+        return eval(target, frame.f_globals, frame.f_locals)
+
+    def readCondition(self, line, ran):
+        if line.target is None:
+            return ran
+        return self.readTarget(line.target)
+
+    def moveTo(self, ancestry):
+        # Ends the frames that ancestry is outside of, and starts the ones it's inside.
+        open = self.open
+        common = 0
+        while common < len(open) and common < len(ancestry) and open[common] == ancestry[common]:
+            common += 1
+        capture = self.capture
+        for kind, lineno in reversed(open[common:]):
+            if kind != TRUE_BLOCK and kind != ELIF_BLOCK:
+                capture.endFrame()
+        for kind, lineno in ancestry[common:]:
+            if kind == LOOP_FRAME:
+                capture.startFrame(self.lines[lineno].nodeType, "frames")
+            elif kind == ELSE_FRAME:
+                capture.startFrame("PYTHON_ELSE_STATEMENT", "block")
+            elif kind == IF_FRAME:
+                capture.startFrame("PYTHON_IF_STATEMENT", "condition")
+            elif kind == TRUE_BLOCK:
+                capture.startChildSet("trueblock")
+            elif kind == ELIF_FRAME:
+                capture.startFrame("PYTHON_ELIF_STATEMENT", "condition")
+            elif kind == ELIF_BLOCK:
+                capture.startChildSet("block")
+            elif kind == ITERATION_FRAME:
+                iterationType = self.lines[lineno].nodeType + "_ITERATION"
+                capture.startFrame(iterationType, "iterable" if iterationType == "PYTHON_FOR_LOOP_ITERATION" else "condition")
+                capture.startChildSet("block")
+        self.open = ancestry
+
+    def returned(self, value):
+        pending = self.pending
+        if pending is not None:
+            if pending.kind == RETURN:
+                self.pending = None
+                self.capture.logExpressionResult("PYTHON_RETURN", {}, value)
+            else:
+                self.resolve(None)
+        if self.open:
+            self.moveTo(())
+        if self.function is not None and self.function.cap:
+            self.capture.endCall(self.function.func_id, False)
+
+    def unwound(self, exception):
+        # The statement that raised has no result, and like in the traced code
+        # the frames it was inside of are left as they are.
+        self.pending = None
+        function = self.function
+        if function is None:
+            return
+        capture = self.capture
+        if function.cap:
+            capture.logTracedException(exception)
+        line = self.lines.get(exception.__traceback__.tb_lineno)
+        capture.addExceptionFrame(function.func_id, function.frame_no, line.sourceLine if line else 1, exception)
+        if function.cap:
+            capture.endCall(function.func_id, True)
+
+    def traceLocal(self, frame, event, arg):
+        if event == "line":
+            self.exception = None
+            self.line(frame.f_lineno)
+        elif event == "return":
+            if self.exception is not None:
+                self.unwound(self.exception)
+            else:
+                self.returned(arg)
+        elif event == "exception":
+            # Before 3.12 the traceback is only attached to the exception when
+            # it's caught, the exception frame and logTracedException need it now.
+            exceptionType, exception, traceback = arg
+            exception.__traceback__ = traceback
+            self.exception = exception
+        return self.localTrace
+
+
+class HookTracer:
+    def __init__(self, capture, program):
+        self.capture = capture
+        self.program = program
+        # Frame -> FrameState, for sys.monitoring which only passes the code.
+        self.states = {}
+        # Code -> number of its calls with a captured frame that are running.
+        self.capturedCalls = {}
+
+    def start(self, frame):
+        code = frame.f_code
+        if code is self.program.code:
+            return FrameState(self, frame, None)
+        line = self.program.functions.get(id(code))
+        if line is None:
+            return None
+        function = self.capture.func(line.funcId)
+        function.__enter__()
+        return FrameState(self, frame, function)
+
+    def run(self, globals):
+        # A debugger that's attached has the tool id this uses already.
+        if hasattr(sys, "monitoring") and sys.monitoring.get_tool(sys.monitoring.DEBUGGER_ID) is None:
+            self.runWithMonitoring(globals)
+        else:
+            self.runWithSettrace(globals)
+
+    def runWithSettrace(self, globals):
+        def traceCall(frame, event, arg):
+            state = self.start(frame)
+            if state is None:
+                return None
+            if not state.tracingLines:
+                frame.f_trace_lines = False
+            return state.localTrace
+
+        sys.settrace(traceCall)
+        try:
+            exec(self.program.code, globals)
+        finally:
+            sys.settrace(None)
+
+    def runWithMonitoring(self, globals):
+        monitoring = sys.monitoring
+        events = monitoring.events
+        tool = monitoring.DEBUGGER_ID
+        callbacks = {
+            events.PY_START: self.monitorStart,
+            events.LINE: self.monitorLine,
+            events.PY_RETURN: self.monitorReturn,
+            events.PY_UNWIND: self.monitorUnwind,
+        }
+        localEvents = events.PY_START | events.LINE | events.PY_RETURN
+        monitoring.use_tool_id(tool, MONITORING_TOOL_NAME)
+        try:
+            for event, callback in callbacks.items():
+                monitoring.register_callback(tool, event, callback)
+            for code in self.program.codes:
+                monitoring.set_local_events(tool, code, localEvents)
+            monitoring.set_events(tool, events.PY_UNWIND)
+            exec(self.program.code, globals)
+        finally:
+            monitoring.set_events(tool, 0)
+            for code in self.program.codes:
+                monitoring.set_local_events(tool, code, 0)
+            for event in callbacks:
+                monitoring.register_callback(tool, event, None)
+            monitoring.free_tool_id(tool)
+
+    def monitorStart(self, code, offset):
+        frame = sys._getframe(1)
+        state = self.start(frame)
+        if state is None:
+            return
+        self.states[frame] = state
+        if state.function is None:
+            return
+        running = self.capturedCalls.get(code, 0)
+        if state.tracingLines:
+            self.capturedCalls[code] = running + 1
+        elif running == 0:
+            # No later call of this function gets a frame captured either,
+            # so stop the line events for it.
+            events = sys.monitoring.events
+            sys.monitoring.set_local_events(sys.monitoring.DEBUGGER_ID, code, events.PY_START | events.PY_RETURN)
+
+    def monitorLine(self, code, lineno):
+        state = self.states.get(sys._getframe(1))
+        if state is not None and state.tracingLines:
+            state.line(lineno)
+
+    def endCall(self, code, state):
+        if state.function is not None and state.tracingLines:
+            self.capturedCalls[code] -= 1
+
+    def monitorReturn(self, code, offset, value):
+        state = self.states.pop(sys._getframe(1), None)
+        if state is not None:
+            self.endCall(code, state)
+            state.returned(value)
+
+    def monitorUnwind(self, code, offset, exception):
+        state = self.states.pop(sys._getframe(1), None)
+        if state is not None:
+            self.endCall(code, state)
+            state.unwound(exception)
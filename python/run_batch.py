@@ -0,0 +1,259 @@
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import multiprocessing
+import multiprocessing.connection
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, where memory isn't capped.
+    resource = None
+
+import executor
+from convert_ast import splootFromPython
+
+
+# Runs many Sploot programs with executePythonFile, across a pool of worker
+# processes. Each task is one program with its stdin lines, and gets back the
+# program's stdout and stderr, its capture and its response.
+#
+# Workers are started once with the executor and PRELOADED_MODULES imported,
+# and run one task after another. Every task runs with fresh globals. A worker
+# is killed and replaced when its task goes over the timeout, when it crashes,
+# when the program ran out of memory, and after TASKS_PER_WORKER tasks, so
+# that what one program leaves behind (like changes to modules it imported)
+# doesn't reach many others.
+
+PRELOADED_MODULES = ["executor", "convert_ast", "collections", "datetime", "json", "math", "random", "re", "string"]
+TASKS_PER_WORKER = 100
+DEFAULT_TIMEOUT = 10.0
+# How long after its timeout a task is killed. Before that, the run's time
+# limit (which is its timeout) should have stopped it with its capture so far.
+TIMEOUT_GRACE = 1.0
+
+OK = "OK"
+ERROR = "ERROR"
+TIMEOUT = "TIMEOUT"
+CRASHED = "CRASHED"
+
+
+def limitMemory(megabytes):
+    if megabytes and resource is not None:
+        size = megabytes * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (size, size))
+
+
+def runTask(task):
+    # Runs in a worker. Returns the task's result, and whether the worker
+    # should be replaced after it.
+    result = {"id": task.get("id"), "fixture": task.get("fixture")}
+    limits = task.get("limits") or {}
+    executor.iterationLimit = limits.get("iterationLimit")
+    executor.stepLimit = limits.get("stepLimit")
+    executor.timeLimit = limits.get("timeLimit")
+    stdout = io.StringIO()
+    stdout.write = executor.wrapStdout(stdout.write)
+    stderr = io.StringIO()
+    start = time.perf_counter()
+    try:
+        tree = task.get("tree") or splootFromPython(task["source"])
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            savedStdin = sys.stdin
+            sys.stdin = io.StringIO("".join(task.get("stdin") or []))
+            try:
+                capture, response = executor.executePythonFile(tree, task.get("runType", "COMMAND_LINE"), task.get("event"), None, task.get("profile"), task.get("tracingBackend", "AST"))
+            finally:
+                sys.stdin = savedStdin
+    except Exception as e:
+        # The program couldn't be converted or run at all.
+        result.update(status=ERROR, error=f"{type(e).__name__}: {e}", seconds=time.perf_counter() - start)
+        return result, False
+    result.update(
+        status=OK,
+        seconds=time.perf_counter() - start,
+        stdout=stdout.getvalue(),
+        stderr=stderr.getvalue(),
+        capture=capture,
+        response=response,
+    )
+    outOfMemory = (capture.get("lastException") or {}).get("type") == "MemoryError"
+    return result, outOfMemory
+
+
+def workerMain(connection, memoryLimit, preload):
+    limitMemory(memoryLimit)
+    # Tasks are separate programs, not reruns of each other.
+    executor.diffReruns = False
+    for name in preload:
+        importlib.import_module(name)
+    while True:
+        task = connection.recv()
+        if task is None:
+            break
+        connection.send(runTask(task))
+
+
+class Worker:
+    def __init__(self, context, memoryLimit, preload):
+        self.connection, child = context.Pipe()
+        self.process = context.Process(target=workerMain, args=(child, memoryLimit, preload), daemon=True)
+        self.process.start()
+        child.close()
+        self.tasks = 0
+        self.task = None
+        self.started = None
+        self.deadline = None
+
+    def submit(self, task, timeout):
+        self.task = task
+        self.tasks += 1
+        self.started = time.monotonic()
+        self.deadline = self.started + timeout + TIMEOUT_GRACE
+        self.connection.send(task)
+
+    def finish(self):
+        task = self.task
+        self.task = None
+        return task
+
+    def stop(self):
+        try:
+            self.connection.send(None)
+        except OSError:
+            pass
+        self.process.join(1)
+        self.kill()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+
+def failedResult(worker, status):
+    task = worker.task
+    return {"id": task.get("id"), "fixture": task.get("fixture"), "status": status, "seconds": time.monotonic() - worker.started}
+
+
+def runBatch(tasks, processes=None, timeout=DEFAULT_TIMEOUT, memoryLimit=None, preload=PRELOADED_MODULES):
+    # Yields the result of each task as it finishes, with "index", its place in tasks.
+    # A task is a dict with "id", a "tree" or Python "source", and optionally
+    # "stdin" (a list of lines), "fixture" (the name of those lines),
+    # "runType", "event", "limits", "profile" and "tracingBackend". Tasks
+    # without a time limit are given their timeout as one. memoryLimit is in
+    # megabytes, per worker.
+    context = multiprocessing.get_context()
+    pending = enumerate(tasks)
+    workers = []
+
+    def startWorker():
+        return Worker(context, memoryLimit, preload)
+
+    try:
+        workers = [startWorker() for _ in range(processes or os.cpu_count() or 1)]
+        while True:
+            for worker in workers:
+                if worker.task is None:
+                    index, task = next(pending, (None, None))
+                    if task is None:
+                        break
+                    limits = dict(task.get("limits") or {})
+                    if not limits.get("timeLimit"):
+                        limits["timeLimit"] = timeout
+                    worker.submit(dict(task, limits=limits, index=index), timeout)
+            running = [worker for worker in workers if worker.task is not None]
+            if not running:
+                break
+            wait = max(0, min(worker.deadline for worker in running) - time.monotonic())
+            ready = multiprocessing.connection.wait([worker.connection for worker in running], wait)
+            for worker in running:
+                replace = False
+                if worker.connection in ready:
+                    try:
+                        result, replace = worker.connection.recv()
+                    except EOFError:
+                        result = failedResult(worker, CRASHED)
+                        replace = True
+                elif time.monotonic() >= worker.deadline:
+                    result = failedResult(worker, TIMEOUT)
+                    replace = True
+                else:
+                    continue
+                result["index"] = worker.finish()["index"]
+                if replace or worker.tasks >= TASKS_PER_WORKER:
+                    worker.kill()
+                    workers[workers.index(worker)] = startWorker()
+                yield result
+    finally:
+        for worker in workers:
+            worker.stop()
+
+
+def loadPrograms(paths):
+    # Python files, serialized Sploot trees (.json), or JSON lines files (.jsonl)
+    # with a program per line, as {"id", "tree"} or {"id", "source"}.
+    programs = []
+    for path in paths:
+        with open(path) as f:
+            if path.endswith(".jsonl"):
+                programs.extend(json.loads(line) for line in f if line.strip())
+            elif path.endswith(".json"):
+                programs.append({"id": path, "tree": json.load(f)})
+            else:
+                programs.append({"id": path, "source": f.read()})
+    return programs
+
+
+def fixtureTasks(programs, fixtures):
+    # A task for each program with each stdin fixture, a name -> input lines dict.
+    if not fixtures:
+        return list(programs)
+    return [
+        dict(program, fixture=name, stdin=[line + "\n" for line in lines])
+        for program in programs
+        for name, lines in fixtures.items()
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run many Sploot programs (trees or Python source) across a pool of worker processes, and write their results as JSON lines.')
+    parser.add_argument('programs', nargs='+', help='Python files, serialized trees (.json) or JSON lines files of programs (.jsonl)')
+    parser.add_argument('--fixtures', metavar='FILE', help='JSON file of name -> input lines, each program is run with each of them')
+    parser.add_argument('-j', '--processes', type=int, help='number of worker processes, the number of CPUs by default')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT, help='seconds each run can take')
+    parser.add_argument('--memory-limit', type=int, help='megabytes of memory each worker can use')
+    parser.add_argument('--iteration-limit', type=int, help='loop iterations captured per loop')
+    parser.add_argument('--step-limit', type=int, help='steps before a run is stopped')
+    parser.add_argument('--tracing-backend', choices=executor.TRACING_BACKENDS, default='AST', help='how runs are traced, see executor.TRACING_BACKENDS')
+    parser.add_argument('-o', '--output', metavar='FILE', default='-', help='file for the results, - for stdout (the default)')
+    args = parser.parse_args(argv)
+
+    fixtures = None
+    if args.fixtures:
+        with open(args.fixtures) as f:
+            fixtures = json.load(f)
+    limits = {"iterationLimit": args.iteration_limit, "stepLimit": args.step_limit}
+    tasks = [dict(task, limits=limits, tracingBackend=args.tracing_backend) for task in fixtureTasks(loadPrograms(args.programs), fixtures)]
+
+    counts = {}
+    start = time.perf_counter()
+    out = sys.stdout if args.output == '-' else open(args.output, "w")
+    try:
+        for result in runBatch(tasks, args.processes, args.timeout, args.memory_limit):
+            counts[result["status"]] = counts.get(result["status"], 0) + 1
+            out.write(json.dumps(result) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(json.dumps({"tasks": len(tasks), "statuses": counts, "seconds": time.perf_counter() - start}), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
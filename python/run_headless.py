@@ -0,0 +1,177 @@
+import argparse
+import json
+import sys
+import types
+
+import executor
+from capture_encoding import decodeReport
+from convert_ast import splootFromPython
+
+
+# Runs Sploot trees under plain CPython, without the browser. executor.run()
+# imports the modules that the runtime worker registers with Pyodide:
+# fakeprint, nodetree, runtime_capture and web_response. This file installs
+# local stand-ins for them. Each stand-in passes on what the worker would have
+# posted, as a message dict in the worker's format, to a send callback. The
+# command line writes those messages out as JSON lines as they happen.
+
+RUN_TYPES = ["COMMAND_LINE", "HTTP_REQUEST", "SCHEDULE"]
+PROFILE_TYPES = ["TIME", "MEMORY", "CALLS"]
+
+
+class HeadlessStdout:
+    def __init__(self, runtime, stream):
+        self.runtime = runtime
+        self.stream = stream
+
+    def write(self, s):
+        self.runtime.send({"type": self.stream, self.stream: s})
+
+    def flush(self):
+        pass
+
+
+class HeadlessStdin:
+    # Like a rerun in the worker, all the input lines are given up front, and
+    # each one is echoed to stdout when it's read.
+    def __init__(self, runtime):
+        self.runtime = runtime
+        self.lines = []
+
+    def readline(self):
+        if len(self.lines) == 0:
+            return ''
+        line = self.lines.pop(0)
+        self.runtime.send({"type": "stdout", "stdout": line})
+        return line
+
+
+class HeadlessRuntime:
+    def __init__(self):
+        self.send = None
+        self.tree = None
+        self.stdin = HeadlessStdin(self)
+        self.modules = {
+            "fakeprint": types.SimpleNamespace(
+                stdout=HeadlessStdout(self, "stdout"),
+                stderr=HeadlessStdout(self, "stderr"),
+                stdin=self.stdin,
+            ),
+            "nodetree": types.SimpleNamespace(getNodeTree=lambda: self.tree),
+            "runtime_capture": types.SimpleNamespace(report=self.reportCapture),
+            "web_response": types.SimpleNamespace(report=self.reportResponse),
+        }
+
+    def start(self, tree, stdinLines, send):
+        self.tree = tree
+        self.stdin.lines = list(stdinLines)
+        self.send = send
+
+    def reportCapture(self, encoded):
+        self.send({"type": "runtime_capture", "capture": decodeReport(encoded)})
+
+    def reportResponse(self, response):
+        self.send({"type": "web_response", "response": json.loads(response)})
+
+
+runtime = None
+
+
+def installRuntime():
+    # The stand-ins are installed once. The executor wraps fakeprint's stdout
+    # and stdin the first time it runs, and keeps them wrapped for every run after.
+    global runtime
+    if runtime is None:
+        runtime = HeadlessRuntime()
+        sys.modules.update(runtime.modules)
+        executor.runtimeIOInstalled = False
+    return runtime
+
+
+def runTree(tree, send, runType="COMMAND_LINE", eventData=None, stdinLines=(), limits=None, profile=None, tracingBackend="AST"):
+    # Runs the tree like the runtime worker does, calling send with each
+    # message. Returns the whole capture and the response.
+    if tree["type"] != "PYTHON_FILE":
+        raise ValueError("Can only run a PYTHON_FILE tree, not " + tree["type"])
+    installRuntime().start(tree, stdinLines, send)
+    # Every run's reports stand alone: the first one is the whole capture, not
+    # a diff against the previous run's.
+    executor.previousDigest = None
+    saved = sys.stdout, sys.stderr, sys.stdin
+    try:
+        executor.run(tree, runType, eventData, limits, None, profile, tracingBackend)
+    finally:
+        sys.stdout, sys.stderr, sys.stdin = saved
+    send({"type": "finished"})
+    return executor.capture.toDict(), executor.response
+
+
+def loadTree(path, python=None):
+    # A serialized Sploot tree, or Python source (by default when the file
+    # ends with .py) converted to one.
+    with open(path) as f:
+        text = f.read()
+    if python is None:
+        python = path.endswith(".py")
+    if python:
+        return splootFromPython(text)
+    return json.loads(text)
+
+
+def jsonLinesWriter(out):
+    def send(message):
+        out.write(json.dumps(message) + "\n")
+        out.flush()
+    return send
+
+
+def writeJSON(path, value):
+    with open(path, "w") as f:
+        json.dump(value, f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run a Sploot tree, or Python source, without the browser. Writes what the '
+                                     'runtime worker would post (stdout, stderr, capture reports and the response) as JSON lines.')
+    parser.add_argument('program', help='a serialized Sploot tree (JSON) or a Python file')
+    parser.add_argument('--python', action='store_true', default=None, help='read the program as Python source, whatever its file name')
+    parser.add_argument('--stdin', metavar='FILE', help='file with the lines to give to input()')
+    parser.add_argument('--input', metavar='LINE', action='append', default=[], help='a line to give to input(), after the ones from --stdin')
+    parser.add_argument('--run-type', choices=RUN_TYPES, default='COMMAND_LINE')
+    parser.add_argument('--event', metavar='FILE', help='JSON file with the event of a HTTP_REQUEST run')
+    parser.add_argument('--iteration-limit', type=int, help='loop iterations captured per loop')
+    parser.add_argument('--step-limit', type=int, help='steps before the run is stopped')
+    parser.add_argument('--time-limit', type=float, help='seconds before the run is stopped')
+    parser.add_argument('--profile', choices=PROFILE_TYPES, help='profile the run instead of tracing it')
+    parser.add_argument('--tracing-backend', choices=executor.TRACING_BACKENDS, default='AST', help='trace the run with the traced code (AST, the default) or the interpreter\'s tracing hooks (HOOKS)')
+    parser.add_argument('-o', '--output', metavar='FILE', default='-', help='file for the JSON lines, - for stdout (the default)')
+    parser.add_argument('--capture', metavar='FILE', help='file to write the whole capture to, as JSON')
+    parser.add_argument('--response', metavar='FILE', help='file to write the response to, as JSON')
+    args = parser.parse_args(argv)
+
+    tree = loadTree(args.program, args.python)
+    stdinLines = []
+    if args.stdin:
+        with open(args.stdin) as f:
+            stdinLines = f.readlines()
+    stdinLines.extend(line + "\n" for line in args.input)
+    eventData = None
+    if args.event:
+        with open(args.event) as f:
+            eventData = json.load(f)
+    limits = {"iterationLimit": args.iteration_limit, "stepLimit": args.step_limit, "timeLimit": args.time_limit}
+
+    out = sys.stdout if args.output == '-' else open(args.output, "w")
+    try:
+        capture, response = runTree(tree, jsonLinesWriter(out), args.run_type, eventData, stdinLines, limits, args.profile, args.tracing_backend)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    if args.capture:
+        writeJSON(args.capture, capture)
+    if args.response:
+        writeJSON(args.response, response)
+
+
+if __name__ == '__main__':
+    main()
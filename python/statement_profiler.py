@@ -0,0 +1,159 @@
+import ast
+import time
+
+
+# Times each statement of a program for a profiled run. The untraced code of
+# the program is compiled with a call to the profiler's mark() before every
+# statement, with the statement's line number in the editor. Each mark adds
+# the time since the previous one to the statement that was running, so a
+# statement's time is its own, not counting the statements of the functions
+# it calls.
+#
+# The body of each function is bracketed by a call to enterCall() and, in a
+# finally, to leaveCall(), so that when a call returns the statement that
+# made it is running again, and the rest of its time is counted to it rather
+# than to the last statement of the function.
+#
+# The hits and times are kept in flat lists indexed by line number, and
+# nothing is captured while the program runs.
+
+MARK_HOOK = "__spt__mark__"
+CALL_HOOK = "__spt__statementCall__"
+RETURN_HOOK = "__spt__statementReturn__"
+
+IF_TYPE = "PYTHON_IF_STATEMENT"
+ELIF_TYPE = "PYTHON_ELIF_STATEMENT"
+
+
+def addStatementMarks(statements, types):
+    # Puts a mark before every statement (and elif) from the editor's tree, in place.
+    i = 0
+    while i < len(statements):
+        node = statements[i]
+        if type(node) is ast.If:
+            addIfMarks(node, types)
+        else:
+            for block in ("body", "orelse"):
+                if hasattr(node, block):
+                    addStatementMarks(getattr(node, block), types)
+        if type(node) is ast.FunctionDef:
+            node.body = [hookCall(CALL_HOOK), ast.Try(node.body, [], [], [hookCall(RETURN_HOOK)])]
+        lineno = getattr(node, "lineno", None)
+        if lineno is not None:
+            statements.insert(i, markStatement(lineno))
+            i += 1
+        i += 1
+    return statements
+
+
+def addIfMarks(node, types):
+    # An elif is an if on its own in the else of an if. Elifs of trees
+    # converted from Python source have no line number, and are left unmarked.
+    addStatementMarks(node.body, types)
+    if len(node.orelse) == 1 and type(node.orelse[0]) is ast.If:
+        elifNode = node.orelse[0]
+        addIfMarks(elifNode, types)
+        if types.get(elifNode.lineno) in (ELIF_TYPE, IF_TYPE):
+            node.orelse.insert(0, markStatement(elifNode.lineno))
+    else:
+        addStatementMarks(node.orelse, types)
+
+
+def markStatement(lineno):
+    mark = ast.Call(ast.Name(MARK_HOOK, ast.Load()), args=[ast.Constant(lineno)], keywords=[])
+    return ast.Expr(mark, lineno=lineno)
+
+
+def hookCall(name):
+    return ast.Expr(ast.Call(ast.Name(name, ast.Load()), args=[], keywords=[]))
+
+
+def statementTypes(node, types):
+    # Line number -> node type of each statement (and elif) in the editor's tree.
+    lineno = (node.get("meta") or {}).get("lineno")
+    if lineno is not None:
+        if node["type"] == "PYTHON_STATEMENT" and len(node["childSets"]["statement"]) != 0:
+            types[lineno] = node["childSets"]["statement"][0]["type"]
+        else:
+            types[lineno] = node["type"]
+    for children in node["childSets"].values():
+        for child in children:
+            statementTypes(child, types)
+    return types
+
+
+class ProfiledProgram:
+    def __init__(self, code, types, functions=None):
+        self.code = code
+        self.types = types
+        # The function declarations of a call profiled run, see call_profiler.py.
+        self.functions = functions
+        # Line numbers start at 1, index 0 is for the time outside any statement.
+        self.size = max(types, default=0) + 1
+
+
+class StatementProfiler:
+    def __init__(self, program):
+        self.program = program
+        self.hits = [0] * program.size
+        self.times = [0] * program.size
+        # The running statement and when it started.
+        self.running = [0, 0]
+        # The statements that made the running calls.
+        self.callers = []
+        self.totalTime = 0
+        self.mark = self.createMark()
+        self.enterCall, self.leaveCall = self.createCallHooks()
+
+    def createMark(self):
+        hits = self.hits
+        times = self.times
+        running = self.running
+        clock = time.perf_counter_ns
+
+        def mark(lineno):
+            now = clock()
+            times[running[0]] += now - running[1]
+            hits[lineno] += 1
+            running[0] = lineno
+            # The time taken by the mark itself isn't counted.
+            running[1] = clock()
+        return mark
+
+    def createCallHooks(self):
+        times = self.times
+        running = self.running
+        callers = self.callers
+        clock = time.perf_counter_ns
+
+        def enterCall():
+            callers.append(running[0])
+
+        def leaveCall():
+            # Like a mark of the calling statement, but it isn't another hit.
+            now = clock()
+            times[running[0]] += now - running[1]
+            running[0] = callers.pop()
+            running[1] = clock()
+        return enterCall, leaveCall
+
+    def run(self, globals):
+        globals[MARK_HOOK] = self.mark
+        globals[CALL_HOOK] = self.enterCall
+        globals[RETURN_HOOK] = self.leaveCall
+        start = self.running[1] = time.perf_counter_ns()
+        try:
+            exec(self.program.code, globals)
+        finally:
+            end = time.perf_counter_ns()
+            self.times[self.running[0]] += end - self.running[1]
+            self.totalTime = end - start
+
+    def report(self):
+        # The statements that ran, the slowest first, by the editor's line numbers.
+        statements = []
+        for lineno, hits in enumerate(self.hits):
+            if hits != 0:
+                statements.append({"lineno": lineno, "type": self.program.types.get(lineno), "hits": hits, "time": self.times[lineno]})
+        statements.sort(key=lambda entry: entry["time"], reverse=True)
+        return {"time": self.totalTime, "statements": statements}
@@ -0,0 +1,125 @@
+import base64
+import contextlib
+import io
+import json
+import os
+from unittest import mock
+
+import capture_encoding
+import executor
+from capture_encoding import encodeCapture, encodeReport
+from executor import executePythonFile, wrapStdout, wrapStdin
+from convert_ast import splootFromPython
+
+
+# Records capture reports from the executor, encoded as they are sent to the
+# runtime worker, for the runtime-python package's tests of the capture
+# decoder and stream. Run this module to write them again after changing the
+# executor's reports:
+#
+#     python -m tests.capture_reports
+
+RECORDING_PATH = os.path.join(os.path.dirname(__file__), '..', '..', 'packages', 'runtime-python', 'src', 'tests', 'test_data', 'capture_reports.json')
+
+# Runs of each scenario follow one another, so that later runs are diffed
+# against the capture of the one before. Reports of "binary" scenarios are
+# all sent in the binary encoding, like those of big captures.
+SCENARIOS = [
+    {'name': 'input in a loop', 'runs': [{'source': '''
+total = 0
+for i in range(5):
+    n = int(input())
+    total = total + n
+print(total)
+''', 'inputs': ['1\n', '2\n', '3\n', '4\n', '5\n']}]},
+    {'name': 'sampled loop', 'iterationLimit': 4, 'binary': True, 'runs': [{'source': '''
+x = 0
+while x < 12:
+    x = x + 1
+    if x % 3 == 0:
+        y = input()
+''', 'inputs': ['a\n'] * 4}]},
+    {'name': 'input inside functions', 'runs': [{'source': '''
+def ask(prompt):
+    print(prompt)
+    return input()
+
+def askTwice():
+    return ask('a') + ask('b')
+
+results = []
+for i in range(3):
+    results.append(askTwice())
+print(results)
+''', 'inputs': ['x\n'] * 6}]},
+    {'name': 'calls let go of', 'runs': [{'source': '''
+def down(n):
+    if n % 40 == 0:
+        x = input()
+    if n > 0:
+        down(n - 1)
+
+down(130)
+''', 'inputs': ['x\n'] * 4}]},
+    {'name': 'exception', 'runs': [{'source': '''
+name = input()
+print(1 / 0)
+''', 'inputs': ['Fred\n']}]},
+    {'name': 'reruns', 'binary': True, 'runs': [
+        {'source': 'names = []\nfor i in range(20):\n    names.append("name" + str(i))\nprint(len(names))', 'inputs': []},
+        {'source': 'names = []\nfor i in range(20):\n    names.append("name" + str(i))\nprint(len(names))', 'inputs': []},
+        {'source': 'names = []\nfor i in range(21):\n    names.append("name" + str(i))\nprint(len(names))', 'inputs': []},
+        {'source': 'for i in range(10):\n    print(i)\nname = input()\nprint(name)', 'inputs': ['Fran\n']},
+        {'source': 'print("hello")\ny = 1', 'inputs': []},
+    ]},
+]
+
+# A value with every kind of tag, for the decoder.
+ENCODED_VALUE = {
+    'none': None,
+    'bools': [True, False],
+    'ints': [0, 1, -1, 63, 64, -65, 300, 2 ** 40, -(2 ** 40)],
+    'floats': [1.5, -0.25, 1e300],
+    'strings': ['short', 'short', 'héllo ✓', 'long ' * 20, 'long ' * 20, ''],
+    'shapes': [{'a': 1, 'b': [2]}, {'a': 3, 'b': []}, {}],
+}
+
+
+def recordRun(source, inputs):
+    reports = []
+    captures = []
+
+    def report(encoded):
+        reports.append(encoded if isinstance(encoded, str) else {'binary': base64.b64encode(encoded).decode('ascii')})
+        captures.append(json.loads(json.dumps(executor.capture.toDict())))
+
+    lines = list(inputs)
+    stdin = io.StringIO()
+    stdin.readline = wrapStdin(lambda: lines.pop(0) if lines else '', report)
+    f = io.StringIO()
+    f.write = wrapStdout(f.write)
+    with contextlib.redirect_stdout(f), contextlib.redirect_stderr(io.StringIO()), mock.patch('sys.stdin', stdin):
+        executePythonFile(splootFromPython(source))
+    report(encodeReport(executor.reporter.report(), executor.capture.captureSize))
+    return {'reports': reports, 'captures': captures}
+
+
+def recordScenarios():
+    # Each report and, after it, the capture the stream should have rebuilt.
+    scenarios = []
+    for scenario in SCENARIOS:
+        with mock.patch.object(executor, 'iterationLimit', scenario.get('iterationLimit')), \
+                mock.patch.object(executor, 'previousDigest', None), \
+                mock.patch.object(capture_encoding, 'BINARY_REPORT_SIZE', -1 if scenario.get('binary') else capture_encoding.BINARY_REPORT_SIZE):
+            runs = [recordRun(run['source'], run['inputs']) for run in scenario['runs']]
+        scenarios.append({'name': scenario['name'], 'runs': runs})
+    return {
+        'value': {'encoded': base64.b64encode(encodeCapture(ENCODED_VALUE)).decode('ascii'), 'decoded': ENCODED_VALUE},
+        'scenarios': scenarios,
+    }
+
+
+if __name__ == '__main__':
+    with open(RECORDING_PATH, 'w') as f:
+        json.dump(recordScenarios(), f, separators=(',', ':'), ensure_ascii=False)
+        f.write('\n')
@@ -0,0 +1,16 @@
+import io
+import contextlib
+
+from executor import executePythonFile, wrapStdout
+from convert_ast import splootFromPython
+
+
+def runFile(source, profile=None):
+    # Runs Python source, or a sploot file, with stdout written the way the
+    # runtime writes it. Returns the capture and what was printed.
+    splootFile = splootFromPython(source) if isinstance(source, str) else source
+    f = io.StringIO()
+    f.write = wrapStdout(f.write)
+    with contextlib.redirect_stdout(f), contextlib.redirect_stderr(io.StringIO()):
+        cap, _ = executePythonFile(splootFile, profile=profile)
+    return cap, f.getvalue()
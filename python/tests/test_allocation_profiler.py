@@ -0,0 +1,83 @@
+import io
+import json
+import contextlib
+import tracemalloc
+import unittest
+
+from executor import executePythonFile
+from convert_ast import splootFromPython
+from tests.helpers import runFile
+
+
+PROGRAM = '''
+def build(n):
+    items = []
+    for i in range(n):
+        items.append('item ' + str(i))
+    return items
+
+small = [1, 2, 3]
+big = build(20000)
+temporary = len(build(20000))
+print(len(big), temporary)
+'''
+
+
+class AllocationProfilerTest(unittest.TestCase):
+
+    def runMeasured(self, source):
+        cap, out = runFile(source, profile="MEMORY")
+        return json.loads(json.dumps(cap)), out
+
+    def testStatements(self):
+        cap, out = self.runMeasured(PROGRAM)
+        self.assertEqual(out, '20000 20000\n')
+        # Like a time profiled run, nothing is captured.
+        self.assertEqual(cap['root']['data']['body'], [])
+        statements = {entry['lineno']: entry for entry in cap['memory']['statements']}
+        # Statements are numbered as in the editor: build is 1-5, then 6-9.
+        self.assertEqual(sorted(statements), [1, 6, 7, 8, 9])
+        # The big list is kept, the temporary one is freed but had its peak.
+        self.assertGreater(statements[7]['size'], 1000000)
+        self.assertLess(statements[8]['size'], 100000)
+        self.assertGreater(statements[8]['peak'], 1000000)
+        self.assertGreaterEqual(cap['memory']['peak'], statements[8]['peak'])
+
+    def testFunctions(self):
+        cap, _ = self.runMeasured(PROGRAM)
+        build = cap['memory']['functions']['null']
+        self.assertEqual(build['calls'], 2)
+        self.assertGreater(build['size'], 2000000)
+        self.assertGreater(build['peak'], 1000000)
+
+    def testTopAllocatingLines(self):
+        cap, _ = self.runMeasured(PROGRAM)
+        lines = cap['memory']['lines']
+        # Only the strings of the list that's kept are still allocated.
+        self.assertEqual(lines[0]['lineno'], 4)
+        self.assertEqual(lines[0]['type'], 'PYTHON_EXPRESSION')
+        self.assertGreaterEqual(lines[0]['count'], 20000)
+
+    def testStatementThatRaised(self):
+        cap, _ = self.runMeasured('''
+def build(n):
+    items = [0] * n
+    return items[n]
+
+x = build(100000)
+y = 2
+''')
+        self.assertEqual(cap['lastException']['type'], 'IndexError')
+        self.assertEqual([entry['lineno'] for entry in cap['memory']['statements']], [1, 4])
+        self.assertEqual(cap['memory']['functions']['null']['calls'], 1)
+        self.assertGreater(cap['memory']['statements'][1]['peak'], 800000)
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def testUnmeasuredRunHasNoMemory(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            cap, _ = executePythonFile(splootFromPython(PROGRAM))
+        self.assertNotIn('memory', cap)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,9 +2,12 @@ import io
 import contextlib
 import unittest
 import ast
+from unittest import mock
 
+import executor
 from executor import executePythonFile, wrapStdout, getStatementsFromBlock
 from convert_ast import splootFromPython
+from tests.helpers import runFile
 
 TIC_TAC_TOE_CODE = """
 winning_combos = [[0, 1, 2], [3, 4, 5], [6, 7, 8], [0, 3, 6], [1, 4, 7], [2, 5, 8], [0, 4, 8], [2, 4, 6]]
@@ -66,14 +69,28 @@ def get_opposite_symbol(symbol):
 """
 
 SIMPLE_TEST_FUNCTION_GENERATED_CODE  = """def get_opposite_symbol(symbol):
-    t = __spt__.func(None)
+    __spt__step__()
+    __spt__frameno__ = __spt__detachedFramesCount__[None]
+    __spt__detachedFramesCount__[None] = __spt__frameno__ + 1
+    try:
+        if symbol == 'X':
+            return 'O'
+        return 'X'
+    except BaseException as __spt__exception__:
+        __spt__addExceptionFrame__(None, __spt__frameno__, __spt__exception__.__traceback__.tb_lineno, __spt__exception__)
+        raise
+
+@__spt__untracedFunction__(None, get_opposite_symbol)
+def get_opposite_symbol(symbol):
+    __spt__step__()
+    t = __spt__func__(None)
     with t:
         if t.cap:
-            if __spt__.logExpressionResultAndStartFrame('PYTHON_IF_STATEMENT', 'condition', symbol == 'X'):
-                __spt__.startChildSet('trueblock')
-                return __spt__.logExpressionResult('PYTHON_RETURN', {}, 'O')
-            __spt__.endFrame()
-            return __spt__.logExpressionResult('PYTHON_RETURN', {}, 'X')
+            if __spt__logExpressionResultAndStartFrame__('PYTHON_IF_STATEMENT', 'condition', symbol == 'X'):
+                __spt__startChildSet__('trueblock')
+                return __spt__logExpressionResult__('PYTHON_RETURN', {}, 'O')
+            __spt__endFrame__()
+            return __spt__logExpressionResult__('PYTHON_RETURN', {}, 'X')
         else:
             if symbol == 'X':
                 return 'O'
@@ -89,6 +106,17 @@ def recurse(num):
 recurse(0)
 """
 
+MANY_CALLS = """
+def double(x):
+    return x * 2
+
+total = 0
+for i in range(250):
+    total = total + double(i)
+print(total)
+"""
+
+
 class ExecuteTest(unittest.TestCase):
     def testTicTacToeRecursion(self):
         splootFile = splootFromPython(TIC_TAC_TOE_CODE)
@@ -113,6 +141,50 @@ class ExecuteTest(unittest.TestCase):
 
         self.assertEqual(text_code, SIMPLE_TEST_FUNCTION_GENERATED_CODE)
     
+    def testLoopHooksAreBoundLocally(self):
+        splootFile = splootFromPython(TIC_TAC_TOE_CODE)
+
+        statements = getStatementsFromBlock(splootFile["childSets"]["body"], True)
+        mods = ast.Module(body=statements, type_ignores=[])
+        code = compile(ast.fix_missing_locations(mods), "main.py", mode="exec")
+        functions = {const.co_name: const for const in code.co_consts if hasattr(const, 'co_name')}
+
+        # Functions with loops call the hooks through locals (or closure cells for the iterable lambda)
+        loop_function = functions['check_winner']
+        self.assertIn('__spt__logExpressionResult__', loop_function.co_varnames)
+        self.assertIn('__spt__logExpressionResultAndStartFrame__', loop_function.co_cellvars)
+        # Others use the hooks bound once in the module globals.
+        self.assertIn('__spt__logExpressionResult__', functions['get_opposite_symbol'].co_names)
+        self.assertNotIn('__spt__', functions['get_opposite_symbol'].co_names)
+
+    def testFunctionSwapsToUntracedCode(self):
+        splootFile = splootFromPython(MANY_CALLS)
+
+        f = io.StringIO()
+        f.write = wrapStdout(f.write)
+        with contextlib.redirect_stdout(f), mock.patch('executor.FunctionFrame', wraps=executor.FunctionFrame) as frame:
+            cap, _ = executePythonFile(splootFile)
+
+        self.assertEqual(f.getvalue(), '62250\n')
+        self.assertEqual(cap['detached'][None]['count'], 250)
+        # Of the 101 captured calls, the first 50 and the last 50 are kept.
+        framenos = [frame['data']['frameno'] for frame in cap['detached'][None]['frames']]
+        self.assertEqual(framenos, list(range(50)) + list(range(51, 101)))
+        # The call after the last captured frame swaps in the untraced code.
+        self.assertEqual(frame.call_count, 102)
+
+    def testFunctionSwapCanBeDisabled(self):
+        splootFile = splootFromPython(MANY_CALLS)
+
+        f = io.StringIO()
+        f.write = wrapStdout(f.write)
+        with contextlib.redirect_stdout(f), mock.patch('executor.swapUntracedFunctions', False):
+            cap, _ = executePythonFile(splootFile)
+
+        self.assertEqual(f.getvalue(), '62250\n')
+        self.assertEqual(cap['detached'][None]['count'], 250)
+        self.assertEqual(len(cap['detached'][None]['frames']), 100)
+
     def testRrrorDuringRecursion(self):
         splootFile = splootFromPython(RECURSIVE_FUNCTION_WITH_ERROR)
        
@@ -129,3 +201,148 @@ class ExecuteTest(unittest.TestCase):
         self.assertEqual(cap['lastException']['lineno'], 4)
 
         self.assertEqual(f.getvalue(), """200\n""")
+
+    def testRecursionKeepsInnermostCalls(self):
+        splootFile = splootFromPython(RECURSIVE_FUNCTION_WITH_ERROR)
+
+        f = io.StringIO()
+        f.write = wrapStdout(f.write)
+        with contextlib.redirect_stdout(f):
+            cap, _ = executePythonFile(splootFile)
+
+        detached = cap['detached'][None]
+        self.assertEqual(detached['count'], 201)
+        self.assertEqual(detached['depths'], [1] * 201)
+        # The first 50 calls, the last 50 and 50 more of the calls the exception went through.
+        framenos = [frame['data']['frameno'] for frame in detached['frames']]
+        self.assertEqual(framenos, list(range(50)) + list(range(101, 201)))
+        self.assertIn("'type': 'EXCEPTION'", str(detached['frames'][-1]))
+
+
+GROWING_TEXT = """
+text = ''
+for i in range(3000):
+    text = text + 'ab'
+print(len(text))
+"""
+
+
+class CaptureBudgetTest(unittest.TestCase):
+    def testSmallCaptureIsNotTruncated(self):
+        cap, _ = runFile(MANY_CALLS)
+        self.assertNotIn('truncated', cap)
+
+    def testRunawayCaptureFinishesTruncated(self):
+        with mock.patch.object(executor, 'CAPTURE_SIZE_LIMIT', 200_000):
+            cap, out = runFile(GROWING_TEXT)
+
+        self.assertEqual(out, '6000\n')
+        self.assertTrue(cap['truncated'])
+        self.assertNotIn('lastException', cap)
+        self.assertLess(len(str(cap)), 400_000)
+        # The print after the loop ran untraced, but the start of the loop was kept.
+        body = cap['root']['data']['body']
+        self.assertEqual(len(body), 2)
+        frames = body[1]['data']['frames']
+        self.assertEqual(frames[0]['data']['block'][0]['data']['result'], 'ab')
+
+    def testDegradeSteps(self):
+        with mock.patch.object(executor, 'CAPTURE_SIZE_LIMIT', 10_000):
+            capture = executor.SplootCapture()
+            capture.logExpressionResult('PYTHON_EXPRESSION', {}, 'x' * 1000)
+            self.assertEqual(capture.degradeLevel, 0)
+            for _ in range(5):
+                capture.logExpressionResult('PYTHON_EXPRESSION', {}, 'x' * 1000)
+            self.assertEqual(capture.degradeLevel, 1)
+            capture.logExpressionResult('PYTHON_EXPRESSION', {}, 'x' * 1000)
+            self.assertEqual(capture.root.blocks['body'][-1][1], 'x' * executor.SHORT_PREVIEW_LIMIT + '...')
+
+            capture.captureSize = 8000
+            capture.logExpressionResult('PYTHON_EXPRESSION', {}, 1)
+            self.assertEqual(capture.degradeLevel, 2)
+            capture.startFrame('PYTHON_WHILE_LOOP', 'frames')
+            self.assertEqual(capture.stack[-1].sampleSize, executor.DEGRADED_LOOP_SAMPLE_SIZE)
+            capture.endFrame()
+
+            capture.captureSize = 10_000
+            capture.logExpressionResult('PYTHON_EXPRESSION', {}, 1)
+            self.assertEqual(capture.degradeLevel, 3)
+            recorded = len(capture.root.blocks['body'])
+            capture.logExpressionResult('PYTHON_EXPRESSION', {}, 2)
+            capture.startFrame('PYTHON_WHILE_LOOP', 'frames')
+            capture.endFrame()
+            self.assertEqual(len(capture.root.blocks['body']), recorded)
+        self.assertTrue(capture.toDict()['truncated'])
+
+    def testFunctionsRunUntracedOnceRecordingStops(self):
+        with mock.patch.object(executor, 'CAPTURE_SIZE_LIMIT', 3000), \
+                mock.patch('executor.FunctionFrame', wraps=executor.FunctionFrame) as frame:
+            cap, out = runFile(MANY_CALLS)
+
+        self.assertEqual(out, '62250\n')
+        self.assertTrue(cap['truncated'])
+        self.assertLess(len(cap['detached'][None]['frames']), 20)
+        self.assertEqual(frame.call_count, len(cap['detached'][None]['frames']))
+
+
+class StdoutSideEffectTest(unittest.TestCase):
+    def testWritesAreCoalescedPerStatement(self):
+        cap, out = runFile('print("a", 1, "b", sep="-")\nprint()')
+        self.assertEqual(out, 'a-1-b\n\n')
+        body = cap['root']['data']['body']
+        self.assertEqual(body[0]['sideEffects'], [{'type': 'stdout', 'value': 'a-1-b\n'}])
+        self.assertEqual(body[1]['sideEffects'], [{'type': 'stdout', 'value': '\n'}])
+
+    def testStatementBudget(self):
+        with mock.patch.object(executor, 'STATEMENT_STDOUT_LIMIT', 10):
+            cap, out = runFile('for i in range(3):\n    print("x" * 8)')
+            _, longLine = runFile('print("y" * 25)')
+
+        self.assertEqual(out, 'xxxxxxxx\n' * 3)
+        frames = cap['root']['data']['body'][0]['data']['frames']
+        for frame in frames[:3]:
+            self.assertEqual(frame['data']['block'][0]['sideEffects'], [{'type': 'stdout', 'value': 'xxxxxxxx\n'}])
+        self.assertEqual(longLine, 'y' * 25 + '\n')
+        cap = executor.capture.toDict()
+        self.assertEqual(cap['root']['data']['body'][0]['sideEffects'],
+                         [{'type': 'stdout', 'value': 'y' * 10, 'elided': 16}])
+
+    def testRunBudget(self):
+        with mock.patch.object(executor, 'RUN_STDOUT_LIMIT', 100):
+            cap, out = runFile('for i in range(50):\n    print(i)')
+
+        self.assertEqual(len(out), 140)
+        frames = cap['root']['data']['body'][0]['data']['frames']
+        printed = [frame['data']['block'][0]['sideEffects'][0] for frame in frames if frame['type'] == 'PYTHON_FOR_LOOP_ITERATION']
+        self.assertEqual(''.join(effect['value'] for effect in printed), out[:100])
+        self.assertEqual(sum(effect.get('elided', 0) for effect in printed), 40)
+
+    def testStdoutIsStoredOnce(self):
+        capture = executor.SplootCapture()
+        capture.logStdout('hello')
+        capture.logStdout(' world')
+        capture.logExpressionResult('PYTHON_EXPRESSION', {}, None)
+        capture.logStdout('again')
+        capture.logExpressionResult('PYTHON_EXPRESSION', {}, None)
+        first, second = capture.root.blocks['body']
+        self.assertIs(first[4][0].buffer, second[4][0].buffer)
+        self.assertEqual(capture.stdout.text(), 'hello worldagain')
+        self.assertEqual(capture.toDict()['root']['data']['body'][1]['sideEffects'], [{'type': 'stdout', 'value': 'again'}])
+
+    def testStdoutRangesAreReadFromTheirWrites(self):
+        buffer = executor.StdoutBuffer()
+        for part in ['ab', 'cde', '', 'f', 'ghij']:
+            buffer.write(part)
+        text = 'abcdefghij'
+        for start in range(len(text) + 1):
+            for end in range(start, len(text) + 1):
+                self.assertEqual(buffer.slice(start, end), text[start:end])
+
+    @mock.patch.object(executor, 'CAPTURE_SIZE_LIMIT', 1000)
+    def testStdoutCountsTowardsDegrading(self):
+        capture = executor.SplootCapture()
+        for i in range(10):
+            capture.logStdout('x' * 60)
+        # A statement that's still printing degrades the capture, before its result is logged.
+        self.assertEqual(capture.degradeLevel, 1)
+        self.assertEqual(capture.previewLimit, executor.SHORT_PREVIEW_LIMIT)
@@ -0,0 +1,115 @@
+import json
+import unittest
+
+from convert_ast import splootFromPython
+from tests.helpers import runFile
+
+
+PROGRAM = '''
+def fib(n):
+    if n < 2:
+        return n
+    return fib(n - 1) + fib(n - 2)
+
+def work(n):
+    total = 0
+    for i in range(n):
+        total = total + i
+    return total + fib(10)
+
+print(work(5000), fib(5))
+'''
+
+
+class CallProfilerTest(unittest.TestCase):
+
+    def runProfiled(self, tree):
+        cap, out = runFile(tree, profile="CALLS")
+        return json.loads(json.dumps(cap)), out
+
+    def programTree(self):
+        tree = splootFromPython(PROGRAM)
+        # Functions converted from Python source have no id, the editor gives them one.
+        for statement, funcId in zip(tree['childSets']['body'], ['fib-id', 'work-id']):
+            statement['childSets']['statement'][0]['properties']['id'] = funcId
+        return tree
+
+    def testFunctions(self):
+        cap, out = self.runProfiled(self.programTree())
+        self.assertEqual(out, '12497555 5\n')
+        module, fib, work = cap['callgraph']['functions']
+        self.assertEqual((module['id'], module['name'], module['calls']), (None, '<module>', 1))
+        self.assertEqual((fib['id'], fib['name'], fib['lineno'], fib['calls']), ('fib-id', 'fib', 1, 177 + 15))
+        self.assertEqual((work['id'], work['name'], work['lineno'], work['calls']), ('work-id', 'work', 5, 1))
+        # Recursive calls are only counted once in the total time.
+        self.assertLess(fib['totalTime'], module['totalTime'])
+        self.assertGreater(work['totalTime'], work['selfTime'])
+        selfTimes = sum(function['selfTime'] for function in cap['callgraph']['functions'])
+        self.assertLessEqual(selfTimes, module['totalTime'])
+
+    def testEdges(self):
+        cap, _ = self.runProfiled(self.programTree())
+        edges = {(caller, callee): (calls, time) for caller, callee, calls, time in cap['callgraph']['edges']}
+        # Indexes are into the list of functions: the module, fib then work.
+        self.assertEqual(sorted(edges), [(0, 1), (0, 2), (1, 1), (2, 1)])
+        self.assertEqual(edges[(0, 1)][0], 1)
+        self.assertEqual(edges[(2, 1)][0], 1)
+        self.assertEqual(edges[(1, 1)][0], 176 + 14)
+        # The time of a call from work to fib is part of work's call from the module.
+        self.assertLess(edges[(2, 1)][1], edges[(0, 2)][1])
+        self.assertEqual(edges[(0, 2)][1], cap['callgraph']['functions'][2]['totalTime'])
+
+    def testRecursiveEdges(self):
+        cap, _ = self.runProfiled(splootFromPython('''
+def down(n):
+    total = 0
+    for i in range(200):
+        total = total + i
+    if n > 0:
+        down(n - 1)
+
+def even(n):
+    if n > 0:
+        odd(n - 1)
+
+def odd(n):
+    if n > 0:
+        even(n - 1)
+
+down(20)
+even(20)
+'''))
+        callgraph = cap['callgraph']
+        edges = {(caller, callee): (calls, time) for caller, callee, calls, time in callgraph['edges']}
+        self.assertEqual(edges[(1, 1)][0], 20)
+        self.assertEqual((edges[(2, 3)][0], edges[(3, 2)][0]), (10, 10))
+        # A recursive edge's time is that of its outermost call, which has the others nested in it.
+        down = callgraph['functions'][1]
+        self.assertGreater(edges[(1, 1)][1], 0)
+        self.assertLess(edges[(1, 1)][1], down['totalTime'])
+        self.assertGreater(edges[(2, 3)][1], edges[(3, 2)][1])
+        self.assertLess(edges[(2, 3)][1], callgraph['functions'][2]['totalTime'])
+
+    def testCallThatRaised(self):
+        cap, _ = self.runProfiled(splootFromPython('''
+def bad(n):
+    if n == 0:
+        return 1 / 0
+    return bad(n - 1)
+
+x = bad(3)
+'''))
+        self.assertEqual(cap['lastException']['type'], 'ZeroDivisionError')
+        bad = cap['callgraph']['functions'][1]
+        self.assertEqual(bad['calls'], 4)
+        self.assertGreater(bad['totalTime'], 0)
+        self.assertEqual(sorted(edge[:3] for edge in cap['callgraph']['edges']), [[0, 1, 1], [1, 1, 3]])
+
+    def testNothingIsCaptured(self):
+        cap, _ = self.runProfiled(self.programTree())
+        self.assertEqual(cap['root']['data']['body'], [])
+        self.assertEqual(cap['detached'], {})
+
+
+if __name__ == '__main__':
+    unittest.main()
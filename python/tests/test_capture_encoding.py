@@ -0,0 +1,59 @@
+import json
+import unittest
+from unittest import mock
+
+import capture_encoding
+from capture_encoding import encodeCapture, decodeCapture, encodeReport, decodeReport, MAGIC, INTERNED_STRING_LENGTH
+from tests.helpers import runFile
+from tests.test_annotation_limits_executor import TIC_TAC_TOE_CODE, RECURSIVE_FUNCTION_WITH_ERROR
+
+
+class CaptureEncodingTest(unittest.TestCase):
+    def assertRoundTrip(self, value):
+        encoded = encodeCapture(value)
+        self.assertIsInstance(encoded, memoryview)
+        self.assertEqual(bytes(encoded[:len(MAGIC)]), MAGIC)
+        # The decoder gives back what the JSON encoding would have.
+        self.assertEqual(decodeCapture(encoded), json.loads(json.dumps(value)))
+        return encoded
+
+    def testValues(self):
+        self.assertRoundTrip({
+            'ints': [0, 1, -1, 63, -64, 127, 128, 2 ** 40, -(2 ** 70)],
+            'floats': [0.0, -1.5, 1e300],
+            'constants': [None, True, False],
+            'strings': ['', 'a', 'é ☃', 'x' * (INTERNED_STRING_LENGTH + 1)],
+            'nested': {'a': [{'b': 1}, {'b': 2}], 'c': ()},
+            None: 'null key',
+        })
+
+    def testCaptures(self):
+        for source in [TIC_TAC_TOE_CODE, RECURSIVE_FUNCTION_WITH_ERROR, 'for char in "hello":\n    print(char)\n']:
+            cap = runFile(source)[0]
+            encoded = self.assertRoundTrip(cap)
+            self.assertLess(len(encoded), len(json.dumps(cap)) / 3)
+
+    def testStringsAndShapesAreInterned(self):
+        entries = [{'type': 'PYTHON_EXPRESSION', 'data': {'result': 'None', 'resultType': 'NoneType'}}] * 100
+        encoded = self.assertRoundTrip(entries)
+        self.assertEqual(bytes(encoded).count(b'PYTHON_EXPRESSION'), 1)
+        self.assertEqual(bytes(encoded).count(b'resultType'), 1)
+        # Repeated entries are a tag and an index per object and per string.
+        self.assertLessEqual(len(encoded), 100 * 10 + 100)
+
+    def testReportsOfBigCapturesAreBinary(self):
+        value = {'root': {'type': 'PYTHON_FILE', 'data': {'body': [{'data': {'result': str(i)}} for i in range(300)]}}}
+        with mock.patch.object(capture_encoding, 'BINARY_REPORT_SIZE', 1000):
+            small = encodeReport(value, 1000)
+            big = encodeReport(value, 1001)
+        self.assertEqual(small, json.dumps(value))
+        self.assertEqual(bytes(big[:len(MAGIC)]), MAGIC)
+        self.assertEqual(decodeReport(small), decodeReport(big))
+
+    def testUnsupportedValue(self):
+        with self.assertRaises(TypeError):
+            encodeCapture({'a': object()})
+
+    def testNotACapture(self):
+        with self.assertRaises(ValueError):
+            decodeCapture(b'{"root": {}}')
@@ -0,0 +1,287 @@
+import base64
+import io
+import json
+import contextlib
+import unittest
+from unittest import mock
+
+import executor
+from capture_encoding import encodeReport, decodeReport, decodeCapture
+from executor import executePythonFile, wrapStdout, wrapStdin
+from convert_ast import splootFromPython
+from tests.capture_reports import RECORDING_PATH, recordScenarios
+
+
+def stripIds(value):
+    if isinstance(value, dict):
+        return {key: stripIds(item) for key, item in value.items() if key != 'id'}
+    if isinstance(value, list):
+        return [stripIds(item) for item in value]
+    return value
+
+
+# The keys that CaptureStream in capture_stream.ts copies from a report, besides the frames.
+CAPTURE_KEYS = ['truncated', 'lastException', 'budgetExceeded', 'profile', 'memory', 'callgraph']
+
+
+class CaptureStream:
+    # Rebuilds the full capture from reports, the same way the runtime worker does.
+    def __init__(self):
+        self.capture = None
+        self.frames = {}
+
+    def indexFrames(self, value):
+        if isinstance(value, dict):
+            if 'id' in value:
+                self.frames[value['id']] = value
+            for item in value.values():
+                self.indexFrames(item)
+        elif isinstance(value, list):
+            for item in value:
+                self.indexFrames(item)
+
+    def resolve(self, path):
+        value = self.capture
+        for key in path:
+            value = value['null' if key is None else key]
+        return value
+
+    def applyDiff(self, ops):
+        self.frames = {}
+        for op, path, *value in ops:
+            if op == 'extend':
+                self.resolve(path).extend(value[0])
+                self.indexFrames(value[0])
+            elif op == 'trim':
+                del self.resolve(path)[value[0]:]
+            elif op == 'id':
+                self.frames[value[0]] = self.resolve(path)
+            else:
+                parent = self.resolve(path[:-1])
+                key = 'null' if path[-1] is None else path[-1]
+                if op == 'set':
+                    parent[key] = value[0]
+                    self.indexFrames(value[0])
+                else:
+                    del parent[key]
+
+    def apply(self, report):
+        report = json.loads(json.dumps(report))
+        if report.get('diff'):
+            self.applyDiff(report['ops'])
+            return self.capture
+        if not report.get('delta'):
+            self.capture = {'root': report['root'], 'detached': report['detached']}
+            for key in CAPTURE_KEYS:
+                if key in report:
+                    self.capture[key] = report[key]
+            self.frames = {}
+            self.indexFrames(report)
+            return self.capture
+
+        self.indexFrames(report['appends'])
+        for append in report['appends']:
+            frameId, childset, entries = append[:3]
+            target = self.frames[frameId]['data'].setdefault(childset, [])
+            if len(append) == 3:
+                target.extend(entries)
+                continue
+            sampleSize, elided = append[3:]
+            if len(target) > sampleSize and target[sampleSize].get('type') == 'ELIDED_ITERATIONS':
+                del target[sampleSize]
+            target.extend(entries)
+            if elided:
+                del target[sampleSize:len(target) - sampleSize]
+                target.insert(sampleSize, {'type': 'ELIDED_ITERATIONS', 'data': {'count': elided}})
+
+        self.indexFrames(report['detached'])
+        for func_id, detached in report['detached'].items():
+            current = self.capture['detached'].setdefault(func_id, {'count': 0, 'frames': []})
+            current['count'] = detached['count']
+            current['depths'] = detached['depths']
+            evicted = set(detached.get('evicted', []))
+            current['frames'] = [frame for frame in current['frames'] if frame['data']['frameno'] not in evicted]
+            current['frames'].extend(detached['frames'])
+        for key in CAPTURE_KEYS:
+            if key in report:
+                self.capture[key] = report[key]
+        return self.capture
+
+
+class CaptureStreamTest(unittest.TestCase):
+    def setUp(self):
+        # Each test starts without a previous run to diff against.
+        executor.previousDigest = None
+
+    def runWithInputs(self, source, lines, stream=None):
+        stream = stream or CaptureStream()
+        reports = []
+        snapshots = []
+
+        def report(s):
+            reports.append(decodeReport(s))
+            stream.apply(reports[-1])
+            snapshots.append((stripIds(stream.capture), json.loads(json.dumps(executor.capture.toDict()))))
+
+        lines = list(lines)
+        stdin = io.StringIO()
+        stdin.readline = wrapStdin(lambda: lines.pop(0) if lines else '', report)
+        f = io.StringIO()
+        f.write = wrapStdout(f.write)
+        with contextlib.redirect_stdout(f), mock.patch('sys.stdin', stdin):
+            executePythonFile(splootFromPython(source))
+        report(encodeReport(executor.reporter.report(), executor.capture.captureSize))
+        return reports, snapshots
+
+    def assertReconstructed(self, snapshots):
+        for rebuilt, expected in snapshots:
+            self.assertEqual(rebuilt, expected)
+
+    def testOnlyNewResultsAreReported(self):
+        reports, snapshots = self.runWithInputs('''
+total = 0
+for i in range(5):
+    n = int(input())
+    total = total + n
+print(total)
+''', ['1\n', '2\n', '3\n', '4\n', '5\n'])
+        self.assertReconstructed(snapshots)
+        self.assertNotIn('delta', reports[0])
+        self.assertTrue(all(r['delta'] for r in reports[1:]))
+        # Each input reports the end of the previous iteration and the start of the next.
+        for delta in reports[2:-1]:
+            self.assertLess(len(json.dumps(delta)), 600)
+
+    def testSampledLoop(self):
+        with mock.patch.object(executor, 'iterationLimit', 4):
+            reports, snapshots = self.runWithInputs('''
+x = 0
+while x < 12:
+    x = x + 1
+    if x % 3 == 0:
+        y = input()
+''', ['a\n'] * 4)
+        self.assertReconstructed(snapshots)
+        frames = snapshots[-1][0]['root']['data']['body'][1]['data']['frames']
+        self.assertEqual(frames[2], {'type': 'ELIDED_ITERATIONS', 'data': {'count': 9}})
+
+    def testInputInsideFunctions(self):
+        reports, snapshots = self.runWithInputs('''
+def ask(prompt):
+    print(prompt)
+    return input()
+
+def askTwice():
+    return ask('a') + ask('b')
+
+results = []
+for i in range(3):
+    results.append(askTwice())
+print(results)
+''', ['x\n'] * 6)
+        self.assertReconstructed(snapshots)
+        # Functions converted from Python source have no id, so their calls share one entry.
+        self.assertEqual(snapshots[-1][0]['detached']['null']['count'], 9)
+
+    def testCallsLetGoOfAreReportedAsEvicted(self):
+        reports, snapshots = self.runWithInputs('''
+def down(n):
+    if n % 40 == 0:
+        x = input()
+    if n > 0:
+        down(n - 1)
+
+down(200)
+''', ['x\n'] * 6)
+        self.assertReconstructed(snapshots)
+        # Calls reported while they were running are let go of once the recursion unwinds.
+        self.assertEqual(len(reports[-1]['detached']['null']['evicted']), 101)
+        self.assertEqual(len(snapshots[-1][0]['detached']['null']['frames']), 100)
+
+    def testExceptionIsReportedAtTheEnd(self):
+        reports, snapshots = self.runWithInputs('''
+name = input()
+print(1 / 0)
+''', ['Fred\n'])
+        self.assertReconstructed(snapshots)
+        self.assertEqual(reports[-1]['lastException']['type'], 'ZeroDivisionError')
+
+    def testPreviousCaptureIsLetGoOf(self):
+        stream = CaptureStream()
+        self.runWithInputs('names = []\nfor i in range(40):\n    names.append(str(i))', [], stream)
+        self.assertIsInstance(executor.previousDigest, tuple)
+        # Only the digest of the previous run's capture is kept while the next one runs.
+        reports, snapshots = self.runWithInputs("""
+import gc
+import executor
+gc.collect()
+print(list(map(type, gc.get_objects())).count(executor.SplootCapture))
+name = input()
+""", ['Fred\n'], stream)
+        self.assertReconstructed(snapshots)
+        self.assertEqual(snapshots[-1][0]['root']['data']['body'][3]['sideEffects'][0]['value'], '1\n')
+
+    def testRerunIsDiffedAgainstPreviousRun(self):
+        source = """
+names = []
+for i in range(20):
+    names.append('name' + str(i))
+print(len(names))
+"""
+        stream = CaptureStream()
+        first, _ = self.runWithInputs(source, [], stream)
+        self.assertIn('root', first[0])
+
+        reports, snapshots = self.runWithInputs(source, [], stream)
+        self.assertReconstructed(snapshots)
+        # Nothing changed, only the running root frame is given its id.
+        self.assertEqual(reports[0], {'diff': True, 'ops': [['id', ['root'], 0]]})
+
+        reports, snapshots = self.runWithInputs(source.replace('range(20)', 'range(21)'), [], stream)
+        self.assertReconstructed(snapshots)
+        self.assertTrue(reports[0]['diff'])
+        self.assertLess(len(json.dumps(reports[0])), len(json.dumps(first[0])) / 4)
+
+    def testDiffWithInputs(self):
+        source = """
+for i in range(10):
+    print(i)
+name = input()
+print(name)
+"""
+        stream = CaptureStream()
+        self.runWithInputs(source, ['Fred\n'], stream)
+        reports, snapshots = self.runWithInputs(source, ['Fran\n'], stream)
+        self.assertReconstructed(snapshots)
+        self.assertTrue(reports[0]['diff'])
+        self.assertTrue(reports[1]['delta'])
+
+    def testUnrelatedRerunSendsFullCapture(self):
+        stream = CaptureStream()
+        self.runWithInputs('for i in range(10):\n    x = i', [], stream)
+        reports, snapshots = self.runWithInputs('print("hello")\ny = 1\nz = 2', [], stream)
+        self.assertReconstructed(snapshots)
+        self.assertIn('root', reports[0])
+
+    @mock.patch.object(executor, 'MAX_DIFF_OPS', 3)
+    def testDiffWithTooManyOpsSendsFullCapture(self):
+        stream = CaptureStream()
+        self.runWithInputs('for i in range(10):\n    print(i)', [], stream)
+        reports, snapshots = self.runWithInputs('for i in range(10):\n    print(i + 1)', [], stream)
+        self.assertReconstructed(snapshots)
+        self.assertIn('root', reports[0])
+
+    def testRecordedReportsAreUpToDate(self):
+        # The runtime-python package's tests replay these, run tests.capture_reports to update them.
+        with open(RECORDING_PATH) as f:
+            self.assertEqual(json.load(f), json.loads(json.dumps(recordScenarios())))
+
+    def testRecordedReportsAreReconstructed(self):
+        with open(RECORDING_PATH) as f:
+            recording = json.load(f)
+        for scenario in recording['scenarios']:
+            stream = CaptureStream()
+            for run in scenario['runs']:
+                for report, expected in zip(run['reports'], run['captures']):
+                    stream.apply(decodeReport(report) if isinstance(report, str) else decodeCapture(base64.b64decode(report['binary'])))
+                    self.assertEqual(stripIds(stream.capture), expected, scenario['name'])
@@ -0,0 +1,141 @@
+import hashlib
+import unittest
+from unittest import mock
+
+import executor
+from executor import hashTree, LRUCache
+from convert_ast import splootFromPython
+from tests.helpers import runFile
+
+
+class CompiledCodeCacheTest(unittest.TestCase):
+    def setUp(self):
+        executor.compiledCodeCache.clear()
+        executor.transpiledStatementCache.clear()
+
+    def testHashIsStructural(self):
+        a = splootFromPython('x = 1\nprint(x)')
+        b = splootFromPython('x = 1\nprint(x)')
+        c = splootFromPython('x = 2\nprint(x)')
+        self.assertEqual(hashTree(a), hashTree(b))
+        self.assertNotEqual(hashTree(a), hashTree(c))
+
+    def testRerunSkipsTranspiler(self):
+        splootFile = splootFromPython('x = 1\nprint(x)')
+        firstCap, firstOut = runFile(splootFile)
+
+        with mock.patch('executor.generateAstStatement') as transpile:
+            secondCap, secondOut = runFile(splootFromPython('x = 1\nprint(x)'))
+            transpile.assert_not_called()
+
+        self.assertEqual(firstCap, secondCap)
+        self.assertEqual(firstOut, secondOut)
+        self.assertEqual(executor.compiledCodeCache.hits, 1)
+        self.assertEqual(executor.compiledCodeCache.misses, 1)
+
+    def testRunTypeIsPartOfKey(self):
+        splootFile = splootFromPython('print(1)')
+        executor.getCompiledCode(splootFile, 'COMMAND_LINE', True)
+        executor.getCompiledCode(splootFile, 'SCHEDULE', True)
+        executor.getCompiledCode(splootFile, 'COMMAND_LINE', False)
+        self.assertEqual(executor.compiledCodeCache.misses, 3)
+        self.assertEqual(len(executor.compiledCodeCache.entries), 3)
+
+    def testEviction(self):
+        cache = LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.put('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+
+
+TWO_FUNCTIONS = """
+def first(a):
+    return a + 1
+
+def second(b):
+    if b > 2:
+        return b * 2
+    return b
+
+print(first(1), second(3))
+"""
+
+
+class IncrementalTranspileTest(unittest.TestCase):
+    def setUp(self):
+        executor.compiledCodeCache.clear()
+        executor.transpiledStatementCache.clear()
+
+    def testOnlyChangedStatementsAreRegenerated(self):
+        executor.getCompiledCode(splootFromPython(TWO_FUNCTIONS), 'COMMAND_LINE', True)
+
+        edited = splootFromPython(TWO_FUNCTIONS.replace('b * 2', 'b * 3'))
+        with mock.patch('executor.generateFunctionDef', wraps=executor.generateFunctionDef) as generate:
+            executor.getCompiledCode(edited, 'COMMAND_LINE', True)
+        self.assertEqual(generate.call_count, 1)
+        regenerated = generate.call_args[0][0]
+        self.assertEqual(regenerated['childSets']['identifier'][0]['properties']['identifier'], 'second')
+
+    def testIncrementalMatchesFullTranspile(self):
+        executor.getCompiledCode(splootFromPython(TWO_FUNCTIONS), 'COMMAND_LINE', True)
+        edited = splootFromPython(TWO_FUNCTIONS.replace('b * 2', 'b * 3'))
+        code = executor.getCompiledCode(edited, 'COMMAND_LINE', True)
+
+        executor.transpiledStatementCache.clear()
+        executor.compiledCodeCache.clear()
+        fresh = executor.getCompiledCode(edited, 'COMMAND_LINE', True)
+        self.assertEqual(code.co_code, fresh.co_code)
+        self.assertEqual(len(code.co_consts), len(fresh.co_consts))
+
+    def testNestedFunctionIsReused(self):
+        source = """
+if True:
+    def inner(x):
+        return x * 2
+y = 1
+"""
+        executor.getCompiledCode(splootFromPython(source), 'COMMAND_LINE', True)
+        edited = splootFromPython(source.replace('if True', 'if 1 == 1'))
+        with mock.patch('executor.generateFunctionDef', wraps=executor.generateFunctionDef) as generate:
+            executor.getCompiledCode(edited, 'COMMAND_LINE', True)
+        generate.assert_not_called()
+
+    def testNestedFunctionsAreHashedOnce(self):
+        tree = splootFromPython("""
+def outer(x):
+    def middle(y):
+        def inner(z):
+            return z * 2
+        return inner(y) + 1
+    return middle(x)
+print(outer(1))
+""")
+
+        def countNodes(node):
+            return 1 + sum(countNodes(child) for children in node['childSets'].values() for child in children)
+        outer = tree['childSets']['body'][0]['childSets']['statement'][0]
+        with mock.patch('executor.hashlib.blake2b', wraps=hashlib.blake2b) as blake2b:
+            executor.getCompiledCode(tree, 'COMMAND_LINE', True)
+        # A hash for each top level statement, and one for each node of outer, middle and inner included.
+        self.assertEqual(blake2b.call_count, 2 + countNodes(outer))
+        self.assertEqual(executor.subtreeHashes, {})
+
+
+class ProfiledRunCacheTest(unittest.TestCase):
+    def setUp(self):
+        executor.compiledCodeCache.clear()
+        executor.transpiledStatementCache.clear()
+
+    def testProfiledRunsLeaveCachedStatementsUnmarked(self):
+        # Profiled runs mark the same cached statements that the other runs use.
+        splootFile = splootFromPython(TWO_FUNCTIONS)
+        for profile in ["TIME", "MEMORY", "CALLS"]:
+            for nextProfile in ["TIME", "MEMORY", "CALLS", None]:
+                executor.compiledCodeCache.clear()
+                runFile(splootFile, profile)
+                cap, _ = runFile(splootFile, nextProfile)
+                self.assertNotIn('lastException', cap, (profile, nextProfile))
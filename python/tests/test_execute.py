@@ -24,8 +24,7 @@ class ExecuteTest(unittest.TestCase):
                             'type': 'PYTHON_EXPRESSION',
                             'data': {'result': 'None', 'resultType': 'NoneType'},
                             'sideEffects': [
-                                {"type": "stdout", "value": 'Hello, World!'},
-                                {"type": "stdout", "value": '\n'},
+                                {"type": "stdout", "value": 'Hello, World!\n'},
                             ]
                         }
                     ]
@@ -62,7 +61,7 @@ else:
                             'trueblock': [{
                                 'type': 'PYTHON_EXPRESSION',
                                 'data': {'result': 'None', 'resultType': 'NoneType'},
-                                'sideEffects': [{'type': 'stdout', 'value':'hi'},{'type': 'stdout', 'value':'\n'}]
+                                'sideEffects': [{'type': 'stdout', 'value': 'hi\n'}]
                             }]
                         }},
                     ]
@@ -101,7 +100,7 @@ else:
                                         'block': [
                                             {'type': 'PYTHON_EXPRESSION',
                                             'data': {'result': 'None', 'resultType': 'NoneType'},
-                                            'sideEffects': [{'type': 'stdout', 'value':'bye'},{'type': 'stdout', 'value':'\n'}]}
+                                            'sideEffects': [{'type': 'stdout', 'value': 'bye\n'}]}
                                         ]
                                     }}
                             ]}
@@ -149,8 +148,9 @@ add(123, 45)
                             'body': [{
                                 'type': 'PYTHON_EXPRESSION',
                                 'data': {'result': 'None','resultType': 'NoneType'},
-                                'sideEffects': [{'type': 'stdout', 'value': '7'}, {'type': 'stdout', 'value': '\n'}],
-                            }]
+                                'sideEffects': [{'type': 'stdout', 'value': '7\n'}],
+                            }],
+                            'frameno': 0,
                         },
                     },
                     {
@@ -159,11 +159,13 @@ add(123, 45)
                             'body': [{
                                 'type': 'PYTHON_EXPRESSION',
                                 'data': {'result': 'None','resultType': 'NoneType'},
-                                'sideEffects': [{'type': 'stdout', 'value': '168'}, {'type': 'stdout', 'value': '\n'}],
-                            }]
+                                'sideEffects': [{'type': 'stdout', 'value': '168\n'}],
+                            }],
+                            'frameno': 1,
                         },
                     }
-                ]
+                ],
+                'depths': [2],
             }
         }})
 
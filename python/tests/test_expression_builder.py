@@ -0,0 +1,83 @@
+import ast
+import unittest
+
+from expression_builder import buildExpression
+from executor import generateAstExpressionToken
+from convert_ast import splootFromPython
+from text_generator import convertSplootToText
+
+
+def operator(op):
+    return {"type": "PYTHON_BINARY_OPERATOR", "childSets": {}, "properties": {"operator": op}}
+
+
+def identifier(name):
+    return {"type": "PY_IDENTIFIER", "childSets": {}, "properties": {"identifier": name}}
+
+
+def tokensFromPython(code):
+    sploot = splootFromPython(code)
+    return sploot['childSets']['body'][0]['childSets']['statement'][0]['childSets']['tokens']
+
+
+class ExpressionBuilderTest(unittest.TestCase):
+    def assertBuildsLike(self, code):
+        expr = buildExpression(tokensFromPython(code), generateAstExpressionToken)
+        self.assertEqual(ast.dump(expr), ast.dump(ast.parse(code, mode='eval').body))
+
+    def testPrecedence(self):
+        self.assertBuildsLike('1 + 2 * 3 - 4')
+        self.assertBuildsLike('a or b and c')
+        self.assertBuildsLike('x == 1 and y | 2 != 3')
+        self.assertBuildsLike('100 / 10 / 5')
+
+    def testPowerIsRightAssociative(self):
+        self.assertBuildsLike('2 ** 3 ** 2')
+        self.assertBuildsLike('a ** -b ** c * d')
+        self.assertBuildsLike('a * b ** c ** d + e')
+
+    def testUnaryOperators(self):
+        self.assertBuildsLike('-a * b')
+        self.assertBuildsLike('-a ** 2')
+        self.assertBuildsLike('not a == b')
+        self.assertBuildsLike('a and not b or c')
+
+    def testComparisonChain(self):
+        expr = buildExpression(tokensFromPython('1 + 3 == 4 == 2 + 2 < 5'), generateAstExpressionToken)
+        self.assertIsInstance(expr, ast.Compare)
+        self.assertEqual(len(expr.ops), 3)
+
+    def testBooleanChainIsFlat(self):
+        expr = buildExpression(tokensFromPython('a and b and c or d or e'), generateAstExpressionToken)
+        self.assertIsInstance(expr, ast.BoolOp)
+        self.assertIsInstance(expr.op, ast.Or)
+        self.assertEqual(len(expr.values), 3)
+        self.assertEqual(len(expr.values[0].values), 3)
+
+    def testBracketedComparisonIsNotMerged(self):
+        bracket = {"type": "PY_BRACKET", "childSets": {"expr": [
+            {"type": "PYTHON_EXPRESSION", "childSets": {"tokens": [identifier('a'), operator('<'), identifier('b')]}}
+        ]}, "properties": {}}
+        expr = buildExpression([bracket, operator('<'), identifier('c')], generateAstExpressionToken)
+        self.assertEqual(ast.unparse(expr), '(a < b) < c')
+
+    def testLongChainHasNoRecursionLimit(self):
+        tokens = [identifier('x')]
+        for _ in range(20000):
+            tokens.extend([operator('and'), identifier('x')])
+        expr = buildExpression(tokens, generateAstExpressionToken)
+        self.assertEqual(len(expr.values), 20001)
+
+        tokens = [identifier('x')]
+        for _ in range(20000):
+            tokens.extend([operator('+'), identifier('x')])
+        expr = buildExpression(tokens, generateAstExpressionToken)
+        self.assertIsInstance(expr, ast.BinOp)
+
+    def testMissingOperand(self):
+        with self.assertRaises(Exception):
+            buildExpression([identifier('a'), operator('+')], generateAstExpressionToken)
+
+    def testTextGeneratorRoundTrip(self):
+        for code in ['print(1 < 2 < 3)', 'x = a and b and c', 'y = not a or -b ** 2']:
+            self.assertEqual(convertSplootToText(splootFromPython(code)), code)
@@ -0,0 +1,182 @@
+import io
+import contextlib
+import json
+import sys
+import unittest
+from unittest import mock
+
+import executor
+from executor import executePythonFile, wrapStdout
+from convert_ast import splootFromPython
+from hook_tracing import HookTracer
+
+
+class HookTracingTest(unittest.TestCase):
+
+    def runWithBackend(self, source, backend):
+        f = io.StringIO()
+        f.write = wrapStdout(f.write)
+        with contextlib.redirect_stdout(f), contextlib.redirect_stderr(io.StringIO()):
+            cap, _ = executePythonFile(splootFromPython(source), tracingBackend=backend)
+        return json.loads(json.dumps(cap)), f.getvalue()
+
+    def assertSameCapture(self, source):
+        self.maxDiff = None
+        expected = self.runWithBackend(source, "AST")
+        self.assertEqual(self.runWithBackend(source, "HOOKS"), expected)
+        return expected[0]
+
+    def testStatements(self):
+        self.assertSameCapture('''
+x = 1
+print("hi", x)
+names = ['a', 'b']
+names[0] = 'c'
+a, b = 1, 2
+if x > 3:
+    print('big')
+elif x > 0:
+    print('small')
+else:
+    pass
+if x:
+    pass
+import math
+from math import sqrt
+print(sqrt(4))
+''')
+
+    def testLoops(self):
+        self.assertSameCapture('''
+x = 1
+while x < 5:
+    x = x + 1
+    if x == 3:
+        continue
+    print(x)
+for i in range(3):
+    if i == 2:
+        break
+    print(i)
+for i in []:
+    pass
+while True:
+    x = x - 1
+    if x < 2:
+        break
+''')
+
+    def testUnpacking(self):
+        # The value logged is the one assigned, not one rebuilt from the targets.
+        cap = self.assertSameCapture('''
+a, b = [1, 2]
+for a, b in [[1, 2], [3, 4]]:
+    print(a + b)
+pairs = [[0, 0]]
+for pairs[0][0], c in [(5, 'x')]:
+    print(c)
+def swap(items):
+    for x, y in items:
+        items = [y, x]
+    return items
+print(swap([[1, [2]]]))
+''')
+        self.assertEqual(cap['root']['data']['body'][0]['data']['resultType'], 'list')
+        iteration = cap['root']['data']['body'][1]['data']['frames'][0]
+        self.assertEqual(iteration['data']['iterable'][0]['data'], {'result': '[1, 2]', 'resultType': 'list'})
+
+    def testSampledLoop(self):
+        with mock.patch.object(executor, 'iterationLimit', 4):
+            cap = self.assertSameCapture('''
+total = 0
+for i in range(20):
+    total = total + i
+''')
+        frames = cap['root']['data']['body'][1]['data']['frames']
+        self.assertEqual(frames[2], {'type': 'ELIDED_ITERATIONS', 'data': {'count': 16}})
+
+    def testFunctions(self):
+        self.assertSameCapture('''
+def fact(n):
+    if n <= 1:
+        return 1
+    return n * fact(n - 1)
+
+def count(n):
+    results = []
+    for i in range(2):
+        if n > 3:
+            results.append(n)
+        else:
+            results.append(count(n + 1))
+    return len(results)
+
+print(fact(5))
+print(count(0))
+''')
+
+    def testFunctionFrameLimit(self):
+        with mock.patch.object(executor, 'FUNCTION_FRAME_LIMIT', 2), \
+                mock.patch.object(executor, 'RECURSIVE_FRAME_LIMIT', 12), \
+                mock.patch.object(executor, 'FUNCTION_FIRST_FRAMES', 2), \
+                mock.patch.object(executor, 'FUNCTION_LAST_FRAMES', 3):
+            cap = self.assertSameCapture('''
+def count(n):
+    results = []
+    for i in range(2):
+        if n > 3:
+            results.append(n)
+        else:
+            results.append(count(n + 1))
+    return len(results)
+
+print(count(0))
+''')
+        self.assertEqual(cap['detached']['null']['count'], 31)
+        # Recursive calls are captured up to the recursive limit, the first two and last three of them kept.
+        self.assertEqual([frame['data']['frameno'] for frame in cap['detached']['null']['frames']], [0, 1, 10, 11, 12])
+        self.assertEqual(cap['detached']['null']['depths'], [1, 1, 2, 3, 6])
+
+    def testException(self):
+        cap = self.assertSameCapture('''
+def bad(x):
+    if x > 2:
+        return 1 / 0
+    return bad(x + 1)
+
+for i in range(3):
+    print(i)
+    y = bad(i)
+''')
+        self.assertEqual(cap['lastException']['type'], 'ZeroDivisionError')
+
+    def testExceptionInUntracedCall(self):
+        with mock.patch.object(executor, 'FUNCTION_FRAME_LIMIT', 1):
+            cap = self.assertSameCapture('''
+def bad(x):
+    if x > 6:
+        return 1 / 0
+    return bad(x + 1)
+
+y = bad(0)
+''')
+        self.assertEqual(cap['lastException']['frameno'], 7)
+
+    @unittest.skipUnless(hasattr(sys, 'monitoring'), 'sys.monitoring needs Python 3.12')
+    def testSettraceFallback(self):
+        source = '''
+def fact(n):
+    if n <= 1:
+        return 1
+    return n * fact(n - 1)
+
+for i in range(3):
+    print(fact(i))
+'''
+        expected = self.runWithBackend(source, "AST")
+        with mock.patch.object(HookTracer, 'runWithMonitoring', HookTracer.runWithSettrace):
+            self.assertEqual(self.runWithBackend(source, "HOOKS"), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
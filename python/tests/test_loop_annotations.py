@@ -1,9 +1,12 @@
 import io
 import contextlib
 import unittest
+from unittest import mock
 
+import executor
 from executor import executePythonFile, wrapStdout
 from convert_ast import splootFromPython
+from tests.helpers import runFile
 
 
 class LoopAnnotationsTest(unittest.TestCase):
@@ -65,7 +68,7 @@ print(count)
                     {
                         'type': 'PYTHON_EXPRESSION',
                         'data':  {'result': 'None', 'resultType': 'NoneType'},
-                        'sideEffects': [{'type': 'stdout', 'value':'3'}, {'type': 'stdout', 'value':'\n'}]
+                        'sideEffects': [{'type': 'stdout', 'value': '3\n'}]
                     },
                 ]
             }
@@ -99,7 +102,7 @@ for char in 'hello':
                                     'block': [{
                                         'type': 'PYTHON_EXPRESSION',
                                         'data': {'result': 'None', 'resultType': 'NoneType'},
-                                        'sideEffects': [{'type': 'stdout', 'value':'h'}, {'type': 'stdout', 'value':'\n'}]
+                                        'sideEffects': [{'type': 'stdout', 'value': 'h\n'}]
                                     }],
                                 },
                             },
@@ -110,7 +113,7 @@ for char in 'hello':
                                     'block': [{
                                         'type': 'PYTHON_EXPRESSION',
                                         'data': {'result': 'None', 'resultType': 'NoneType'},
-                                        'sideEffects': [{'type': 'stdout', 'value':'e'}, {'type': 'stdout', 'value':'\n'}]
+                                        'sideEffects': [{'type': 'stdout', 'value': 'e\n'}]
                                     }],
                                 },
                             },
@@ -121,7 +124,7 @@ for char in 'hello':
                                     'block': [{
                                         'type': 'PYTHON_EXPRESSION',
                                         'data': {'result': 'None', 'resultType': 'NoneType'},
-                                        'sideEffects': [{'type': 'stdout', 'value':'l'}, {'type': 'stdout', 'value':'\n'}]
+                                        'sideEffects': [{'type': 'stdout', 'value': 'l\n'}]
                                     }],
                                 },
                             },
@@ -132,7 +135,7 @@ for char in 'hello':
                                     'block': [{
                                         'type': 'PYTHON_EXPRESSION',
                                         'data': {'result': 'None', 'resultType': 'NoneType'},
-                                        'sideEffects': [{'type': 'stdout', 'value':'l'}, {'type': 'stdout', 'value':'\n'}]
+                                        'sideEffects': [{'type': 'stdout', 'value': 'l\n'}]
                                     }],
                                 },
                             },
@@ -143,7 +146,7 @@ for char in 'hello':
                                     'block': [{
                                         'type': 'PYTHON_EXPRESSION',
                                         'data': {'result': 'None', 'resultType': 'NoneType'},
-                                        'sideEffects': [{'type': 'stdout', 'value':'o'}, {'type': 'stdout', 'value':'\n'}]
+                                        'sideEffects': [{'type': 'stdout', 'value': 'o\n'}]
                                     }],
                                 },
                             }
@@ -187,7 +190,7 @@ print('end')
                                     },{
                                         'type': 'PYTHON_EXPRESSION',
                                         'data': {'result': 'None', 'resultType': 'NoneType'},
-                                        'sideEffects': [{'type': 'stdout', 'value':'h'}, {'type': 'stdout', 'value':'\n'}]
+                                        'sideEffects': [{'type': 'stdout', 'value': 'h\n'}]
                                     }],
                                 },
                             },
@@ -201,7 +204,7 @@ print('end')
                                     },{
                                         'type': 'PYTHON_EXPRESSION',
                                         'data': {'result': 'None', 'resultType': 'NoneType'},
-                                        'sideEffects': [{'type': 'stdout', 'value':'e'}, {'type': 'stdout', 'value':'\n'}]
+                                        'sideEffects': [{'type': 'stdout', 'value': 'e\n'}]
                                     }],
                                 },
                             },
@@ -222,9 +225,74 @@ print('end')
                     {
                         'type': 'PYTHON_EXPRESSION',
                         'data': {'result': 'None', 'resultType': 'NoneType'},
-                        'sideEffects': [{'type': 'stdout', 'value':'end'}, {'type': 'stdout', 'value':'\n'}]
+                        'sideEffects': [{'type': 'stdout', 'value': 'end\n'}]
                     },
                 ]
             }
         },
         'detached': {}})
+
+
+class LoopSamplingTest(unittest.TestCase):
+    def iterationResults(self, frames):
+        results = []
+        for frame in frames:
+            if frame['type'] == 'ELIDED_ITERATIONS':
+                results.append(('elided', frame['data']['count']))
+            elif 'block' in frame['data']:
+                results.append(frame['data']['block'][0]['data']['result'])
+        return results
+
+    def testLongLoopIsSampled(self):
+        with mock.patch.object(executor, 'iterationLimit', 6):
+            cap, out = runFile('''
+total = 0
+for i in range(100):
+    total = total + i
+print(total)
+''')
+        self.assertEqual(out, '4950\n')
+        self.assertNotIn('lastException', cap)
+        frames = cap['root']['data']['body'][1]['data']['frames']
+        self.assertEqual(self.iterationResults(frames), ['0', '1', '3', ('elided', 94), '4753', '4851', '4950'])
+
+    def testNestedLoopsAreSampledIndependently(self):
+        with mock.patch.object(executor, 'iterationLimit', 4):
+            cap, _ = runFile('''
+x = 0
+while x < 10:
+    x = x + 1
+    for j in range(10):
+        y = j
+''')
+        frames = cap['root']['data']['body'][1]['data']['frames']
+        self.assertEqual(self.iterationResults(frames), ['1', '2', ('elided', 7), '10'])
+        innerFrames = frames[-2]['data']['block'][1]['data']['frames']
+        self.assertEqual(self.iterationResults(innerFrames), ['0', '1', ('elided', 6), '8', '9'])
+
+    def testShortLoopIsNotSampled(self):
+        with mock.patch.object(executor, 'iterationLimit', 10):
+            cap, _ = runFile('for i in range(9):\n    y = i')
+        frames = cap['root']['data']['body'][0]['data']['frames']
+        self.assertEqual(len(frames), 9)
+        self.assertNotIn('ELIDED_ITERATIONS', [frame['type'] for frame in frames])
+
+    def testRunningLoopIsSampledInCapture(self):
+        capture = executor.SplootCapture()
+        with mock.patch.object(executor, 'iterationLimit', 4):
+            capture.startFrame('PYTHON_WHILE_LOOP', 'frames')
+        loop = capture.stack[-1]
+        for i in range(6):
+            capture.startFrame('PYTHON_WHILE_LOOP_ITERATION', 'condition')
+            capture.logExpressionResult(None, {}, i)
+            capture.endFrame()
+        frames = capture.toDict()['root']['data']['body'][0]['data']['frames']
+        self.assertEqual([frame['type'] for frame in frames], ['PYTHON_WHILE_LOOP_ITERATION'] * 2 + ['ELIDED_ITERATIONS'] + ['PYTHON_WHILE_LOOP_ITERATION'] * 2)
+
+        # Iterations keep being sampled after the capture has been reported.
+        capture.startFrame('PYTHON_WHILE_LOOP_ITERATION', 'condition')
+        capture.endFrame()
+        capture.endFrame()
+        frames = loop.toDict()['data']['frames']
+        self.assertEqual(len(frames), 5)
+        self.assertEqual(frames[2]['data']['count'], 3)
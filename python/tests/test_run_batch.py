@@ -0,0 +1,78 @@
+import unittest
+from unittest import mock
+
+import run_batch
+from convert_ast import splootFromPython
+from run_batch import fixtureTasks, runBatch
+
+
+GREETING = '''name = input()
+print("Hello", name)
+'''
+
+
+class RunBatchTest(unittest.TestCase):
+
+    def runTasks(self, tasks, **options):
+        results = sorted(runBatch(tasks, processes=2, **options), key=lambda result: result['index'])
+        self.assertEqual([result['index'] for result in results], list(range(len(tasks))))
+        return results
+
+    def testFixtures(self):
+        programs = [
+            {'id': 'source', 'source': GREETING},
+            {'id': 'tree', 'tree': splootFromPython('print(input().upper())')},
+        ]
+        tasks = fixtureTasks(programs, {'fred': ['Fred'], 'empty': []})
+        results = self.runTasks(tasks)
+        self.assertEqual([(result['id'], result['fixture'], result['status']) for result in results], [
+            ('source', 'fred', 'OK'),
+            ('source', 'empty', 'OK'),
+            ('tree', 'fred', 'OK'),
+            ('tree', 'empty', 'OK'),
+        ])
+        self.assertEqual(results[0]['stdout'], 'Hello Fred\n')
+        self.assertEqual(results[0]['capture']['root']['data']['body'][0]['data']['result'], 'Fred')
+        self.assertEqual(results[1]['capture']['lastException']['type'], 'EOFError')
+        self.assertEqual(results[2]['stdout'], 'FRED\n')
+
+    def testTracingBackend(self):
+        tasks = [{'id': backend, 'source': GREETING, 'stdin': ['Fred\n'], 'tracingBackend': backend} for backend in ('AST', 'HOOKS')]
+        traced, hooked = self.runTasks(tasks)
+        self.assertEqual(hooked['status'], 'OK')
+        self.assertEqual(hooked['capture'], traced['capture'])
+
+    def testTasksGetFreshGlobals(self):
+        tasks = [{'id': i, 'source': 'print(count)\ncount = 1'} for i in range(4)]
+        for result in self.runTasks(tasks):
+            self.assertEqual(result['capture']['lastException']['type'], 'NameError')
+
+    def testProgramThatCantBeConverted(self):
+        result, = self.runTasks([{'id': 'bad', 'source': 'x = [i for i in range(3)]'}])
+        self.assertEqual(result['status'], 'ERROR')
+        self.assertIn('Unrecognised expression type', result['error'])
+
+    def testTimeLimitStopsTheRun(self):
+        result, = self.runTasks([{'id': 'loop', 'source': 'x = 0\nwhile True:\n    x = x + 1'}], timeout=0.2)
+        self.assertEqual(result['status'], 'OK')
+        self.assertEqual(result['capture']['budgetExceeded']['limit'], 'time')
+
+    @mock.patch.object(run_batch, 'TIMEOUT_GRACE', 0.2)
+    def testTimeoutKillsTheWorker(self):
+        tasks = [{'id': 'sleep', 'source': 'import time\ntime.sleep(30)'}, {'id': 'after', 'source': 'print(1)'}]
+        sleep, after = runBatch(tasks, processes=1, timeout=0.2)
+        self.assertEqual((sleep['id'], sleep['status']), ('sleep', 'TIMEOUT'))
+        self.assertLess(sleep['seconds'], 5)
+        # The worker was replaced for the next task.
+        self.assertEqual((after['status'], after['stdout']), ('OK', '1\n'))
+
+    @unittest.skipIf(run_batch.resource is None, 'memory is only capped where there is a resource module')
+    def testMemoryLimit(self):
+        tasks = [{'id': 'big', 'source': 'x = [0] * 1000000000'}, {'id': 'after', 'source': 'print(1)'}]
+        big, after = self.runTasks(tasks, memoryLimit=4096)
+        self.assertEqual(big['capture']['lastException']['type'], 'MemoryError')
+        self.assertEqual(after['stdout'], '1\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import io
+import json
+import contextlib
+import unittest
+from unittest import mock
+
+import executor
+from executor import executePythonFile, wrapStdout
+from convert_ast import splootFromPython
+
+
+class RunBudgetTest(unittest.TestCase):
+
+    def runWithBudget(self, source, backend="AST", **limits):
+        f = io.StringIO()
+        f.write = wrapStdout(f.write)
+        with mock.patch.multiple(executor, **dict({'stepLimit': None, 'timeLimit': None}, **limits)), \
+                contextlib.redirect_stdout(f), contextlib.redirect_stderr(io.StringIO()):
+            cap, _ = executePythonFile(splootFromPython(source), tracingBackend=backend)
+        return json.loads(json.dumps(cap)), f.getvalue()
+
+    def testInfiniteLoopStopsAtStepLimit(self):
+        cap, out = self.runWithBudget('''
+x = 0
+print('start')
+while True:
+    x = x + 1
+''', stepLimit=2500)
+        self.assertEqual(out, 'start\n')
+        self.assertEqual(cap['budgetExceeded']['limit'], 'steps')
+        self.assertEqual(cap['budgetExceeded']['steps'], 2500)
+        self.assertEqual(cap['lastException']['type'], 'BudgetExceeded')
+        # The capture so far is kept.
+        body = cap['root']['data']['body']
+        self.assertEqual(body[1]['data']['result'], 'None')
+        self.assertEqual(body[2]['type'], 'PYTHON_WHILE_LOOP')
+
+    def testStepsCountLoopIterationsAndCalls(self):
+        source = '''
+def f(n):
+    return n
+
+for i in range(10):
+    f(i)
+'''
+        cap, _ = self.runWithBudget(source, stepLimit=20)
+        self.assertNotIn('budgetExceeded', cap)
+        cap, _ = self.runWithBudget(source, stepLimit=19)
+        self.assertEqual(cap['budgetExceeded']['limit'], 'steps')
+
+    def testRecursionIsStopped(self):
+        cap, _ = self.runWithBudget('''
+def down(n):
+    if n > 0:
+        down(n - 1)
+
+for i in range(1000):
+    down(50)
+''', stepLimit=5000)
+        self.assertEqual(cap['budgetExceeded']['limit'], 'steps')
+
+    def testTimeLimit(self):
+        cap, _ = self.runWithBudget('''
+while True:
+    pass
+''', timeLimit=0.05, BUDGET_CHECK_INTERVAL=100)
+        self.assertEqual(cap['budgetExceeded']['limit'], 'time')
+        self.assertGreater(cap['budgetExceeded']['seconds'], 0.05)
+
+    def testNoLimits(self):
+        cap, out = self.runWithBudget('''
+total = 0
+for i in range(5000):
+    total = total + i
+print(total)
+''')
+        self.assertEqual(out, '12497500\n')
+        self.assertNotIn('budgetExceeded', cap)
+
+    def testHooksBackendStopsAtTheSameStep(self):
+        source = '''
+def f(n):
+    return n * 2
+
+total = 0
+while True:
+    total = total + f(total)
+    for i in range(3):
+        total = total - i
+'''
+        expected, _ = self.runWithBudget(source, stepLimit=300)
+        cap, _ = self.runWithBudget(source, "HOOKS", stepLimit=300)
+        # Only the time the runs took differs.
+        del expected['budgetExceeded']['seconds'], cap['budgetExceeded']['seconds']
+        self.maxDiff = None
+        self.assertEqual(cap, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import io
+import sys
+import types
+import unittest
+from unittest import mock
+
+import executor
+from capture_encoding import decodeReport
+from convert_ast import splootFromPython
+from tests.test_capture_stream import CaptureStream
+
+
+class FakeStdout:
+    def __init__(self):
+        self.buffer = io.StringIO()
+
+    def write(self, s):
+        self.buffer.write(s)
+
+    def flush(self):
+        pass
+
+
+class FakeStdin:
+    def __init__(self, lines):
+        self.lines = list(lines)
+
+    def readline(self):
+        if len(self.lines) == 0:
+            return ''
+        return self.lines.pop(0)
+
+
+class RunEntryTest(unittest.TestCase):
+    def setUp(self):
+        self.reports = []
+        self.fakeprint = types.SimpleNamespace(stdout=FakeStdout(), stdin=FakeStdin(['Fred\n']))
+        modules = {
+            'fakeprint': self.fakeprint,
+            'runtime_capture': types.SimpleNamespace(report=lambda s: self.reports.append(decodeReport(s))),
+            'web_response': types.SimpleNamespace(report=lambda s: None),
+        }
+        self.patches = [
+            mock.patch.dict(sys.modules, modules),
+            mock.patch.object(executor, 'runtimeIOInstalled', False),
+            mock.patch.object(executor, 'iterationLimit', None),
+            mock.patch.object(executor, 'capture', None),
+            mock.patch.object(executor, 'previousDigest', None),
+            mock.patch.object(sys, 'stdout', sys.stdout),
+            mock.patch.object(sys, 'stderr', sys.stderr),
+            mock.patch.object(sys, 'stdin', sys.stdin),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in reversed(self.patches):
+            patch.stop()
+
+    def testRunReportsCapture(self):
+        tree = splootFromPython('name = input()\nprint("Hello", name)')
+        executor.run(tree, 'COMMAND_LINE', None, {'iterationLimit': 0})
+        executor.run(tree, 'COMMAND_LINE', None, {'iterationLimit': 0})
+
+        self.assertEqual(self.fakeprint.stdout.buffer.getvalue(), 'Hello Fred\n')
+        # One report when input() is called and one at the end, for each run.
+        self.assertEqual(len(self.reports), 4)
+        # The report at the end only has what was added after input() returned.
+        self.assertTrue(self.reports[1]['delta'])
+        stream = CaptureStream()
+        stream.apply(self.reports[0])
+        cap = stream.apply(self.reports[1])
+        self.assertEqual(cap['root']['data']['body'][1]['sideEffects'][0]['value'], 'Hello Fred\n')
+        # The second run has no more input lines.
+        stream.apply(self.reports[2])
+        cap = stream.apply(self.reports[3])
+        self.assertEqual(cap['lastException']['type'], 'EOFError')
+        self.assertEqual(len(cap['root']['data']['body']), 1)
+
+    def testRunSetsIterationLimit(self):
+        tree = splootFromPython('x = 0\nwhile x < 20:\n    x = x + 1')
+        executor.run(tree, 'COMMAND_LINE', None, {'iterationLimit': 6})
+        self.assertNotIn('lastException', self.reports[-1])
+        frames = self.reports[-1]['root']['data']['body'][1]['data']['frames']
+        self.assertEqual(len(frames), 7)
+        self.assertEqual(frames[3], {'type': 'ELIDED_ITERATIONS', 'data': {'count': 15}})
@@ -0,0 +1,97 @@
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import executor
+import run_headless
+from convert_ast import splootFromPython
+from tests.test_capture_stream import CaptureStream, stripIds
+
+
+PROGRAM = '''name = input()
+for i in range(3):
+    print("Hello", name, i)
+'''
+
+
+class RunHeadlessTest(unittest.TestCase):
+    def setUp(self):
+        self.patches = [
+            mock.patch.dict(sys.modules),
+            mock.patch.object(run_headless, 'runtime', None),
+            mock.patch.object(executor, 'runtimeIOInstalled', False),
+            mock.patch.object(executor, 'iterationLimit', None),
+            mock.patch.object(executor, 'capture', None),
+            mock.patch.object(executor, 'previousDigest', None),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in reversed(self.patches):
+            patch.stop()
+
+    def runProgram(self, source, stdinLines=(), tracingBackend='AST'):
+        messages = []
+        cap, response = run_headless.runTree(splootFromPython(source), messages.append, stdinLines=stdinLines, limits={'iterationLimit': 0}, tracingBackend=tracingBackend)
+        return messages, cap, response
+
+    def testMessages(self):
+        messages, cap, _ = self.runProgram(PROGRAM, ['Fred\n'])
+        # The input line is echoed, as in a rerun.
+        stdout = ''.join(message['stdout'] for message in messages if message['type'] == 'stdout')
+        self.assertEqual(stdout, 'Fred\nHello Fred 0\nHello Fred 1\nHello Fred 2\n')
+        # A report when input() is called and one at the end, then finished.
+        self.assertEqual([message['type'] for message in messages if message['type'] != 'stdout'], ['runtime_capture', 'runtime_capture', 'finished'])
+        stream = CaptureStream()
+        reports = [message['capture'] for message in messages if message['type'] == 'runtime_capture']
+        stream.apply(reports[0])
+        self.assertEqual(stripIds(stream.apply(reports[1])), json.loads(json.dumps(cap)))
+        self.assertEqual(cap['root']['data']['body'][0]['data']['result'], 'Fred')
+
+    def testReportsOfEachRunStandAlone(self):
+        self.runProgram(PROGRAM, ['Fred\n'])
+        messages, cap, _ = self.runProgram(PROGRAM)
+        self.assertEqual(cap['lastException']['type'], 'EOFError')
+        # The first report is the whole capture, not a diff against the first run.
+        report = messages[0]['capture']
+        self.assertNotIn('diff', report)
+        self.assertEqual(report['root']['data']['body'], [])
+
+    def testTracingBackends(self):
+        _, traced, _ = self.runProgram(PROGRAM, ['Fred\n'])
+        messages, hooked, _ = self.runProgram(PROGRAM, ['Fred\n'], tracingBackend='HOOKS')
+        self.assertEqual(hooked, traced)
+        self.assertEqual(messages[-1], {'type': 'finished'})
+        with self.assertRaises(SystemExit), mock.patch.object(sys, 'stderr', io.StringIO()):
+            run_headless.main(['main.py', '--tracing-backend', 'SETTRACE'])
+
+    def testRestoresStdout(self):
+        stdout = sys.stdout
+        self.runProgram('print(1)')
+        self.assertIs(sys.stdout, stdout)
+
+    def testCommandLine(self):
+        with tempfile.TemporaryDirectory() as directory:
+            program = os.path.join(directory, 'main.py')
+            with open(program, 'w') as f:
+                f.write(PROGRAM)
+            capturePath = os.path.join(directory, 'capture.json')
+            out = io.StringIO()
+            with mock.patch.object(sys, 'stdout', out):
+                run_headless.main([program, '--input', 'Fred', '--profile', 'TIME', '--capture', capturePath])
+            with open(capturePath) as f:
+                cap = json.load(f)
+        messages = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(messages[-1], {'type': 'finished'})
+        self.assertEqual(messages[-2]['capture']['profile'], cap['profile'])
+        hits = {statement['lineno']: statement['hits'] for statement in cap['profile']['statements']}
+        self.assertEqual((hits[1], hits[3]), (1, 3))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import io
+import json
+import contextlib
+import unittest
+
+from executor import executePythonFile
+from convert_ast import splootFromPython
+from tests.helpers import runFile
+
+
+PROGRAM = '''
+def slow(n):
+    total = 0
+    for i in range(n):
+        total = total + i * i
+    return total
+
+def fast(n):
+    return n
+
+x = slow(20000)
+y = fast(3)
+print(x, y)
+'''
+
+
+class StatementProfilerTest(unittest.TestCase):
+
+    def runProfiled(self, source):
+        cap, out = runFile(source, profile="TIME")
+        return json.loads(json.dumps(cap)), out
+
+    def byLine(self, profile):
+        return {entry['lineno']: entry for entry in profile['statements']}
+
+    def testHitsAndTimes(self):
+        cap, out = self.runProfiled(PROGRAM)
+        self.assertEqual(out, '2666466670000 3\n')
+        statements = self.byLine(cap['profile'])
+        # Statements are numbered as in the editor: slow is 1-5, fast 6-7, then 8-10.
+        self.assertEqual(statements[4]['hits'], 20000)
+        self.assertEqual(statements[4]['type'], 'PYTHON_ASSIGNMENT')
+        self.assertEqual(statements[3]['hits'], 1)
+        self.assertEqual(statements[7]['hits'], 1)
+        self.assertEqual(statements[8]['hits'], 1)
+        self.assertEqual(statements[1]['type'], 'PYTHON_FUNCTION_DECLARATION')
+        # A statement's time doesn't include the statements of the functions it calls.
+        self.assertGreater(statements[4]['time'], statements[8]['time'])
+        total = sum(entry['time'] for entry in cap['profile']['statements'])
+        self.assertLessEqual(total, cap['profile']['time'])
+
+    def testRankedByTime(self):
+        cap, _ = self.runProfiled(PROGRAM)
+        times = [entry['time'] for entry in cap['profile']['statements']]
+        self.assertEqual(times, sorted(times, reverse=True))
+        self.assertEqual(cap['profile']['statements'][0]['lineno'], 4)
+
+    def testTimeAfterCallReturns(self):
+        cap, _ = self.runProfiled('''
+def fast(n):
+    return n
+
+x = fast(1) + sum(range(300000))
+y = x
+''')
+        statements = self.byLine(cap['profile'])
+        # The sum after the call is counted to the statement that made it, not to the function's last line.
+        self.assertEqual(statements[3]['hits'], 1)
+        self.assertGreater(statements[3]['time'], 10 * statements[2]['time'])
+
+    def testElifsAndLoops(self):
+        tree = splootFromPython('''
+n = 0
+while n < 10:
+    if n < 3:
+        n = n + 1
+    elif n < 6:
+        n = n + 2
+    else:
+        n = n + 3
+''')
+        # Elifs converted from Python source have no line number, the editor gives them one.
+        ifNode = tree['childSets']['body'][1]['childSets']['statement'][0]['childSets']['block'][0]['childSets']['statement'][0]
+        ifNode['childSets']['elseblocks'][0]['meta'] = {'lineno': 7}
+        with contextlib.redirect_stdout(io.StringIO()):
+            cap, _ = executePythonFile(tree, profile="TIME")
+        hits = {entry['lineno']: entry['hits'] for entry in cap['profile']['statements']}
+        # n goes 0, 1, 2, 3, 5, 7, 10.
+        self.assertEqual(hits, {1: 1, 2: 1, 3: 6, 4: 3, 7: 3, 5: 2, 6: 1})
+        self.assertEqual(self.byLine(cap['profile'])[7]['type'], 'PYTHON_ELIF_STATEMENT')
+
+    def testNothingIsCaptured(self):
+        cap, _ = self.runProfiled(PROGRAM)
+        self.assertEqual(cap['root']['data']['body'], [])
+        self.assertEqual(cap['detached'], {})
+
+    def testProfileOfRunThatRaised(self):
+        cap, _ = self.runProfiled('''
+x = 1
+y = x / 0
+z = 2
+''')
+        self.assertEqual(cap['lastException']['type'], 'ZeroDivisionError')
+        self.assertEqual(sorted(self.byLine(cap['profile'])), [1, 2])
+
+    def testUnprofiledRunHasNoProfile(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            cap, _ = executePythonFile(splootFromPython(PROGRAM))
+        self.assertNotIn('profile', cap)
+
+
+if __name__ == '__main__':
+    unittest.main()
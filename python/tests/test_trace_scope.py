@@ -0,0 +1,97 @@
+import io
+import contextlib
+import unittest
+
+import executor
+from executor import executePythonFile, wrapStdout
+from convert_ast import splootFromPython
+
+
+PROGRAM = '''
+def square(n):
+    result = n * n
+    return result
+
+total = 0
+for i in range(3):
+    total = total + square(i)
+print(total)
+'''
+
+
+# Statements are scoped by the line number the editor gives each statement,
+# which counts statements rather than source lines.
+class TraceScopeTest(unittest.TestCase):
+    def setUp(self):
+        executor.compiledCodeCache.clear()
+
+    def runScoped(self, source, traceScope):
+        f = io.StringIO()
+        f.write = wrapStdout(f.write)
+        with contextlib.redirect_stdout(f), contextlib.redirect_stderr(io.StringIO()):
+            cap, _ = executePythonFile(splootFromPython(source), traceScope=traceScope)
+        return cap, f.getvalue()
+
+    def testFunctionOnly(self):
+        cap, out = self.runScoped(PROGRAM, {"functions": [None]})
+        self.assertEqual(out, '5\n')
+        body = cap['root']['data']['body']
+        # A placeholder for each untraced statement, function declarations have none.
+        self.assertEqual([entry['type'] for entry in body], ['UNTRACED'] * 3)
+        detached = cap['detached'][None]
+        self.assertEqual(detached['count'], 3)
+        self.assertEqual(detached['frames'][2]['data']['body'][1]['data']['result'], '4')
+
+    def testStatementByLine(self):
+        cap, out = self.runScoped(PROGRAM, {"lines": [6]})
+        self.assertEqual(out, '5\n')
+        body = cap['root']['data']['body']
+        self.assertEqual([entry['type'] for entry in body], ['UNTRACED', 'PYTHON_FOR_LOOP', 'UNTRACED'])
+        self.assertEqual(len(body[1]['data']['frames']), 3)
+        # The function isn't in scope, so its calls aren't captured.
+        self.assertEqual(cap['detached'], {})
+
+    def testLineInsideFunctionTracesIt(self):
+        cap, _ = self.runScoped(PROGRAM, {"lines": [2]})
+        self.assertEqual(cap['detached'][None]['count'], 3)
+        self.assertEqual(cap['root']['data']['body'][0]['type'], 'UNTRACED')
+
+    def testUntracedStatementsKeepTheirPlace(self):
+        cap, out = self.runScoped('''
+x = 1
+print('hi')
+# comment
+y = x + 1
+''', {"lines": [4]})
+        self.assertEqual(out, 'hi\n')
+        body = cap['root']['data']['body']
+        self.assertEqual([entry['type'] for entry in body], ['UNTRACED', 'UNTRACED', 'PYTHON_ASSIGNMENT'])
+        # What the untraced print wrote isn't put on the assignment.
+        self.assertNotIn('sideEffects', body[2])
+
+    def testExceptionInUntracedStatement(self):
+        cap, _ = self.runScoped('''
+x = 1
+y = 1 / 0
+z = 2
+''', {"lines": [1]})
+        body = cap['root']['data']['body']
+        self.assertEqual([entry['type'] for entry in body], ['PYTHON_ASSIGNMENT', 'EXCEPTION'])
+        self.assertEqual(cap['lastException']['type'], 'ZeroDivisionError')
+
+    def testScopeIsPartOfTheCacheKey(self):
+        tree = splootFromPython(PROGRAM)
+        whole = executor.getCompiledCode(tree, 'COMMAND_LINE', True)
+        scoped = executor.getCompiledCode(tree, 'COMMAND_LINE', True, {"lines": [6]})
+        self.assertIsNot(whole, scoped)
+        self.assertIs(executor.getCompiledCode(tree, 'COMMAND_LINE', True, {"lines": [6]}), scoped)
+        self.assertEqual(len(executor.compiledCodeCache.entries), 2)
+
+    def testNoScopeTracesEverything(self):
+        cap, _ = self.runScoped(PROGRAM, None)
+        body = cap['root']['data']['body']
+        self.assertEqual([entry['type'] for entry in body], ['PYTHON_ASSIGNMENT', 'PYTHON_FOR_LOOP', 'PYTHON_EXPRESSION'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+import io
+import sys
+import importlib.util
+import contextlib
+import unittest
+from collections import Counter, OrderedDict, defaultdict
+from unittest import mock
+
+import value_preview
+from value_preview import previewValue
+from executor import executePythonFile, wrapStdout
+from convert_ast import splootFromPython
+
+
+class ValuePreviewTest(unittest.TestCase):
+    def testSmallValuesMatchStr(self):
+        values = [
+            1, -2.5, 3j, True, None, 'hello', b'bytes', "it's",
+            [1, 'a', (2,)], (), (1,), {'a': [1, {2}]}, {}, set(), {3}, frozenset(), frozenset([1]),
+        ]
+        for value in values:
+            self.assertEqual(previewValue(value), (str(value), None))
+
+    def testLongString(self):
+        preview, length = previewValue('x' * 5000)
+        self.assertEqual(preview, 'x' * value_preview.PREVIEW_CHAR_LIMIT + '...')
+        self.assertEqual(length, 5000)
+
+    def testElementLimit(self):
+        with mock.patch.object(value_preview, 'PREVIEW_ELEMENT_LIMIT', 3):
+            self.assertEqual(previewValue(list(range(10))), ('[0, 1, 2, ...]', 10))
+            self.assertEqual(previewValue({i: i for i in range(10)}), ('{0: 0, 1: 1, 2: 2, ...}', 10))
+
+    def testDepthLimit(self):
+        with mock.patch.object(value_preview, 'PREVIEW_DEPTH_LIMIT', 2):
+            self.assertEqual(previewValue([[[1]], 2]), ('[[...], 2]', 2))
+
+    def testRecursiveList(self):
+        a = []
+        a.append(a)
+        preview, length = previewValue(a)
+        self.assertEqual(length, 1)
+        self.assertTrue(preview.startswith('[['))
+
+    def testCharLimitInsideContainer(self):
+        with mock.patch.object(value_preview, 'PREVIEW_CHAR_LIMIT', 10):
+            self.assertEqual(previewValue(['abcdefghijkl']), ("['abcdefgh...", 1))
+
+    def testSubclassesMatchStr(self):
+        class Names(list):
+            pass
+
+        class Tags(set):
+            pass
+
+        class Labelled(dict):
+            def __repr__(self):
+                return 'Labelled'
+
+        values = [
+            Counter('abracadabra'), Counter(), defaultdict(int, {'a': 1}), defaultdict(list),
+            OrderedDict([('b', 1), ('a', [2])]), OrderedDict(), Names([1, 'a']), Tags([1]), Tags(), Labelled(a=1),
+            {'counts': Counter('aab')},
+        ]
+        for value in values:
+            self.assertEqual(previewValue(value), (str(value), None))
+
+    def testSubclassesAreBounded(self):
+        class Names(list):
+            pass
+        with mock.patch.object(value_preview, 'PREVIEW_ELEMENT_LIMIT', 3):
+            self.assertEqual(previewValue(Names('abcdef')), ("['a', 'b', 'c', ...]", 6))
+            self.assertEqual(previewValue(Counter('aaabbc' + 'xyz')), ("Counter({'a': 3, 'b': 2, 'c': 1, ...})", 6))
+            self.assertEqual(previewValue(defaultdict(int, {i: i for i in range(5)})), ("defaultdict(<class 'int'>, {0: 0, 1: 1, 2: 2, ...})", 5))
+            preview, length = previewValue(OrderedDict((i, i) for i in range(5)))
+            self.assertEqual((preview[:len('OrderedDict(')], preview[-5:], length), ('OrderedDict(', '...])' if sys.version_info < (3, 12) else '...})', 5))
+
+    def testOtherObjectsUseStr(self):
+        class Point:
+            def __str__(self):
+                return 'Point(1, 2)'
+        self.assertEqual(previewValue(Point()), ('Point(1, 2)', None))
+
+    def testCaptureRecordsLength(self):
+        splootFile = splootFromPython('x = list(range(5000))')
+        f = io.StringIO()
+        f.write = wrapStdout(f.write)
+        with contextlib.redirect_stdout(f):
+            cap, _ = executePythonFile(splootFile)
+        data = cap['root']['data']['body'][0]['data']
+        self.assertEqual(data['resultType'], 'list')
+        self.assertEqual(data['resultLength'], 5000)
+        self.assertTrue(data['result'].endswith(', ...]'))
+
+
+class FormatterRegistryTest(unittest.TestCase):
+    def tearDown(self):
+        value_preview.formatterCache.clear()
+
+    def testBigInt(self):
+        self.assertEqual(previewValue(10 ** 5000), ('<int with about 5001 digits>', None))
+        self.assertEqual(previewValue(-(10 ** 5000)), ('-<int with about 5001 digits>', None))
+        self.assertEqual(previewValue(12345), ('12345', None))
+
+    def testFormatterIsCachedPerType(self):
+        class Expensive:
+            pass
+        self.assertIs(value_preview.getFormatter(Expensive), value_preview.previewObject)
+        self.assertIs(value_preview.formatterCache[Expensive], value_preview.previewObject)
+
+    def testRegisterFormatterByName(self):
+        class Matrix:
+            def __str__(self):
+                raise AssertionError('str() should not be called')
+        key = f'{Matrix.__module__}.{Matrix.__qualname__}'
+        with mock.patch.dict(value_preview.FORMATTERS, {key: lambda value: ('Matrix 2x2', None)}):
+            value_preview.formatterCache.clear()
+            self.assertEqual(previewValue(Matrix()), ('Matrix 2x2', None))
+
+    def testFailingFormatterFallsBackToStr(self):
+        def broken(value):
+            raise ValueError()
+        with mock.patch.dict(value_preview.FORMATTERS, {float: broken}):
+            value_preview.formatterCache.clear()
+            self.assertEqual(previewValue(1.5), ('1.5', None))
+
+    @unittest.skipUnless(importlib.util.find_spec('numpy'), 'numpy is not installed')
+    def testNumpyArray(self):
+        import numpy
+        preview, length = previewValue(numpy.arange(1000000))
+        self.assertEqual(length, 1000000)
+        self.assertTrue(preview.startswith('[0, 1, 2, ..., 999997, 999998, 999999] shape=(1000000,) dtype='))
+        preview, length = previewValue(numpy.arange(6))
+        self.assertIsNone(length)
+        self.assertTrue(preview.startswith('[0, 1, 2, 3, 4, 5] shape=(6,) dtype='))
+
+    @unittest.skipUnless(importlib.util.find_spec('pandas'), 'pandas is not installed')
+    def testPandasDataFrame(self):
+        import pandas
+        frame = pandas.DataFrame({'a': range(1000000), 'b': ['x'] * 1000000})
+        preview, length = previewValue(frame)
+        self.assertEqual(length, 1000000)
+        self.assertTrue(preview.startswith('DataFrame shape=(1000000, 2) columns=[a: int64, b: object] memory='))
+        self.assertIn("head=[[0, 'x'], [1, 'x'], [2, 'x']]", preview)
+        self.assertIn("tail=[[999997, 'x'], [999998, 'x'], [999999, 'x']]", preview)
@@ -6,6 +6,9 @@ import re
 import ast
 import ast_comments
 
+from expression_builder import buildExpression
+
+
 def generateArgs(callNode):
     args = []
     keywords = []
@@ -131,145 +134,11 @@ def generateAstAssignableExpression(nodeList):
     return targets[0]
 
 
-def parseLeaf(tokens, currentIndex):
-    if currentIndex >= len(tokens):
-        print("Index out of bounds, attempting to parse leaf")
-        return currentIndex
-
-    lookahead = tokens[currentIndex]
-    if lookahead["type"] == "PYTHON_BINARY_OPERATOR":
-        op = lookahead["properties"]["operator"]
-        if op in UNARY_OPERATORS:
-            # treat RHS as it's own expression, depending on precedence.
-            lhs, index = parseLeaf(tokens, currentIndex + 1)
-            top_expr, index = parseExpression(
-                lhs, tokens, index, getUnaryPrecedence(op)
-            )
-            # Create Unary expression
-            return [ast.UnaryOp(getAstUnaryOperator(op), top_expr), index]
-    return [generateAstExpressionToken(tokens[currentIndex]), currentIndex + 1]
-
-
-UNARY_OPERATORS = {
-    "not": {"precedence": 70, "ast": ast.Not()},
-    "+": {"precedence": 150, "ast": ast.UAdd()},
-    "-": {"precedence": 150, "ast": ast.USub()},
-    "~": {"precedence": 150, "ast": ast.Invert()},  # Bitwise not
-}
-
-OPERATORS = {
-    "or": {"precedence": 50, "ast": ast.Or()},
-    "and": {"precedence": 60, "ast": ast.And()},
-    "==": {"precedence": 80, "ast": ast.Eq()},
-    "!=": {"precedence": 80, "ast": ast.NotEq()},
-    ">=": {"precedence": 80, "ast": ast.GtE()},
-    ">": {"precedence": 80, "ast": ast.Gt()},
-    "<=": {"precedence": 80, "ast": ast.LtE()},
-    "<": {"precedence": 80, "ast": ast.Lt()},
-    "is not": {"precedence": 80, "ast": ast.IsNot()},
-    "is": {"precedence": 80, "ast": ast.Is()},
-    "not in": {"precedence": 80, "ast": ast.NotIn()},
-    "in": {"precedence": 80, "ast": ast.In()},
-    "|": {"precedence": 90, "ast": ast.BitOr()},
-    "^": {"precedence": 100, "ast": ast.BitXor()},
-    "&": {"precedence": 110, "ast": ast.BitAnd()},
-    "<<": {"precedence": 120, "ast": ast.LShift()},
-    ">>": {"precedence": 120, "ast": ast.RShift()},
-    "+": {"precedence": 130, "ast": ast.Add()},
-    "-": {"precedence": 130, "ast": ast.Sub()},
-    "*": {"precedence": 140, "ast": ast.Mult()},
-    "/": {"precedence": 140, "ast": ast.Div()},
-    "//": {"precedence": 140, "ast": ast.FloorDiv()},
-    "%": {"precedence": 140, "ast": ast.Mod()},
-    "@": {"precedence": 140, "ast": ast.MatMult()},
-    "**": {"precedence": 160, "ast": ast.Pow()},
-}
-
-
-def getAstOperator(stringOp):
-    return OPERATORS[stringOp]["ast"]
-
-
-def isBoolOp(stringOp):
-    return stringOp in ["and", "or"]
-
-
-def isCompareOp(stringOp):
-    # Eq | NotEq | Lt | LtE | Gt | GtE | Is | IsNot | In | NotIn
-    return stringOp in {
-        "==",
-        "!=",
-        "<",
-        "<=",
-        ">",
-        ">=",
-        "is",
-        "is not",
-        "in",
-        "not in",
-    }
-
-
-def getAstUnaryOperator(stringOp):
-    return UNARY_OPERATORS[stringOp]["ast"]
-
-
-def getBinaryPrecedence(op):
-    return OPERATORS[op]["precedence"]
-
-
-def getUnaryPrecedence(op):
-    return UNARY_OPERATORS[op]["precedence"]
-
-
-def parseExpression(lhs, tokens, currentIndex, minPrecedence):
-    if currentIndex >= len(tokens):
-        return [lhs, currentIndex]
-
-    lookahead = tokens[currentIndex]
-    while (
-        lookahead is not None
-        and lookahead["type"] == "PYTHON_BINARY_OPERATOR"
-        and getBinaryPrecedence(lookahead["properties"]["operator"]) >= minPrecedence
-    ):
-        operator = lookahead["properties"]["operator"]
-        operatorPrecedence = getBinaryPrecedence(operator)
-        currentIndex += 1
-        rhs, currentIndex = parseLeaf(tokens, currentIndex)
-        if currentIndex < len(tokens):
-            lookahead = tokens[currentIndex]
-            while (
-                lookahead is not None
-                and lookahead["type"] == "PYTHON_BINARY_OPERATOR"
-                and getBinaryPrecedence(lookahead["properties"]["operator"]) > operatorPrecedence
-            ):
-                lookaheadOp = lookahead["properties"]["operator"]
-                [rhs, currentIndex] = parseExpression(
-                    rhs, tokens, currentIndex, getBinaryPrecedence(lookaheadOp)
-                )
-                if currentIndex < len(tokens):
-                    lookahead = tokens[currentIndex]
-                else:
-                    lookahead = None
-        else:
-            lookahead = None
-        if isBoolOp(operator):
-            lhs = ast.BoolOp(getAstOperator(operator), [lhs, rhs])
-        elif isCompareOp(operator):
-            # TODO: Support mutiple comparators, e.g. a < b < c
-            lhs = ast.Compare(lhs, [getAstOperator(operator)], [rhs])
-        else:
-            lhs = ast.BinOp(lhs, getAstOperator(operator), rhs)
-    return [lhs, currentIndex]
-
-
 def generateAstExpression(exp_node):
     tokens = exp_node["childSets"]["tokens"]
     if len(tokens) == 0:
         return None
-    lhs, index = parseLeaf(tokens, 0)
-    top_expr, _ = parseExpression(lhs, tokens, index, 0)
-    return top_expr
+    return buildExpression(tokens, generateAstExpressionToken)
 
 
 def generateAstExpressionStatement(exp_node):
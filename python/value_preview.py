@@ -0,0 +1,305 @@
+import sys
+from collections import Counter, OrderedDict, defaultdict
+from itertools import islice
+
+
+# Budgets for the text shown as the result of a traced expression.
+PREVIEW_CHAR_LIMIT = 1000
+PREVIEW_ELEMENT_LIMIT = 100
+PREVIEW_DEPTH_LIMIT = 4
+# Items shown from each end of arrays, series and frames.
+PREVIEW_EDGE_ITEMS = 3
+# Ints longer than this are summarised instead of converted to decimal.
+BIG_INT_BITS = 10000
+LOG10_2 = 0.30102999566398120
+
+ELLIPSIS = "..."
+
+SCALAR_TYPES = (int, float, complex, bool, type(None))
+SIZED_TYPES = (str, bytes, list, tuple, set, frozenset, dict)
+CONTAINER_TYPES = (list, tuple, set, frozenset, dict, Counter, OrderedDict, defaultdict)
+
+
+class PreviewWriter:
+    def __init__(self, charLimit):
+        self.parts = []
+        self.remaining = charLimit
+        # Set when anything was left out, cut when the character budget ran out.
+        self.truncated = False
+        self.cut = False
+
+    def full(self):
+        return self.remaining <= 0
+
+    def write(self, s):
+        if len(s) > self.remaining:
+            s = s[:self.remaining]
+            self.truncated = True
+            self.cut = True
+        self.parts.append(s)
+        self.remaining -= len(s)
+
+    @staticmethod
+    def bounded(s):
+        writer = PreviewWriter(PREVIEW_CHAR_LIMIT)
+        writer.write(s)
+        return writer.getvalue()
+
+    def getvalue(self):
+        if self.cut:
+            return "".join(self.parts) + ELLIPSIS
+        return "".join(self.parts)
+
+
+def writeString(writer, value, quoted):
+    # Only the part of the string that can still fit is copied or escaped.
+    part = value[:writer.remaining + 1]
+    if len(part) < len(value):
+        writer.truncated = True
+    writer.write(repr(part) if quoted else part)
+
+
+def writeItems(writer, items, length, writeItem):
+    count = 0
+    for item in islice(items, PREVIEW_ELEMENT_LIMIT):
+        if writer.full():
+            writer.truncated = True
+            writer.cut = True
+            return
+        if count:
+            writer.write(", ")
+        writeItem(item)
+        count += 1
+    if length > count:
+        writer.write(", " + ELLIPSIS)
+        writer.truncated = True
+
+
+def showsAsBase(valueType, base):
+    # Whether a subclass is shown the same way as its base class.
+    return valueType.__repr__ is base.__repr__ and valueType.__str__ is base.__str__
+
+
+containerTypes = {containerType: containerType for containerType in CONTAINER_TYPES}
+
+
+def getContainerType(valueType):
+    # The container type that valueType is previewed as, or None. Subclasses
+    # are previewed as the container they derive from, unless they change how
+    # they're shown.
+    if valueType in containerTypes:
+        return containerTypes[valueType]
+    containerType = None
+    for base in valueType.__mro__[1:]:
+        if base in CONTAINER_TYPES:
+            if showsAsBase(valueType, base):
+                containerType = base
+            break
+    containerTypes[valueType] = containerType
+    return containerType
+
+
+def writeValue(writer, value, depth):
+    valueType = type(value)
+    if valueType in SCALAR_TYPES:
+        writer.write(repr(value))
+        return
+    if valueType is str or valueType is bytes:
+        writeString(writer, value, True)
+        return
+    containerType = getContainerType(valueType)
+    if containerType is None:
+        # Objects we don't know how to bound are shown as Python would show them.
+        writer.write(repr(value))
+        return
+
+    if depth >= PREVIEW_DEPTH_LIMIT:
+        writer.write(ELLIPSIS)
+        writer.truncated = True
+        return
+
+    length = len(value)
+    if containerType is list or containerType is tuple:
+        head = value[:PREVIEW_ELEMENT_LIMIT]
+        if set(map(type, head)).issubset(SCALAR_TYPES):
+            # Lists of numbers are the common case, and repr() does those in C.
+            text = repr(head)
+            if length > len(head):
+                writer.truncated = True
+                text = f"{text[:-1]}, {ELLIPSIS}{text[-1]}"
+            writer.write(text)
+            return
+
+    writeNested = lambda item: writeValue(writer, item, depth + 1)
+
+    def writeEntry(entry):
+        writeValue(writer, entry[0], depth + 1)
+        writer.write(": ")
+        writeValue(writer, entry[1], depth + 1)
+
+    def writeDict(items):
+        writer.write("{")
+        writeItems(writer, items, length, writeEntry)
+        writer.write("}")
+
+    name = valueType.__name__
+    if containerType is list:
+        writer.write("[")
+        writeItems(writer, value, length, writeNested)
+        writer.write("]")
+    elif containerType is tuple:
+        writer.write("(")
+        writeItems(writer, value, length, writeNested)
+        writer.write(",)" if length == 1 else ")")
+    elif containerType is dict:
+        writeDict(value.items())
+    elif containerType is defaultdict:
+        writer.write(f"{name}({value.default_factory!r}, ")
+        writeDict(value.items())
+        writer.write(")")
+    elif length == 0:
+        writer.write(f"{name}()")
+    elif containerType is Counter:
+        # Counters are shown most common first, most_common() only keeps as
+        # many as are shown.
+        writer.write(f"{name}(")
+        writeDict(value.most_common(PREVIEW_ELEMENT_LIMIT))
+        writer.write(")")
+    elif containerType is OrderedDict:
+        if sys.version_info >= (3, 12):
+            writer.write(f"{name}(")
+            writeDict(value.items())
+            writer.write(")")
+        else:
+            writer.write(f"{name}([")
+            writeItems(writer, value.items(), length, writeNested)
+            writer.write("])")
+    else:
+        writer.write("{" if valueType is set else f"{name}({{")
+        writeItems(writer, value, length, writeNested)
+        writer.write("}" if valueType is set else "})")
+
+
+def previewString(value):
+    writer = PreviewWriter(PREVIEW_CHAR_LIMIT)
+    writeString(writer, value, False)
+    return writer.getvalue(), len(value) if writer.truncated else None
+
+
+def previewContainer(value):
+    writer = PreviewWriter(PREVIEW_CHAR_LIMIT)
+    writeValue(writer, value, 0)
+    return writer.getvalue(), len(value) if writer.truncated else None
+
+
+def previewObject(value):
+    writer = PreviewWriter(PREVIEW_CHAR_LIMIT)
+    writer.write(str(value))
+    return writer.getvalue(), None
+
+
+def previewInt(value):
+    if value.bit_length() > BIG_INT_BITS:
+        # Converting a huge int to decimal is quadratic in its size.
+        digits = int(value.bit_length() * LOG10_2) + 1
+        return f"{'-' if value < 0 else ''}<int with about {digits} digits>", None
+    return repr(value), None
+
+
+def formatBytes(size):
+    for unit in ["B", "KB", "MB", "GB"]:
+        if size < 1024 or unit == "GB":
+            break
+        size /= 1024
+    return f"{size:.1f}{unit}" if unit != "B" else f"{size}B"
+
+
+def previewRows(rows):
+    writer = PreviewWriter(PREVIEW_CHAR_LIMIT // 4)
+    writeValue(writer, rows, 0)
+    return writer.getvalue()
+
+
+def previewNumpyArray(value):
+    numpy = sys.modules["numpy"]
+    values = numpy.array2string(value, threshold=PREVIEW_ELEMENT_LIMIT, edgeitems=PREVIEW_EDGE_ITEMS, separator=", ")
+    writer = PreviewWriter(PREVIEW_CHAR_LIMIT)
+    writer.write(f"{values} shape={value.shape} dtype={value.dtype} memory={formatBytes(value.nbytes)}")
+    # array2string leaves out the middle of arrays bigger than the threshold.
+    truncated = writer.truncated or value.size > PREVIEW_ELEMENT_LIMIT
+    return writer.getvalue(), len(value) if value.ndim and truncated else None
+
+
+def previewPandasSeries(value):
+    length = len(value)
+    preview = f"Series name={value.name!r} length={length} dtype={value.dtype} memory={formatBytes(value.memory_usage(index=True, deep=False))}"
+    preview += f" head={previewRows(value.iloc[:PREVIEW_EDGE_ITEMS].tolist())}"
+    if length > PREVIEW_EDGE_ITEMS:
+        preview += f" tail={previewRows(value.iloc[-PREVIEW_EDGE_ITEMS:].tolist())}"
+    return PreviewWriter.bounded(preview), length
+
+
+def previewPandasDataFrame(value):
+    length = len(value)
+    columns = [f"{name}: {dtype}" for name, dtype in islice(value.dtypes.items(), PREVIEW_ELEMENT_LIMIT)]
+    preview = f"DataFrame shape={value.shape} columns=[{', '.join(columns)}] memory={formatBytes(value.memory_usage(index=True, deep=False).sum())}"
+    preview += f" head={previewRows(value.iloc[:PREVIEW_EDGE_ITEMS].values.tolist())}"
+    if length > PREVIEW_EDGE_ITEMS:
+        preview += f" tail={previewRows(value.iloc[-PREVIEW_EDGE_ITEMS:].values.tolist())}"
+    return PreviewWriter.bounded(preview), length
+
+
+# Formatters return (preview, length) where length is None unless the
+# preview left part of the value out. Keys are types, or the
+# "module.qualname" of the type for libraries we don't want to import here.
+# Subclasses use the formatter of the nearest class in their MRO that has
+# one, unless they change how they're shown.
+FORMATTERS = {
+    str: previewString,
+    int: previewInt,
+    bytes: previewContainer,
+    list: previewContainer,
+    tuple: previewContainer,
+    set: previewContainer,
+    frozenset: previewContainer,
+    dict: previewContainer,
+    Counter: previewContainer,
+    OrderedDict: previewContainer,
+    defaultdict: previewContainer,
+    "numpy.ndarray": previewNumpyArray,
+    "pandas.core.series.Series": previewPandasSeries,
+    "pandas.core.frame.DataFrame": previewPandasDataFrame,
+}
+
+formatterCache = {}
+
+
+def registerFormatter(key, formatter):
+    FORMATTERS[key] = formatter
+    formatterCache.clear()
+
+
+def findFormatter(valueType):
+    for base in valueType.__mro__:
+        formatter = FORMATTERS.get(base) or FORMATTERS.get(f"{base.__module__}.{base.__qualname__}")
+        if formatter is not None:
+            return formatter if base is valueType or showsAsBase(valueType, base) else previewObject
+    return previewObject
+
+
+def getFormatter(valueType):
+    formatter = formatterCache.get(valueType)
+    if formatter is None:
+        formatter = findFormatter(valueType)
+        formatterCache[valueType] = formatter
+    return formatter
+
+
+def previewValue(value):
+    # Returns a str() like preview of value that costs at most a few budgets
+    # worth of work, and the length of value if the preview was cut short.
+    try:
+        return getFormatter(type(value))(value)
+    except Exception:
+        # A formatter must never break the user's program, show it as Python would.
+        return previewObject(value)
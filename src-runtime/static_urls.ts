@@ -1,17 +1,29 @@
+import allocationProfilerURL from '../python/allocation_profiler.py'
+import callProfilerURL from '../python/call_profiler.py'
+import captureEncodingURL from '../python/capture_encoding.py'
 import executorURL from '../python/executor.py'
+import expressionBuilderURL from '../python/expression_builder.py'
 import moduleLoaderURL from '../python/module_loader.py'
 import pyarrowPackageURL from '../python/packages/stlite_pyarrow-0.1.0-py3-none-any.whl'
 import requestsPackageURL from '../python/packages/requests-2.28.2-py3-none-any.whl'
+import statementProfilerURL from '../python/statement_profiler.py'
 import streamlitPackageURL from '../python/packages/streamlit-1.19.0-py2.py3-none-any.whl'
 
 import textGeneratorURL from '../python/text_generator.py'
+import valuePreviewURL from '../python/value_preview.py'
 import { StaticURLs } from '@splootcode/runtime-python'
 
 export const staticPythonURLs: StaticURLs = {
+  allocationProfilerURL: allocationProfilerURL,
+  callProfilerURL: callProfilerURL,
+  captureEncodingURL: captureEncodingURL,
   executorURL: executorURL,
+  expressionBuilderURL: expressionBuilderURL,
   moduleLoaderURL: moduleLoaderURL,
+  statementProfilerURL: statementProfilerURL,
 
   textGeneratorURL: textGeneratorURL,
+  valuePreviewURL: valuePreviewURL,
   requestsPackageURL: requestsPackageURL,
   streamlitPackageURL: streamlitPackageURL,
   pyarrowPackageURL: pyarrowPackageURL,